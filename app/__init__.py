@@ -1,16 +1,27 @@
 """Flask application factory."""
 
+import json
+import logging
 import os
+import time
 
 import certifi
 from dotenv import load_dotenv
-from flask import Flask
+from flask import Flask, g, request
 
 from .extensions import login_manager, mongo
 
 load_dotenv()
 
 
+def _record_after(body, record):
+    """Yield ``body``, then call ``record`` once it is exhausted or closed."""
+    try:
+        yield from body
+    finally:
+        record()
+
+
 def create_app():
     """Create and configure the Flask app instance."""
     app = Flask(__name__)
@@ -22,22 +33,72 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = "auth.login_page"
 
+    # Parse prompts and compile schema validators once, not per request
+    from app.services.registry import registry
+    registry.init_app(app)
+
     # Allow Firebase popup auth to communicate with this origin
     @app.after_request
     def add_header(response):
         response.headers["Cross-Origin-Opener-Policy"] = "same-origin-allow-popups"
         return response
 
+    # Per-request timing spans; REQUEST_LOG=1 logs them as one JSON line
+    from app.services import metrics
+    request_log = os.getenv("REQUEST_LOG", "0") == "1"
+    if request_log:
+        app.logger.setLevel(logging.INFO)
+
+    @app.before_request
+    def start_request_trace():
+        g.request_started = time.perf_counter()
+        metrics.start_trace()
+
+    @app.after_request
+    def record_request(response):
+        started = g.get("request_started", time.perf_counter())
+        endpoint = request.endpoint or "unknown"
+        method, path = request.method, request.path
+
+        def record():
+            elapsed = time.perf_counter() - started
+            metrics.observe(
+                "http_request_duration_seconds", elapsed,
+                endpoint=endpoint, status=response.status_code,
+            )
+            spans = metrics.finish_trace()
+            if request_log and endpoint != "metrics.scrape":
+                app.logger.info(json.dumps({
+                    "method": method,
+                    "path": path,
+                    "status": response.status_code,
+                    "ms": round(elapsed * 1000, 2),
+                    "spans": spans,
+                }))
+
+        if response.is_streamed and not response.direct_passthrough:
+            # A streamed body (SSE) runs after this hook, so record once it ends.
+            # Not call_on_close: WsgiToAsgi never closes the response iterable
+            response.response = _record_after(response.response, record)
+        else:
+            record()
+        return response
+
     from app.models.user import User
 
+    # Served from the signed session or an in-process cache, not Mongo
     @login_manager.user_loader
     def load_user(user_id):
-        return User.get(user_id)
+        return User.load(user_id)
 
     # Register route blueprints
-    from app.routes import auth, main, kit
+    from app.routes import auth, main, kit, metrics as metrics_routes
     app.register_blueprint(auth.bp)
     app.register_blueprint(main.bp)
     app.register_blueprint(kit.bp)
+    app.register_blueprint(metrics_routes.bp)
+
+    from app.services.cache_warmer import warm_search_cache_command
+    app.cli.add_command(warm_search_cache_command)
 
     return app
\ No newline at end of file
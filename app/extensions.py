@@ -1,5 +1,6 @@
 """Shared extension instances (Mongo, LoginManager, Firebase)."""
 
+import functools
 import json
 import os
 
@@ -14,6 +15,24 @@ mongo = PyMongo(tlsCAFile=certifi.where())
 login_manager = LoginManager()
 login_manager.login_view = "auth.login_page"
 
+
+def once_per_db(ensure):
+    """Run ``ensure(db)`` (index creation) once per process and database.
+
+    ``ensure.done`` holds the databases already set up; clear it to run again.
+    """
+    done = set()
+
+    @functools.wraps(ensure)
+    def wrapper(db):
+        if id(db) not in done:
+            ensure(db)
+            done.add(id(db))
+
+    wrapper.done = done
+    return wrapper
+
+
 # Initialize Firebase from env var JSON or local key file
 if not firebase_admin._apps:
     cred_json = os.environ.get("FIREBASE_CREDENTIALS_JSON")
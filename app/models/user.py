@@ -1,8 +1,42 @@
 """User model backed by MongoDB and Flask-Login."""
 
+import logging
+import os
+
+from flask import session
 from flask_login import UserMixin
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+from app.extensions import mongo, once_per_db
+from app.services import metrics
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+
+# Profile fields kept in the signed session and the in-process cache
+CLAIM_FIELDS = ("uid", "email", "name", "username")
+SESSION_CLAIMS_KEY = "user_claims"
+
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+@once_per_db
+def ensure_indexes(db):
+    """One document per Firebase UID, enforced by the database."""
+    try:
+        db.users.create_index("uid", unique=True)
+    except OperationFailure as exc:
+        # Duplicates from racing logins before the upsert must be merged first
+        logger.warning("users.uid unique index unavailable: %s", exc)
+        db.users.create_index("uid")
+
 
-from app.extensions import mongo
+def _claims(user_data):
+    return {field: user_data.get(field) for field in CLAIM_FIELDS}
 
 
 class User(UserMixin):
@@ -19,22 +53,60 @@ class User(UserMixin):
         self.email = user_data.get("email")
 
     @staticmethod
-    def get(user_id):
-        """Look up a user by UID; returns None if not found."""
-        user_data = mongo.db.users.find_one({"uid": user_id})
-        return User(user_data) if user_data else None
+    def load(user_id):
+        """Flask-Login user loader that avoids Mongo on the hot path.
+
+        The signed session carries the user's claims from login. A session
+        restored from the remember cookie falls back to the in-process
+        cache, then to Mongo, and gets the claims back for later requests.
+        """
+        claims = session.get(SESSION_CLAIMS_KEY)
+        if claims and claims.get("uid") == user_id:
+            metrics.inc("user_loads_total", source="session")
+            return User(claims)
+
+        claims = user_cache.get(user_id)
+        if claims is not None:
+            metrics.inc("user_loads_total", source="memory")
+        else:
+            user_data = mongo.db.users.find_one(
+                {"uid": user_id}, {field: 1 for field in CLAIM_FIELDS}
+            )
+            metrics.inc("user_loads_total", source="mongo")
+            if not user_data:
+                return None
+            claims = _claims(user_data)
+            user_cache.set(user_id, claims)
+        session[SESSION_CLAIMS_KEY] = claims
+        return User(claims)
 
     @staticmethod
     def get_or_create(decoded_token):
-        """Find an existing user or insert a new document from a Firebase token."""
+        """Find an existing user or insert a new document from a Firebase token.
+
+        A single upsert, so concurrent first logins cannot create duplicates.
+        """
         uid = decoded_token["uid"]
-        user_data = mongo.db.users.find_one({"uid": uid})
-        if not user_data:
-            user_data = {
-                "uid": uid,
+        ensure_indexes(mongo.db)
+        user_data = mongo.db.users.find_one_and_update(
+            {"uid": uid},
+            {"$setOnInsert": {
                 "email": decoded_token.get("email"),
                 "name": decoded_token.get("name", "Lab Lead"),
                 "username": decoded_token.get("email", "user").split("@")[0],
-            }
-            mongo.db.users.insert_one(user_data)
-        return user_data
\ No newline at end of file
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        user_cache.set(uid, _claims(user_data))
+        return user_data
+
+    @staticmethod
+    def remember_session(user_data):
+        """Put the user's claims in the signed session after login."""
+        session[SESSION_CLAIMS_KEY] = _claims(user_data)
+
+    @staticmethod
+    def forget_session(user_id):
+        session.pop(SESSION_CLAIMS_KEY, None)
+        user_cache.pop(user_id)
\ No newline at end of file
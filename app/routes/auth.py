@@ -1,7 +1,7 @@
 """Authentication routes (login, signup, session management)."""
 
 from flask import Blueprint, jsonify, redirect, render_template, request, session, url_for
-from flask_login import login_required, login_user, logout_user
+from flask_login import current_user, login_required, login_user, logout_user
 from firebase_admin import auth as firebase_auth
 
 from app.models.user import User
@@ -33,6 +33,7 @@ def session_login():
         user_data = User.get_or_create(decoded_token)
         user = User(user_data)
         login_user(user, remember=True)
+        User.remember_session(user_data)
         session["is_secure_lab"] = True
 
         return jsonify({"status": "success", "user": user.username})
@@ -44,6 +45,7 @@ def session_login():
 @bp.route("/logout")
 @login_required
 def logout():
+    User.forget_session(current_user.id)
     logout_user()
     return redirect(url_for("auth.login_page"))
     session.clear()
@@ -1,16 +1,38 @@
 """Kit generation and history API endpoints."""
 
 import datetime
+import json
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 from flask_login import current_user, login_required
 
 from app.extensions import mongo
-from app.services.orchestrator import run_lab_pipeline
+from app.services import kit_store, metrics
+from app.services.job_queue import QueueFull, job_queue
+from app.services.orchestrator import (
+    iter_lab_pipeline,
+    refresh_products,
+    run_lab_pipeline,
+)
 
 bp = Blueprint("kit", __name__, url_prefix="/api/kit")
 
 
+def _save_kit(user_id, final_output, user_input=None):
+    """Persist a finished kit to the user's history and tag it with its id."""
+    if final_output.get("type") == "final_kit":
+        with metrics.span("mongo.kits.insert_one"):
+            kit_id = kit_store.save_kit(
+                mongo.db, user_id, final_output, user_input=user_input
+            )
+        final_output["kit_id"] = kit_id
+
+
+def _sse(event, data):
+    """Format one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 @bp.route("/generate", methods=["POST"])
 @login_required
 def handle_request():
@@ -21,31 +43,178 @@ def handle_request():
     if not user_input:
         return jsonify({"error": "No input provided"}), 400
 
-    final_output = run_lab_pipeline(user_input)
-
-    # Persist the kit to the user's history
-    if final_output.get("type") == "final_kit":
-        mongo.db.kits.insert_one({
-            "user_id": current_user.id,
-            "kit_name": final_output.get("kit_title", "Custom Kit"),
-            "created_at": datetime.datetime.utcnow(),
-        })
+    final_output = run_lab_pipeline(user_input, data.get("history"))
+    _save_kit(current_user.id, final_output, user_input)
 
     return jsonify(final_output)
 
 
+@bp.route("/generate/stream", methods=["POST"])
+@login_required
+def stream_request():
+    """Stream pipeline progress as Server-Sent Events.
+
+    The kit outline is sent as soon as the LLM returns it; each item's
+    product fields follow as its search resolves.
+    """
+    data = request.get_json(silent=True) or {}
+    user_input = data.get("style")
+
+    if not user_input:
+        return jsonify({"error": "No input provided"}), 400
+
+    user_id = current_user.id
+    history = data.get("history")
+
+    def events():
+        try:
+            for event in iter_lab_pipeline(user_input, history):
+                if event["type"] == "final_kit":
+                    _save_kit(user_id, event["data"], user_input)
+                yield _sse(event["type"], event["data"])
+        except Exception as exc:
+            yield _sse("error", {"error": str(exc)})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _run_and_save(user_id, user_input, history=None):
+    """Job body: run the pipeline and record the kit in the user's history."""
+    final_output = run_lab_pipeline(user_input, history)
+    _save_kit(user_id, final_output, user_input)
+    return final_output
+
+
+def _job_status(job):
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+    }
+
+
+@bp.route("/jobs", methods=["POST"])
+@login_required
+def submit_job():
+    """Queue a kit build and return its job id immediately."""
+    data = request.get_json(silent=True) or {}
+    user_input = data.get("style")
+
+    if not user_input:
+        return jsonify({"error": "No input provided"}), 400
+
+    try:
+        with metrics.span("mongo.kit_jobs.submit"):
+            job, _created = job_queue.submit(
+                mongo.db, current_user.id, user_input,
+                _run_and_save, current_user.id, user_input, data.get("history"),
+            )
+    except QueueFull as exc:
+        return jsonify({"error": str(exc)}), 429
+
+    return jsonify(_job_status(job)), 202
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+@login_required
+def job_status(job_id):
+    """Report whether a queued kit build is still running."""
+    with metrics.span("mongo.kit_jobs.find_one"):
+        job = job_queue.get(mongo.db, job_id, current_user.id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(_job_status(job))
+
+
+@bp.route("/jobs/<job_id>/result", methods=["GET"])
+@login_required
+def job_result(job_id):
+    """Return the finished kit, or the job status while it is in flight."""
+    with metrics.span("mongo.kit_jobs.find_one"):
+        job = job_queue.get(mongo.db, job_id, current_user.id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job["status"] == "done":
+        return jsonify(job["result"])
+    if job["status"] == "failed":
+        return jsonify(_job_status(job)), 500
+    return jsonify(_job_status(job)), 202
+
+
 @bp.route("/history", methods=["GET"])
 @login_required
 def get_history():
-    """Return the current user's saved kits, newest first."""
-    user_kits = mongo.db.kits.find(
-        {"user_id": current_user.id}
-    ).sort("created_at", -1)
+    """Return one page of the current user's saved kits, newest first.
+
+    Pass ``?limit=`` to size the page; when more kits remain, the
+    ``X-Next-Cursor`` header holds the ``?cursor=`` for the next page.
+    """
+    limit = request.args.get("limit", kit_store.HISTORY_PAGE_SIZE, type=int)
+    cursor = request.args.get("cursor")
+    with metrics.span("mongo.kits.find"):
+        user_kits, next_cursor = kit_store.list_history(
+            mongo.db, current_user.id, limit=limit, cursor=cursor
+        )
 
-    return jsonify([
+    response = jsonify([
         {
+            "id": str(kit["_id"]),
             "kit_name": kit.get("kit_name", "New Config"),
             "created_at": kit.get("created_at"),
+            "item_count": kit.get("item_count"),
         }
         for kit in user_kits
-    ])
\ No newline at end of file
+    ])
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@bp.route("/<kit_id>", methods=["GET"])
+@login_required
+def get_kit(kit_id):
+    """Return a saved kit with its resolved products."""
+    with metrics.span("mongo.kits.find_one"):
+        doc = kit_store.get_kit(mongo.db, current_user.id, kit_id)
+    # Kits saved before full storage only have a name
+    if doc is None or not doc.get("kit"):
+        return jsonify({"error": "Kit not found"}), 404
+
+    kit = doc["kit"]
+    kit["kit_id"] = str(doc["_id"])
+    kit["created_at"] = doc.get("created_at")
+    kit["prices_refreshed_at"] = doc.get("prices_refreshed_at")
+    return jsonify(kit)
+
+
+@bp.route("/<kit_id>/refresh", methods=["POST"])
+@login_required
+def refresh_kit(kit_id):
+    """Re-search a saved kit's products for current prices, skipping the LLM."""
+    with metrics.span("mongo.kits.find_one"):
+        doc = kit_store.get_kit(mongo.db, current_user.id, kit_id)
+    if doc is None or not doc.get("kit"):
+        return jsonify({"error": "Kit not found"}), 404
+
+    kit, refreshed = refresh_products(doc["kit"])
+    if not refreshed:
+        # Nothing came back (e.g. Serper is down): keep the stored kit as it is
+        return jsonify({"error": "Could not refresh prices, please try again later"}), 503
+
+    refreshed_at = datetime.datetime.utcnow()
+    with metrics.span("mongo.kits.update_one"):
+        kit_store.update_kit(
+            mongo.db, current_user.id, kit_id, kit,
+            prices_refreshed_at=refreshed_at,
+        )
+
+    kit["kit_id"] = kit_id
+    kit["created_at"] = doc.get("created_at")
+    kit["prices_refreshed_at"] = refreshed_at
+    return jsonify(kit)
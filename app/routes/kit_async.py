@@ -0,0 +1,114 @@
+"""Async ``POST /api/kit/generate``, served by the ASGI entry point (asgi.py).
+
+A raw ASGI handler rather than a Flask view: the asyncio pipeline runs on
+the worker's event loop, so a kit waiting on Groq, Serper or Mongo holds
+no thread. The request body and the responses match the Flask route of
+the same path, except that a missing login is a 401 instead of a redirect.
+"""
+
+import json
+import logging
+import time
+
+from flask_login.utils import decode_cookie
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+from app.services import metrics
+from app.services.async_pipeline import (
+    get_async_db,
+    run_lab_pipeline_async,
+    save_kit_async,
+)
+
+logger = logging.getLogger(__name__)
+
+PATH = "/api/kit/generate"
+
+
+def handles(scope):
+    return scope["type"] == "http" and scope["method"] == "POST" and scope["path"] == PATH
+
+
+def current_user_id(flask_app, headers):
+    """The logged-in user's id from the Flask session or remember cookie."""
+    cookies = parse_cookie(headers.get(b"cookie", b"").decode("latin-1"))
+
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    raw = cookies.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if serializer is not None and raw:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        try:
+            user_id = serializer.loads(raw, max_age=max_age).get("_user_id")
+        except BadSignature:
+            user_id = None
+        if user_id:
+            return user_id
+
+    remember = cookies.get(flask_app.config.get("REMEMBER_COOKIE_NAME", "remember_token"))
+    if remember:
+        # decode_cookie signs with the app's SECRET_KEY
+        with flask_app.app_context():
+            return decode_cookie(remember)
+    return None
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def generate(flask_app, scope, receive, send):
+    """Run the async pipeline for the user's query and save the kit."""
+    started = time.perf_counter()
+    metrics.start_trace()
+    status, payload = await _generate(flask_app, scope, receive)
+    await _send_json(send, status, payload)
+    metrics.observe(
+        "http_request_duration_seconds", time.perf_counter() - started,
+        endpoint="kit.handle_request_async", status=status,
+    )
+    metrics.finish_trace()
+
+
+async def _generate(flask_app, scope, receive):
+    headers = dict(scope.get("headers", []))
+    body = await _read_body(receive)
+
+    user_id = current_user_id(flask_app, headers)
+    if user_id is None:
+        return 401, {"error": "Login required"}
+
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        data = {}
+    user_input = data.get("style") if isinstance(data, dict) else None
+    if not user_input:
+        return 400, {"error": "No input provided"}
+
+    try:
+        db = get_async_db()
+        final_output = await run_lab_pipeline_async(user_input, data.get("history"), db=db)
+        await save_kit_async(db, user_id, final_output, user_input)
+    except Exception as exc:
+        logger.exception("Async kit pipeline failed")
+        return 500, {"error": str(exc)}
+    return 200, final_output
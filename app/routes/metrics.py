@@ -0,0 +1,66 @@
+"""Prometheus-style /metrics endpoint."""
+
+import os
+
+from flask import Blueprint, Response, abort, request
+
+from app.models.user import user_cache
+from app.services import resilience
+from app.services.http_clients import pool_stats
+from app.services.llm_service import response_cache
+from app.services.metrics import metrics
+from app.services.search_service import memory_cache
+
+bp = Blueprint("metrics", __name__)
+
+
+CACHES = (
+    ("search_memory", memory_cache),
+    ("llm_memory", response_cache),
+    ("user_memory", user_cache),
+)
+
+
+def _cache_sizes():
+    return [("cache_size", {"cache": name}, cache.stats()["size"]) for name, cache in CACHES]
+
+
+def _cache_counts():
+    samples = []
+    for name, cache in CACHES:
+        stats = cache.stats()
+        for field in ("hits", "misses", "evictions"):
+            samples.append((f"cache_{field}_total", {"cache": name}, stats[field]))
+    return samples
+
+
+def _pool_samples():
+    samples = []
+    for upstream, stats in pool_stats().items():
+        for field in ("requests", "connections", "reused"):
+            samples.append((f"http_pool_{field}_total", {"upstream": upstream}, stats[field]))
+    return samples
+
+
+def _upstream_samples():
+    samples = []
+    for upstream, stats in resilience.stats().items():
+        labels = {"upstream": upstream}
+        samples.append(("upstream_timeout_seconds", labels, stats["timeout"]))
+        samples.append(("circuit_open", labels, int(stats["state"] != resilience.CLOSED)))
+    return samples
+
+
+metrics.add_collector(_cache_sizes)
+metrics.add_collector(_cache_counts, kind="counter")
+metrics.add_collector(_pool_samples, kind="counter")
+metrics.add_collector(_upstream_samples)
+
+
+@bp.route("/metrics")
+def scrape():
+    """Expose counters and histograms; set METRICS_TOKEN to require a bearer token."""
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        abort(401)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,608 @@
+"""Asyncio version of the kit pipeline, for the ASGI worker.
+
+Same stages, prompts, caches and Mongo collections as ``orchestrator``,
+but every Groq, Serper and Mongo call is awaited instead of holding a
+thread, so one process can keep hundreds of kits in flight. Indexes are
+created by the sync code at startup (see ``asgi.py``), never per call.
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import os
+
+import certifi
+from pymongo import AsyncMongoClient
+from pymongo.errors import PyMongoError
+
+from app.services import kit_store, metrics, resilience, token_budget
+from app.services.catalog_service import (
+    CATALOG_ENABLED,
+    CATALOG_FALLBACK_CONFIDENCE,
+    CATALOG_MIN_CONFIDENCE,
+    ProductCatalog,
+)
+from app.services.fingerprint_service import FINGERPRINT_ENABLED, FingerprintIndex
+from app.services.http_clients import (
+    get_async_groq_client,
+    get_async_serper_client,
+    httpx_timeout,
+)
+from app.services.kit_service import item_schema, kit_prompts
+from app.services.llm_service import (
+    LLM_CACHE_DISABLED,
+    RETRYABLE_ERRORS,
+    SchemaRepair,
+    StreamedCompletion,
+    cache_update,
+    chat_request,
+    completion_text,
+    config,
+    ensure_llm_cache_indexes,
+    groq_api_key,
+    memory_response,
+    prompt_text,
+    response_cache,
+    response_cache_key,
+    retry_prompt,
+    should_retry,
+    stored_response,
+    stream_failed,
+    trim_due,
+    trim_excess,
+)
+from app.services.orchestrator import (
+    KIT_STREAMING,
+    PIPELINE_SPECULATION,
+    ProductMatches,
+    SearchBatches,
+    apply_product,
+    format_history,
+    gate_decided,
+    kit_items,
+)
+from app.services.planner_service import gate_prompts
+from app.services.registry import registry
+from app.services.search_service import (
+    CACHE_DOC_FIELDS,
+    SERPER_SHOPPING_URL,
+    batch_results,
+    cache_write_ops,
+    check_serper_response,
+    claim_revalidation,
+    ensure_cache_indexes,
+    parse_shopping_batch,
+    query_keys,
+    read_cache_docs,
+    read_memory_cache,
+    release_revalidation,
+    report_results,
+    results_for,
+    serper_batches,
+    serper_budget,
+    serper_headers,
+    serper_payload,
+)
+from app.services.singleflight import AsyncSingleFlight
+from app.services.stream_parser import KitItemParser
+
+logger = logging.getLogger(__name__)
+
+llm_flight = AsyncSingleFlight("groq")
+search_flight = AsyncSingleFlight("serper")
+
+_mongo_client = None
+_mongo_pid = None
+
+# Background refreshes of stale search entries; holding the tasks here
+# keeps them from being garbage collected mid-flight
+_revalidations = set()
+
+
+def get_async_db():
+    """The default database of a process-wide AsyncMongoClient."""
+    global _mongo_client, _mongo_pid
+    if _mongo_client is None or _mongo_pid != os.getpid():
+        _mongo_client = AsyncMongoClient(
+            os.getenv("MONGO_URI"), tlsCAFile=certifi.where()
+        )
+        _mongo_pid = os.getpid()
+    return _mongo_client.get_default_database()
+
+
+def ensure_indexes(db):
+    """Create the indexes the async pipeline relies on, with the sync client."""
+    kit_store.ensure_indexes(db)
+    ensure_cache_indexes(db)
+    ensure_llm_cache_indexes(db)
+    ProductCatalog(db)
+    FingerprintIndex(db)
+
+
+async def close_async_db():
+    global _mongo_client
+    if _mongo_client is not None:
+        await _mongo_client.close()
+        _mongo_client = None
+
+
+# -- LLM --
+
+
+class AsyncLLMProvider:
+    """``LocalLLMProvider`` on AsyncGroq, sharing its response cache."""
+
+    def __init__(self, db=None, temperature=0.2, use_cache=True, stage=None):
+        self.db = db
+        self.temperature = temperature
+        self.stage = stage
+        self.use_cache = use_cache and not LLM_CACHE_DISABLED
+        self.model_id = config.get("GroqModelName", "llama-3.3-70b-versatile")
+
+    async def generate_response(self, system_prompt, user_prompt, schema,
+                                max_retries=2, use_cache=None):
+        """Validated JSON for the prompts, from cache or one shared completion."""
+        system_prompt, user_prompt = prompt_text(system_prompt), prompt_text(user_prompt)
+        read_cache = self.use_cache if use_cache is None else use_cache
+        cache_key = response_cache_key(
+            self.model_id, system_prompt, user_prompt, schema, self.temperature
+        )
+        if read_cache:
+            cached = await self._get_cached(cache_key)
+            if cached is not None:
+                return cached
+
+        validator = registry.validator_for(schema) if schema is not None else None
+
+        async def complete():
+            parsed = await self._complete(
+                system_prompt, user_prompt, validator, max_retries
+            )
+            if self.use_cache:
+                await self._save_cached(cache_key, parsed)
+            return parsed
+
+        result = await llm_flight.do(cache_key, complete)
+        return copy.deepcopy(result)
+
+    async def stream_response(self, system_prompt, user_prompt, schema, parser,
+                              max_retries=2):
+        """Async counterpart of ``LocalLLMProvider.stream_response``."""
+        system_prompt, user_prompt = prompt_text(system_prompt), prompt_text(user_prompt)
+        cache_key = response_cache_key(
+            self.model_id, system_prompt, user_prompt, schema, self.temperature
+        )
+        if self.use_cache:
+            cached = await self._get_cached(cache_key)
+            if cached is not None:
+                yield ("done", cached)
+                return
+
+        async with llm_flight.hold(cache_key) as call:
+            if call.result is None:
+                try:
+                    with metrics.span("llm_stream"):
+                        async for chunk in self._stream_groq(system_prompt, user_prompt):
+                            for event in parser.feed(chunk):
+                                yield event
+                    call.result = await self._repair(
+                        json.loads(parser.document()),
+                        registry.validator_for(schema),
+                        max_retries,
+                    )
+                    if self.use_cache:
+                        await self._save_cached(cache_key, call.result)
+                except Exception as exc:
+                    stream_failed(exc)
+
+        if call.result is None:
+            yield ("done", await self.generate_response(
+                system_prompt, user_prompt, schema,
+                max_retries=max_retries, use_cache=False,
+            ))
+            return
+        yield ("done", copy.deepcopy(call.result))
+
+    async def _complete(self, system_prompt, user_prompt, validator, max_retries):
+        for attempt in range(max_retries + 1):
+            try:
+                with metrics.span("llm_call"):
+                    content = await self._call_groq(system_prompt, user_prompt)
+                parsed = json.loads(content)
+                if validator is None:
+                    return parsed
+                return await self._repair(parsed, validator, max_retries)
+            except RETRYABLE_ERRORS as exc:
+                if not should_retry(exc, attempt, max_retries):
+                    raise
+                system_prompt = retry_prompt(system_prompt, exc)
+
+    async def _repair(self, parsed, validator, rounds):
+        repair = SchemaRepair(parsed, validator, rounds)
+        for system_prompt, user_prompt in repair.requests():
+            with metrics.span("llm_repair"):
+                repair.apply(await self._call_groq(system_prompt, user_prompt))
+        return repair.result()
+
+    async def _get_cached(self, key):
+        cached = memory_response(key)
+        if cached is None and self.db is not None:
+            try:
+                doc = await self.db.llm_cache.find_one({"_id": key}, {"response": 1})
+            except PyMongoError as exc:
+                logger.warning("LLM cache read failed: %s", exc)
+                doc = None
+            cached = stored_response(key, doc)
+        return cached
+
+    async def _save_cached(self, key, response):
+        response_cache.set(key, copy.deepcopy(response))
+        if self.db is None:
+            return
+        try:
+            await self.db.llm_cache.update_one(
+                {"_id": key}, cache_update(self.model_id, response), upsert=True
+            )
+            if trim_due():
+                await self._trim_cache()
+        except PyMongoError as exc:
+            logger.warning("LLM cache write failed: %s", exc)
+
+    async def _trim_cache(self):
+        excess = trim_excess(await self.db.llm_cache.estimated_document_count())
+        if excess <= 0:
+            return
+        oldest = await self.db.llm_cache.find({}, {"_id": 1}).sort(
+            "created_at", 1
+        ).limit(excess).to_list()
+        await self.db.llm_cache.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+
+    async def _call_groq(self, system_prompt, user_prompt):
+        client = get_async_groq_client(groq_api_key())
+        with resilience.groq.attempt() as timeout:
+            response = await client.chat.completions.create(**chat_request(
+                self.model_id, self.temperature, system_prompt, user_prompt, timeout
+            ))
+        return completion_text(self.stage, response, (system_prompt, user_prompt))
+
+    async def _stream_groq(self, system_prompt, user_prompt):
+        client = get_async_groq_client(groq_api_key())
+        with resilience.groq.attempt(record_latency=False) as timeout:
+            stream = await client.chat.completions.create(**chat_request(
+                self.model_id, self.temperature, system_prompt, user_prompt,
+                timeout, stream=True,
+            ))
+            completion = StreamedCompletion()
+            async for chunk in stream:
+                text = completion.feed(chunk)
+                if text:
+                    yield text
+        completion.record(self.stage, (system_prompt, user_prompt))
+
+
+# -- Search --
+
+
+class AsyncSearchService:
+    """``SearchService.search_many`` plus the catalog and fingerprint lookups."""
+
+    source = "google_shopping"
+
+    def __init__(self, db=None, refresh=False):
+        self.db = db
+        self.refresh = refresh
+        self.use_catalog = db is not None and CATALOG_ENABLED
+        self.use_fingerprints = db is not None and FINGERPRINT_ENABLED
+
+    async def search_many(self, queries, on_result=None):
+        """One deduplicated result list per query; see ``SearchService.search_many``."""
+        with metrics.span("search_many"):
+            keys, texts = query_keys(queries)
+
+            # While Serper is failing, even a refresh serves what is cached
+            use_cache = not self.refresh or resilience.serper.is_open()
+            found = await self._get_many_from_cache(list(texts)) if use_cache else {}
+            report_results(keys, found, on_result)
+
+            missing = {key: text for key, text in texts.items() if key not in found}
+            if missing:
+                # Concurrent kits asking for the same keys share one fetch
+                found.update(await search_flight.do_many(
+                    list(missing),
+                    lambda batch: self.fetch_and_store({key: missing[key] for key in batch}),
+                ))
+                report_results(keys, {key: found.get(key, []) for key in missing}, on_result)
+            return results_for(keys, found)
+
+    async def _get_many_from_cache(self, keys):
+        found = read_memory_cache(keys, self.source)
+        misses = [key for key in keys if key not in found]
+        if not misses or self.db is None:
+            return found
+        try:
+            with metrics.span("mongo.search_cache.find"):
+                docs = await self.db.search_cache.find(
+                    {"query": {"$in": misses}, "source": self.source}, CACHE_DOC_FIELDS
+                ).to_list()
+        except PyMongoError as exc:
+            logger.warning("search_cache read failed: %s", exc)
+            return found
+        stored, stale = read_cache_docs(misses, self.source, docs)
+        found.update(stored)
+        if stale:
+            self._revalidate(stale)
+        return found
+
+    async def fetch_and_store(self, texts):
+        """Fetch ``{cache key: query text}`` from Serper and cache the results."""
+        batches = serper_batches(list(texts))
+        responses = await asyncio.gather(*(
+            self._fetch_batch([texts[key] for key in batch]) for batch in batches
+        ))
+        fetched = batch_results(texts, batches, responses)
+
+        ops = cache_write_ops(fetched, self.source)
+        if self.db is not None and ops:
+            try:
+                with metrics.span("mongo.search_cache.bulk_write"):
+                    await self.db.search_cache.bulk_write(ops, ordered=False)
+            except PyMongoError as exc:
+                logger.warning("search_cache bulk write failed: %s", exc)
+        if self.use_catalog and fetched:
+            await self._ingest([
+                result for results, _ in fetched.values() for result in results
+            ])
+        return {key: results for key, (results, _) in fetched.items()}
+
+    async def _fetch_batch(self, queries):
+        if resilience.serper.is_open():
+            return {}
+        waited = await serper_budget.acquire_async()
+        if waited:
+            metrics.inc("rate_limit_sleep_seconds_total", waited, upstream="serper")
+        try:
+            # Adaptive timeout and breaker as on the sync side; no hedging here
+            with metrics.span("serper_batch"), resilience.serper.attempt() as timeout:
+                try:
+                    response = await get_async_serper_client().post(
+                        SERPER_SHOPPING_URL,
+                        headers=serper_headers(),
+                        content=serper_payload(queries),
+                        timeout=httpx_timeout(timeout),
+                    )
+                except Exception:
+                    metrics.inc("serper_responses_total", status="error")
+                    raise
+                check_serper_response(response)
+            return parse_shopping_batch(queries, response.json())
+        except resilience.CircuitOpen:
+            pass
+        except Exception as exc:
+            logger.warning("Serper batch request failed: %s", exc)
+        return {}
+
+    def _revalidate(self, texts):
+        texts = claim_revalidation(texts)
+        if texts:
+            task = asyncio.create_task(self._run_revalidation(texts))
+            _revalidations.add(task)
+            task.add_done_callback(_revalidations.discard)
+
+    async def _run_revalidation(self, texts):
+        try:
+            await self.fetch_and_store(texts)
+        except Exception as exc:
+            logger.warning("Search cache refresh failed: %s", exc)
+        finally:
+            release_revalidation(texts)
+
+    # -- Local product sources --
+
+    async def _ingest(self, results):
+        ops = ProductCatalog.ingest_ops(results)
+        if not ops:
+            return
+        try:
+            await self.db.product_catalog.bulk_write(ops, ordered=False)
+        except PyMongoError as exc:
+            logger.warning("Catalog ingest failed: %s", exc)
+
+    async def catalog_lookup(self, item, min_confidence=CATALOG_MIN_CONFIDENCE):
+        """Best catalog product for ``item`` (None below ``min_confidence``)."""
+        pipeline = ProductCatalog.candidates_pipeline(item)
+        if pipeline is None:
+            return None
+        try:
+            with metrics.span("catalog_lookup"):
+                cursor = await self.db.product_catalog.aggregate(pipeline)
+                candidates = await cursor.to_list()
+        except PyMongoError as exc:
+            logger.warning("Catalog lookup failed: %s", exc)
+            return None
+        return ProductCatalog.pick(item, candidates, min_confidence)
+
+    async def catalog_lookup_many(self, items, min_confidence=CATALOG_MIN_CONFIDENCE):
+        return await asyncio.gather(
+            *(self.catalog_lookup(item, min_confidence) for item in items)
+        )
+
+    async def fingerprint_lookup(self, key_lists):
+        wanted = sorted({key for keys in key_lists for key in keys})
+        if not wanted:
+            return [None] * len(key_lists)
+        try:
+            with metrics.span("fingerprint_lookup"):
+                docs = await self.db.product_fingerprints.find(
+                    {"_id": {"$in": wanted}}, {"product": 1}
+                ).to_list()
+        except PyMongoError as exc:
+            logger.warning("Fingerprint lookup failed: %s", exc)
+            return [None] * len(key_lists)
+        return FingerprintIndex.match(key_lists, docs)
+
+    async def fingerprint_record(self, confirmed):
+        ops = FingerprintIndex.record_ops(confirmed)
+        if not ops:
+            return
+        try:
+            await self.db.product_fingerprints.bulk_write(ops, ordered=False)
+        except PyMongoError as exc:
+            logger.warning("Fingerprint write failed: %s", exc)
+
+
+async def find_best_products(searcher, items, on_resolved=None):
+    """Async counterpart of ``orchestrator._find_best_products``."""
+    matches = ProductMatches(items, on_resolved)
+    use_local = not searcher.refresh
+
+    if searcher.use_fingerprints and use_local and any(matches.keys):
+        exact = await searcher.fingerprint_lookup(matches.keys)
+        matches.take(range(len(items)), exact, "fingerprint_answers_total")
+
+    pending = matches.pending()
+    if searcher.use_catalog and use_local and pending:
+        local = await searcher.catalog_lookup_many(matches.items_at(pending))
+        matches.take(pending, local, "catalog_answers_total")
+
+    if not matches.pending():
+        return matches.best
+
+    queries = matches.search_queries(hold_unmatched=searcher.use_catalog)
+    await searcher.search_many(queries, on_result=matches.ranked)
+    if searcher.use_fingerprints and matches.confirmed:
+        await searcher.fingerprint_record(matches.confirmed)
+
+    fallback = None
+    if matches.unmatched and resilience.serper.is_open():
+        fallback = await searcher.catalog_lookup_many(
+            matches.items_at(matches.unmatched), CATALOG_FALLBACK_CONFIDENCE
+        )
+    matches.settle_unmatched(fallback)
+    return matches.best
+
+
+class AsyncProductSearches(SearchBatches):
+    """``SearchBatches`` on the event loop: batches run as tasks."""
+
+    def __init__(self, searcher):
+        super().__init__(searcher)
+        self._tasks = set()
+
+    def _future(self):
+        return asyncio.get_running_loop().create_future()
+
+    def _start(self, batch):
+        task = asyncio.create_task(self._run_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        try:
+            await find_best_products(
+                self.searcher, [item for item, _ in batch], self._resolver(batch)
+            )
+        except Exception as exc:
+            self._fail(batch, exc)
+
+    def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+
+
+# -- Pipeline --
+
+
+async def _gate(llm, user_input, history_str):
+    system_prompt, user_prompt = gate_prompts(user_input, conversation_history=history_str)
+    with metrics.span("gate_clarification"):
+        return await llm.generate_response(
+            system_prompt, user_prompt, registry.schema("clarify_gate")
+        )
+
+
+async def _build_kit(llm, searches, task, history_str):
+    """Generate the kit, starting searches for items as they stream in."""
+    system_prompt, user_prompt = kit_prompts(task, history_str, None)
+    kit_schema = registry.schema("kit")
+    with metrics.span("generate_kit"):
+        if not KIT_STREAMING:
+            return await llm.generate_response(system_prompt, user_prompt, kit_schema)
+        parser = KitItemParser(registry.validator_for(item_schema(kit_schema)))
+        kit_json = None
+        async for event in llm.stream_response(
+            system_prompt, user_prompt, kit_schema, parser
+        ):
+            if event[0] == "item":
+                searches.submit(event[3], prefetch=True)
+            elif event[0] == "done":
+                kit_json = event[1]
+        return kit_json
+
+
+async def run_lab_pipeline_async(user_input, history_list=None, db=None):
+    """Async ``run_lab_pipeline``: returns the final kit or the questions."""
+    db = db if db is not None else get_async_db()
+    usage = token_budget.start_usage()
+    gate_llm = AsyncLLMProvider(db, stage="gate")
+    llm = AsyncLLMProvider(db, stage="kit")
+    searcher = AsyncSearchService(db)
+    searches = AsyncProductSearches(searcher)
+    history_str = format_history(history_list)
+
+    try:
+        if gate_decided(user_input, history_list):
+            metrics.inc("gate_decisions_total", path="skipped")
+            kit_json = await _build_kit(llm, searches, user_input, history_str)
+        else:
+            speculative = None
+            if PIPELINE_SPECULATION:
+                metrics.inc("gate_decisions_total", path="speculative")
+                speculative = asyncio.create_task(
+                    _build_kit(llm, searches, user_input, history_str)
+                )
+            else:
+                metrics.inc("gate_decisions_total", path="sequential")
+            try:
+                gate = await _gate(gate_llm, user_input, history_str)
+            except BaseException:
+                if speculative is not None:
+                    speculative.cancel()
+                raise
+
+            if gate.get("need_clarification"):
+                if speculative is not None:
+                    speculative.cancel()
+                    metrics.inc("speculation_total", outcome="discarded")
+                return {"type": "questions", "data": gate["questions"]}
+
+            if speculative is not None:
+                metrics.inc("speculation_total", outcome="hit")
+                kit_json = await speculative
+            else:
+                task = gate.get("task_interpretation", user_input)
+                kit_json = await _build_kit(llm, searches, task, history_str)
+
+        searches.settle_prefetched(kit_json)
+        entries = kit_items(kit_json)
+        futures = [searches.submit(item) for _, _, item in entries]
+        searches.flush()
+        for (_, _, item), best in zip(entries, await asyncio.gather(*futures)):
+            apply_product(item, best)
+    finally:
+        searches.close()
+
+    kit_json["type"] = "final_kit"
+    kit_json["token_usage"] = usage
+    return kit_json
+
+
+async def save_kit_async(db, user_id, final_output, user_input=None):
+    """Store a finished kit like ``kit_store.save_kit`` and tag it with its id."""
+    if final_output.get("type") != "final_kit":
+        return
+    with metrics.span("mongo.kits.insert_one"):
+        result = await db.kits.insert_one(
+            kit_store.kit_document(user_id, final_output, user_input)
+        )
+    final_output["kit_id"] = str(result.inserted_id)
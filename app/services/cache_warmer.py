@@ -0,0 +1,107 @@
+"""Offline warm-up of the search cache from popular kit queries.
+
+Run as ``flask warm-search-cache`` (e.g. from cron). Queries asked for in
+recent kits come first, most frequent first; entries already in
+``search_cache`` that are about to go stale follow, oldest first. Only
+queries that are missing or due within ``horizon`` seconds are fetched,
+and never more than ``budget`` of them.
+"""
+
+import datetime
+from collections import Counter
+
+import click
+from flask.cli import with_appcontext
+
+from app.extensions import mongo
+from app.services.query_service import build_query_for_item, canonical_query_key
+from app.services.search_service import (
+    SEARCH_CACHE_SOFT_TTL,
+    SERPER_BATCH_SIZE,
+    SearchService,
+)
+
+
+def popular_queries(db, days):
+    """``{cache key: (query text, times asked)}`` for items in recent kits."""
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    counts = Counter()
+    texts = {}
+    for doc in db.kits.find({"created_at": {"$gte": since}}, {"kit": 1}):
+        for section in (doc.get("kit") or {}).get("sections", []):
+            for item in section.get("items", []):
+                query = build_query_for_item(item)["clean_query"]
+                if not query:
+                    continue
+                key = canonical_query_key(query)
+                texts.setdefault(key, query)
+                counts[key] += 1
+    return {key: (texts[key], count) for key, count in counts.items()}
+
+
+def plan_warmup(db, budget, days=14, horizon=6 * 3600):
+    """Pick up to ``budget`` queries to refresh: ``{cache key: query text}``."""
+    due_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        seconds=SEARCH_CACHE_SOFT_TTL - horizon
+    )
+    popular = popular_queries(db, days)
+    fresh = {
+        doc["query"]
+        for doc in db.search_cache.find(
+            {
+                "query": {"$in": list(popular)},
+                "source": "google_shopping",
+                "created_at": {"$gt": due_before},
+            },
+            {"query": 1, "_id": 0},
+        )
+    }
+
+    plan = {}
+    for key, (text, _) in sorted(popular.items(), key=lambda entry: -entry[1][1]):
+        if len(plan) >= budget:
+            return plan
+        if key not in fresh:
+            plan[key] = text
+
+    # Then whatever else is about to go stale, oldest first
+    due = db.search_cache.find(
+        {"source": "google_shopping", "created_at": {"$lte": due_before}},
+        {"query": 1, "search_text": 1, "_id": 0},
+    ).sort("created_at", 1).limit(budget)
+    for doc in due:
+        if len(plan) >= budget:
+            break
+        plan.setdefault(doc["query"], doc.get("search_text") or doc["query"])
+    return plan
+
+
+def warm_search_cache(db, budget, days=14, horizon=6 * 3600, dry_run=False):
+    """Refresh the planned queries; returns (queries planned, queries warmed)."""
+    plan = plan_warmup(db, budget, days=days, horizon=horizon)
+    if dry_run or not plan:
+        return len(plan), 0
+    # refresh=True: the warmer writes the cache, it never needs to read it
+    searcher = SearchService(mongo_db=db, refresh=True)
+    return len(plan), len(searcher.fetch_and_store(plan))
+
+
+@click.command("warm-search-cache")
+@click.option("--budget", default=100, show_default=True,
+              help="Most Serper queries to spend.")
+@click.option("--days", default=14, show_default=True,
+              help="How far back to read kit history for popular queries.")
+@click.option("--horizon", default=6 * 3600, show_default=True,
+              help="Also refresh entries going stale within this many seconds.")
+@click.option("--dry-run", is_flag=True, help="Only report what would be fetched.")
+@with_appcontext
+def warm_search_cache_command(budget, days, horizon, dry_run):
+    """Re-fetch popular search queries before their cache entries go stale."""
+    planned, warmed = warm_search_cache(
+        mongo.db, budget, days=days, horizon=horizon, dry_run=dry_run
+    )
+    requests = -(-planned // SERPER_BATCH_SIZE) if not dry_run else 0
+    click.echo(
+        f"Planned {planned} queries, warmed {warmed} "
+        f"({requests} Serper requests, budget {budget})."
+    )
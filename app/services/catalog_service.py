@@ -0,0 +1,158 @@
+"""Local product catalog accumulated from every search result we have seen."""
+
+import datetime
+import hashlib
+import logging
+import os
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.extensions import once_per_db
+from app.services import metrics
+from app.services.http_clients import per_process_executor
+from app.services.match_service import rank_candidates, specs_found
+from normalization import normalize_string
+
+logger = logging.getLogger(__name__)
+
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "1") == "1"
+CATALOG_MIN_CONFIDENCE = float(os.getenv("CATALOG_MIN_CONFIDENCE", "0.85"))
+# Lower bar used only while the Serper circuit is open
+CATALOG_FALLBACK_CONFIDENCE = float(os.getenv("CATALOG_FALLBACK_CONFIDENCE", "0.6"))
+CATALOG_MAX_AGE_DAYS = int(os.getenv("CATALOG_MAX_AGE_DAYS", "7"))
+CATALOG_CANDIDATES = int(os.getenv("CATALOG_CANDIDATES", "40"))
+CATALOG_LOOKUP_WORKERS = int(os.getenv("CATALOG_LOOKUP_WORKERS", "8"))
+
+
+@once_per_db
+def ensure_indexes(db):
+    db.product_catalog.create_index("tokens")
+    db.product_catalog.create_index("last_seen")
+
+
+def title_tokens(title):
+    """Normalized tokens used as keys in the inverted title index."""
+    tokens = normalize_string(title).replace("-", " ").split()
+    return sorted({token for token in tokens if len(token) > 1 or token.isdigit()})
+
+
+def product_id(result):
+    """Stable id for a product: its URL, else its title and source."""
+    key = result.get("url") or f"{result.get('title')}|{result.get('source')}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+class ProductCatalog:
+    """Stores products in Mongo with a multikey index over title tokens."""
+
+    def __init__(self, mongo_db=None):
+        self.db = mongo_db
+        if self.db is not None:
+            ensure_indexes(self.db)
+
+    @staticmethod
+    def ingest_ops(results):
+        """The catalog upserts for a batch of search results."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return [
+            UpdateOne(
+                {"_id": product_id(result)},
+                {
+                    "$set": {
+                        "title": result.get("title"),
+                        "tokens": title_tokens(result.get("title")),
+                        "price": result.get("price"),
+                        "url": result.get("url"),
+                        "img_url": result.get("img_url"),
+                        "source": result.get("source"),
+                        "last_seen": now,
+                    },
+                    "$setOnInsert": {"first_seen": now},
+                    "$inc": {"seen_count": 1},
+                },
+                upsert=True,
+            )
+            for result in results
+            if result.get("title")
+        ]
+
+    def ingest(self, results):
+        """Upsert search results into the catalog in one bulk write."""
+        if self.db is None or not results:
+            return 0
+        ops = self.ingest_ops(results)
+        if not ops:
+            return 0
+        try:
+            self.db.product_catalog.bulk_write(ops, ordered=False)
+        except PyMongoError as exc:
+            logger.warning("Catalog ingest failed: %s", exc)
+            return 0
+        return len(ops)
+
+    @staticmethod
+    def candidates_pipeline(item, limit=CATALOG_CANDIDATES):
+        """Aggregation for ``candidates``, or None if the item has no tokens."""
+        tokens = title_tokens(item.get("name", ""))
+        if not tokens:
+            return None
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            days=CATALOG_MAX_AGE_DAYS
+        )
+        return [
+            {"$match": {"tokens": {"$in": tokens}, "last_seen": {"$gte": cutoff}}},
+            {"$addFields": {
+                "overlap": {"$size": {"$setIntersection": ["$tokens", tokens]}},
+            }},
+            {"$sort": {"overlap": -1, "seen_count": -1}},
+            {"$limit": limit},
+            {"$project": {
+                "_id": 0, "title": 1, "price": 1, "url": 1,
+                "img_url": 1, "source": 1,
+            }},
+        ]
+
+    def candidates(self, item, limit=CATALOG_CANDIDATES):
+        """Recently seen products sharing the most title tokens with the item."""
+        pipeline = self.candidates_pipeline(item, limit)
+        if self.db is None or pipeline is None:
+            return []
+        try:
+            return list(self.db.product_catalog.aggregate(pipeline))
+        except PyMongoError as exc:
+            logger.warning("Catalog lookup failed: %s", exc)
+            return []
+
+    def lookup(self, item, min_confidence=CATALOG_MIN_CONFIDENCE):
+        """Best local product for a kit item if it clears ``min_confidence``."""
+        with metrics.span("catalog_lookup"):
+            return self.pick(item, self.candidates(item), min_confidence)
+
+    def lookup_many(self, items, min_confidence=CATALOG_MIN_CONFIDENCE):
+        """``lookup`` for each of ``items``, run side by side on a shared pool."""
+        if len(items) < 2:
+            return [self.lookup(item, min_confidence) for item in items]
+        pool = per_process_executor("catalog-lookup", CATALOG_LOOKUP_WORKERS)
+        futures = [
+            pool.submit(metrics.bind_context(self.lookup), item, min_confidence)
+            for item in items
+        ]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def pick(item, candidates, min_confidence=CATALOG_MIN_CONFIDENCE):
+        """The best-ranked candidate that clears ``min_confidence``.
+
+        At the normal bar the candidate must also show one of the item's
+        specs: a keyword hit (0.85) only says the title contains the item's
+        name, which every size and variant of the product does. Below it
+        (the fallback while Serper is down) the best match is taken.
+        """
+        require_spec = min_confidence >= CATALOG_MIN_CONFIDENCE
+        for match in rank_candidates(item, candidates):
+            if match["confidence"] < min_confidence:
+                break
+            if not require_spec or specs_found(item, match["search_item"]):
+                return match["search_item"]
+        return None
@@ -0,0 +1,171 @@
+"""Exact product lookup by identifier (UPC, MPN, brand + model).
+
+Kit items carry ``identifier_hints``. When a ranked search result for
+such an item is confirmed with high confidence, each identifier is mapped
+to that product in ``product_fingerprints``, so the next item with the
+same identifier resolves with one indexed lookup and no fuzzy ranking.
+The hints come from the LLM, so placeholders ("none", "000000000000"),
+UPCs with a bad check digit and models without a brand are never keys,
+and a key is only recorded if the product's own title or fields show it.
+"""
+
+import datetime
+import logging
+import os
+import re
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.extensions import once_per_db
+from app.services.catalog_service import CATALOG_MAX_AGE_DAYS
+from normalization import normalize_string
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_ENABLED = os.getenv("FINGERPRINT_ENABLED", "1") == "1"
+FINGERPRINT_MIN_CONFIDENCE = float(os.getenv("FINGERPRINT_MIN_CONFIDENCE", "0.85"))
+
+PRODUCT_FIELDS = ("title", "price", "url", "img_url", "source")
+
+# Compacted values models write when they have no real identifier
+PLACEHOLDERS = {
+    "none", "null", "nil", "na", "nan", "unknown", "notavailable", "notapplicable",
+    "tbd", "tba", "generic", "various", "varies", "any", "other", "default",
+    "standard", "universal", "unbranded", "nobrand", "noname", "brand", "model",
+    "mpn", "upc", "sku", "example", "sample", "placeholder", "xxx", "abc", "abc123",
+    "123", "1234", "12345", "123456",
+}
+
+
+@once_per_db
+def ensure_indexes(db):
+    # Entries age out with the catalog, so prices are never too stale
+    db.product_fingerprints.create_index(
+        "confirmed_at", expireAfterSeconds=CATALOG_MAX_AGE_DAYS * 86400
+    )
+
+
+def _compact(value):
+    return re.sub(r"[^a-z0-9]", "", normalize_string(str(value)))
+
+
+def valid_upc(digits):
+    """A UPC/EAN/GTIN of a real length whose check digit adds up."""
+    if len(digits) not in (8, 12, 13, 14) or len(set(digits)) == 1:
+        return False
+    body, check = digits[:-1], int(digits[-1])
+    # Weights alternate 3, 1 starting from the digit next to the check digit
+    total = sum(int(digit) * (3 if i % 2 == 0 else 1) for i, digit in enumerate(reversed(body)))
+    return (10 - total % 10) % 10 == check
+
+
+def _real_identifier(value, min_length=3):
+    """Compacted ``value`` unless it is too short or a placeholder."""
+    compact = _compact(value or "")
+    if len(compact) < min_length or compact in PLACEHOLDERS or len(set(compact)) == 1:
+        return ""
+    return compact
+
+
+def fingerprint_keys(fingerprint):
+    """Index keys for a ``strict_match_fingerprint``, most specific first.
+
+    The first key that hits wins, so a UPC beats an MPN beats a model name.
+    A model is only a key together with its brand, since model names
+    repeat across manufacturers.
+    """
+    keys = []
+    upc = re.sub(r"\D", "", str(fingerprint.get("upc") or ""))
+    if valid_upc(upc):
+        keys.append(f"upc:{upc}")
+    mpn = _real_identifier(fingerprint.get("mpn"))
+    if mpn:
+        keys.append(f"mpn:{mpn}")
+    model = _real_identifier(fingerprint.get("model"))
+    brand = _real_identifier(fingerprint.get("brand"), min_length=2)
+    if model and brand:
+        keys.append(f"model:{brand}|{model}")
+    return keys
+
+
+def shown_by(key, product):
+    """True if the product's title or fields contain the key's identifier."""
+    text = _compact(" ".join(str(product.get(field) or "") for field in PRODUCT_FIELDS))
+    kind, _, value = key.partition(":")
+    parts = value.split("|") if kind == "model" else [value]
+    return all(part and part in text for part in parts)
+
+
+class FingerprintIndex:
+    """Identifier -> confirmed product map stored in ``product_fingerprints``."""
+
+    def __init__(self, mongo_db=None):
+        self.db = mongo_db
+        if self.db is not None:
+            ensure_indexes(self.db)
+
+    @staticmethod
+    def match(key_lists, docs):
+        """Pick each item's product from the ``product_fingerprints`` docs."""
+        products = {doc["_id"]: doc["product"] for doc in docs}
+        return [
+            next((products[key] for key in keys if key in products), None)
+            for keys in key_lists
+        ]
+
+    def lookup_many(self, key_lists):
+        """Resolve several items' keys with one ``$in`` query.
+
+        ``key_lists`` holds one ``fingerprint_keys`` list per item; returns
+        the matching product (or None) for each.
+        """
+        wanted = sorted({key for keys in key_lists for key in keys})
+        if self.db is None or not wanted:
+            return [None] * len(key_lists)
+        try:
+            docs = list(self.db.product_fingerprints.find(
+                {"_id": {"$in": wanted}}, {"product": 1}
+            ))
+        except PyMongoError as exc:
+            logger.warning("Fingerprint lookup failed: %s", exc)
+            return [None] * len(key_lists)
+        return self.match(key_lists, docs)
+
+    @staticmethod
+    def record_ops(confirmed):
+        """Upserts mapping each confident ``(keys, product, confidence)``."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        ops = []
+        for keys, product, confidence in confirmed:
+            if confidence < FINGERPRINT_MIN_CONFIDENCE:
+                continue
+            stored = {field: product.get(field) for field in PRODUCT_FIELDS}
+            for key in keys:
+                if not shown_by(key, product):
+                    # The LLM's guess was never confirmed by the listing
+                    continue
+                ops.append(UpdateOne(
+                    {"_id": key},
+                    {"$set": {
+                        "product": stored,
+                        "confidence": confidence,
+                        "confirmed_at": now,
+                    }},
+                    upsert=True,
+                ))
+        return ops
+
+    def record_many(self, confirmed):
+        """Map each ``(keys, product, confidence)`` to its product in one write."""
+        if self.db is None:
+            return 0
+        ops = self.record_ops(confirmed)
+        if not ops:
+            return 0
+        try:
+            self.db.product_fingerprints.bulk_write(ops, ordered=False)
+        except PyMongoError as exc:
+            logger.warning("Fingerprint write failed: %s", exc)
+            return 0
+        return len(ops)
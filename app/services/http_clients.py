@@ -0,0 +1,176 @@
+"""Process-wide keep-alive HTTP clients for the Groq and Serper upstreams."""
+
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import requests
+from groq import AsyncGroq, Groq
+from requests.adapters import HTTPAdapter
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+SERPER_TIMEOUT = float(os.getenv("SERPER_TIMEOUT", "10"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+# The async pipeline keeps many more requests in flight per process
+ASYNC_HTTP_POOL_SIZE = int(os.getenv("ASYNC_HTTP_POOL_SIZE", "100"))
+
+_lock = threading.Lock()
+_serper_session = None
+_groq_client = None
+_groq_stats = {"requests": 0, "connections": 0}
+_groq_streams = weakref.WeakSet()
+_async_serper_client = None
+_async_groq_client = None
+_executors = {}
+
+
+def _reset_after_fork():
+    """Drop inherited sockets and pools so each gunicorn worker opens its own."""
+    global _lock, _serper_session, _groq_client, _groq_streams
+    global _async_serper_client, _async_groq_client, _executors
+    _lock = threading.Lock()
+    # Threads do not survive fork, so the inherited executors are dead
+    _executors = {}
+    _serper_session = None
+    _groq_client = None
+    _async_serper_client = None
+    _async_groq_client = None
+    _groq_stats.update(requests=0, connections=0)
+    _groq_streams = weakref.WeakSet()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_serper_session():
+    """Shared requests.Session with a connection pool sized for fan-out."""
+    global _serper_session
+    if _serper_session is None:
+        with _lock:
+            if _serper_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=4, pool_maxsize=HTTP_POOL_SIZE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _serper_session = session
+    return _serper_session
+
+
+def per_process_executor(name, workers):
+    """Shared thread pool ``name`` with ``workers`` threads, one per process."""
+    with _lock:
+        executor = _executors.get(name)
+        if executor is None:
+            executor = _executors[name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=name
+            )
+        return executor
+
+
+def serper_timeout(read_timeout=None):
+    """(connect, read) timeout tuple for Serper requests."""
+    return (CONNECT_TIMEOUT, read_timeout or SERPER_TIMEOUT)
+
+
+def httpx_timeout(read_timeout):
+    """Per-request httpx timeout (Groq SDK, async Serper) with the usual connect timeout."""
+    return httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT)
+
+
+def _track_groq_response(response):
+    # The same network stream object means the connection was reused
+    stream = response.extensions.get("network_stream")
+    with _lock:
+        _groq_stats["requests"] += 1
+        if stream is None or stream not in _groq_streams:
+            _groq_stats["connections"] += 1
+            if stream is not None:
+                _groq_streams.add(stream)
+
+
+def get_groq_client(api_key):
+    """Shared Groq client backed by a pooled keep-alive httpx.Client."""
+    global _groq_client
+    if _groq_client is None:
+        with _lock:
+            if _groq_client is None:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=HTTP_POOL_SIZE,
+                        max_keepalive_connections=HTTP_POOL_SIZE,
+                    ),
+                    timeout=httpx.Timeout(GROQ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    event_hooks={"response": [_track_groq_response]},
+                )
+                _groq_client = Groq(api_key=api_key, http_client=http_client)
+    return _groq_client
+
+
+# -- Async clients (used from the ASGI worker's event loop only) --
+
+
+def _async_limits():
+    return httpx.Limits(
+        max_connections=ASYNC_HTTP_POOL_SIZE,
+        max_keepalive_connections=ASYNC_HTTP_POOL_SIZE,
+    )
+
+
+def get_async_serper_client():
+    """Shared httpx.AsyncClient for Serper."""
+    global _async_serper_client
+    if _async_serper_client is None:
+        _async_serper_client = httpx.AsyncClient(
+            limits=_async_limits(),
+            timeout=httpx.Timeout(SERPER_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return _async_serper_client
+
+
+def get_async_groq_client(api_key):
+    """Shared AsyncGroq client on a pooled httpx.AsyncClient."""
+    global _async_groq_client
+    if _async_groq_client is None:
+        http_client = httpx.AsyncClient(
+            limits=_async_limits(),
+            timeout=httpx.Timeout(GROQ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+        _async_groq_client = AsyncGroq(api_key=api_key, http_client=http_client)
+    return _async_groq_client
+
+
+async def close_async_clients():
+    """Close the async connection pools (ASGI lifespan shutdown)."""
+    global _async_serper_client, _async_groq_client
+    if _async_serper_client is not None:
+        await _async_serper_client.aclose()
+        _async_serper_client = None
+    if _async_groq_client is not None:
+        await _async_groq_client.close()
+        _async_groq_client = None
+
+
+def pool_stats():
+    """Requests sent, connections opened and connections reused per upstream."""
+    serper = {"requests": 0, "connections": 0}
+    if _serper_session is not None:
+        for adapter in set(_serper_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is not None:
+                    serper["requests"] += pool.num_requests
+                    serper["connections"] += pool.num_connections
+
+    with _lock:
+        groq = dict(_groq_stats)
+
+    for stats in (serper, groq):
+        stats["reused"] = max(0, stats["requests"] - stats["connections"])
+    return {"serper": serper, "groq": groq}
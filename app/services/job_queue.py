@@ -0,0 +1,141 @@
+"""Background kit-generation jobs: state in Mongo, work on a local thread pool."""
+
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import uuid
+
+from flask import current_app
+from pymongo.errors import DuplicateKeyError
+
+from app.extensions import once_per_db
+from app.services.http_clients import per_process_executor
+
+logger = logging.getLogger(__name__)
+
+KIT_JOB_WORKERS = int(os.getenv("KIT_JOB_WORKERS", "2"))
+KIT_JOB_MAX_PENDING = int(os.getenv("KIT_JOB_MAX_PENDING", "20"))
+KIT_JOB_TIMEOUT = int(os.getenv("KIT_JOB_TIMEOUT", "300"))
+KIT_JOB_TTL = int(os.getenv("KIT_JOB_TTL", "86400"))
+
+
+class QueueFull(Exception):
+    """Raised when this process already has too many pending jobs."""
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+@once_per_db
+def _ensure_indexes(db):
+    # Only in-flight jobs carry inflight_key, so duplicates are rejected
+    db.kit_jobs.create_index("inflight_key", unique=True, sparse=True)
+    db.kit_jobs.create_index("created_at", expireAfterSeconds=KIT_JOB_TTL)
+
+
+def dedupe_key(user_id, user_input):
+    """Identical submissions from one user map to the same key."""
+    text = " ".join(str(user_input).lower().split())
+    return hashlib.sha256(f"{user_id}\n{text}".encode("utf-8")).hexdigest()
+
+
+class JobQueue:
+    """Runs jobs on a bounded local pool and records their state in kit_jobs.
+
+    Any web worker can answer status/result polls because state lives in
+    Mongo; only the process that accepted a job executes it.
+    """
+
+    def __init__(self, max_workers=KIT_JOB_WORKERS, max_pending=KIT_JOB_MAX_PENDING):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, db, user_id, user_input, fn, *args):
+        """Queue ``fn(*args)``; returns (job document, created flag)."""
+        _ensure_indexes(db)
+        key = dedupe_key(user_id, user_input)
+
+        existing = self._find_in_flight(db, key)
+        if existing is not None:
+            return existing, False
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise QueueFull("Too many kit jobs in progress, try again shortly")
+            self.pending += 1
+
+        job = {
+            "_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "dedupe_key": key,
+            "inflight_key": key,
+            "status": "queued",
+            "created_at": _now(),
+        }
+        try:
+            db.kit_jobs.insert_one(job)
+        except DuplicateKeyError:
+            # Another worker accepted the same submission first
+            with self._lock:
+                self.pending -= 1
+            existing = self._find_in_flight(db, key)
+            if existing is not None:
+                return existing, False
+            raise
+
+        app = current_app._get_current_object()
+        pool = per_process_executor("kit-job", self.max_workers)
+        pool.submit(self._run, app, db, job["_id"], fn, args)
+        return job, True
+
+    def _find_in_flight(self, db, key):
+        job = db.kit_jobs.find_one({"inflight_key": key})
+        if job is None:
+            return None
+        # A worker that died mid-job must not block new submissions forever
+        age = _now() - job["created_at"].replace(tzinfo=datetime.timezone.utc)
+        if age.total_seconds() > KIT_JOB_TIMEOUT:
+            self._finish(db, job["_id"], "failed", error="Job timed out")
+            return None
+        return job
+
+    def _run(self, app, db, job_id, fn, args):
+        try:
+            db.kit_jobs.update_one(
+                {"_id": job_id},
+                {"$set": {"status": "running", "started_at": _now()}},
+            )
+            with app.app_context():
+                result = fn(*args)
+            self._finish(db, job_id, "done", result=result)
+        except Exception as exc:
+            logger.exception("Kit job %s failed", job_id)
+            self._finish(db, job_id, "failed", error=str(exc))
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    @staticmethod
+    def _finish(db, job_id, status, result=None, error=None):
+        update = {"status": status, "finished_at": _now()}
+        if result is not None:
+            update["result"] = result
+        if error is not None:
+            update["error"] = error
+        db.kit_jobs.update_one(
+            {"_id": job_id},
+            {"$set": update, "$unset": {"inflight_key": ""}},
+        )
+
+    @staticmethod
+    def get(db, job_id, user_id):
+        """Fetch a job owned by ``user_id`` (None if missing or not theirs)."""
+        return db.kit_jobs.find_one({"_id": job_id, "user_id": user_id})
+
+
+job_queue = JobQueue()
@@ -1,21 +1,18 @@
 """Kit generation — turns a task interpretation into a structured product kit."""
 
 import json
-from pathlib import Path
 
-from app.services.llm_service import (
-    LocalLLMProvider,
-    convert_schema_to_dict,
-    validate_response,
-)
+from app.services.llm_service import LocalLLMProvider
+from app.services.registry import registry
+from app.services.stream_parser import KitItemParser
 
+# The task is already in the system prompt; don't pay for it twice
+KIT_USER_PROMPT = "Build the kit JSON for the task_interpretation above."
 
-def generate_kit(task_interpretation, clarifications=None, user_preferences=None):
-    """Send the task and context to the LLM and return a validated kit JSON."""
-    kit_prompt_str = Path(
-        "app/services/prompts/kit_builder.md"
-    ).read_text(encoding="utf-8")
-    llm = LocalLLMProvider()
+
+def kit_prompts(task_interpretation, clarifications, user_preferences):
+    """Return the (system, user) prompts for the kit builder."""
+    kit_prompt_str = registry.prompt("kit_builder")
 
     if isinstance(task_interpretation, dict):
         task_str = json.dumps(task_interpretation)
@@ -27,13 +24,39 @@ def generate_kit(task_interpretation, clarifications=None, user_preferences=None
         clarifications=clarifications or "",
         user_preferences=user_preferences or "",
     )
+    return formatted_prompt, KIT_USER_PROMPT
+
+
+def item_schema(kit_schema):
+    return kit_schema["properties"]["sections"]["items"]["properties"]["items"]["items"]
+
 
-    schema = convert_schema_to_dict("app/schemas/kit.schema.json")
+def generate_kit(task_interpretation, clarifications=None, user_preferences=None):
+    """Send the task and context to the LLM and return a validated kit JSON."""
+    system_prompt, user_prompt = kit_prompts(
+        task_interpretation, clarifications, user_preferences
+    )
+    llm = LocalLLMProvider(stage="kit")
 
-    response = llm.generate_response(
-        system_prompt=formatted_prompt,
-        user_prompt=task_str,
-        schema=schema,
+    # generate_response already validated against the schema
+    return llm.generate_response(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        schema=registry.schema("kit"),
     )
 
-    return validate_response(response, schema)
\ No newline at end of file
+
+def stream_kit(task_interpretation, clarifications=None, user_preferences=None):
+    """Generate a kit, yielding each item as soon as the LLM finishes it.
+
+    Yields ``("item", section_idx, item_idx, item)`` for every item that
+    passes the item sub-schema, then ``("done", kit_json)`` with the fully
+    validated kit, which is the source of truth.
+    """
+    system_prompt, user_prompt = kit_prompts(
+        task_interpretation, clarifications, user_preferences
+    )
+    kit_schema = registry.schema("kit")
+    parser = KitItemParser(registry.validator_for(item_schema(kit_schema)))
+    llm = LocalLLMProvider(stage="kit")
+    yield from llm.stream_response(system_prompt, user_prompt, kit_schema, parser)
@@ -0,0 +1,109 @@
+"""Persistence for fully resolved kits and the paginated history over them."""
+
+import base64
+import datetime
+
+from bson import ObjectId
+
+from app.extensions import once_per_db
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+@once_per_db
+def ensure_indexes(db):
+    """History is always read per user, newest first, with _id as tiebreak."""
+    db.kits.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+
+
+def _item_count(kit):
+    return sum(len(section.get("items", [])) for section in kit.get("sections", []))
+
+
+def kit_document(user_id, kit, user_input=None):
+    """The ``kits`` document for a resolved kit.
+
+    The LLM token counts are stored beside the kit rather than inside it.
+    """
+    kit = dict(kit)
+    token_usage = kit.pop("token_usage", None) or {}
+    return {
+        "user_id": user_id,
+        "kit_name": kit.get("kit_title", "Custom Kit"),
+        "created_at": datetime.datetime.utcnow(),
+        "user_input": user_input,
+        "item_count": _item_count(kit),
+        "kit": kit,
+        "token_usage": token_usage,
+    }
+
+
+def save_kit(db, user_id, kit, user_input=None):
+    """Store the resolved kit (products included) and return its id."""
+    ensure_indexes(db)
+    result = db.kits.insert_one(kit_document(user_id, kit, user_input))
+    return str(result.inserted_id)
+
+
+def _object_id(kit_id):
+    return ObjectId(kit_id) if ObjectId.is_valid(kit_id) else None
+
+
+def get_kit(db, user_id, kit_id):
+    """Fetch one stored kit owned by ``user_id`` (None if missing)."""
+    oid = _object_id(kit_id)
+    if oid is None:
+        return None
+    return db.kits.find_one({"_id": oid, "user_id": user_id})
+
+
+def update_kit(db, user_id, kit_id, kit, **fields):
+    """Replace a stored kit's contents, e.g. after refreshing prices."""
+    db.kits.update_one(
+        {"_id": _object_id(kit_id), "user_id": user_id},
+        {"$set": {"kit": kit, **fields}},
+    )
+
+
+def encode_cursor(doc):
+    raw = f"{doc['created_at'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Return (created_at, _id) from a cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        created_at, oid = raw.split("|")
+        return datetime.datetime.fromisoformat(created_at), ObjectId(oid)
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+
+def list_history(db, user_id, limit=HISTORY_PAGE_SIZE, cursor=None):
+    """One page of a user's kits, newest first; returns (kits, next_cursor).
+
+    Keyset pagination on (created_at, _id) walks the compound index
+    instead of skipping over earlier pages.
+    """
+    ensure_indexes(db)
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    query = {"user_id": user_id}
+    position = decode_cursor(cursor) if cursor else None
+    if position is not None:
+        created_at, oid = position
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": oid}},
+        ]
+
+    docs = list(
+        db.kits.find(
+            query, {"kit_name": 1, "created_at": 1, "item_count": 1}
+        )
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
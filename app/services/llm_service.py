@@ -1,76 +1,475 @@
 """LLM integration layer (Groq) with JSON schema validation and retry logic."""
 
+import copy
+import datetime
+import hashlib
 import json
+import logging
 import os
-from pathlib import Path
 
 import jsonschema
-from groq import Groq
+from flask import has_app_context
+from pymongo.errors import PyMongoError
 
-config = json.loads(Path("app/config.json").read_text(encoding="utf-8"))
+from app.extensions import once_per_db
+from app.services import metrics, resilience, schema_repair, token_budget
+from app.services.cache import TTLCache
+from app.services.http_clients import get_groq_client, httpx_timeout
+from app.services.registry import APP_DIR, registry
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+config = json.loads((APP_DIR / "config.json").read_text(encoding="utf-8"))
+
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))
+LLM_CACHE_MAX_DOCS = int(os.getenv("LLM_CACHE_MAX_DOCS", "5000"))
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "0") == "1"
+
+# In-process tier of the LLM response cache; Mongo's llm_cache is the second
+response_cache = TTLCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+llm_flight = SingleFlight("groq", lease_seconds=90)
+_cache_writes = 0
+
+REPAIR_PROMPT = """Parts of a JSON document you produced failed schema validation.
+The input maps each part's JSON Pointer to its current value ("value", null
+if missing) and the validation errors for it ("errors").
+
+Return one JSON object with the same keys, each holding only the corrected
+value for that part. Keep everything that was already valid and change
+only what the errors require.
+
+JSON Schema of your response:
+{schema}
+"""
+
+
+def _default_db():
+    """Use the app's Mongo database when called inside a Flask context."""
+    if has_app_context():
+        from app.extensions import mongo
+        return mongo.db
+    return None
+
+
+def response_cache_key(model_id, system_prompt, user_prompt, schema, temperature):
+    """Content address for a completion: model, prompts, schema, temperature."""
+    payload = json.dumps(
+        {
+            "model": model_id,
+            "system": system_prompt,
+            "user": user_prompt,
+            "schema": schema,
+            "temperature": temperature,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
 
 class LocalLLMProvider:
     """Calls Groq and validates the JSON response against a schema."""
 
-    def generate_response(self, system_prompt, user_prompt, schema, max_retries=2):
-        """Send prompts to the LLM with automatic retry on malformed JSON."""
-        if isinstance(system_prompt, dict):
-            system_prompt = json.dumps(system_prompt)
-        if isinstance(user_prompt, dict):
-            user_prompt = json.dumps(user_prompt)
+    def __init__(self, mongo_db=None, temperature=0.2, use_cache=True, stage=None):
+        self.db = mongo_db if mongo_db is not None else _default_db()
+        self.temperature = temperature
+        # Label for token accounting (gate, kit); None counts as "other"
+        self.stage = stage
+        self.use_cache = use_cache and not LLM_CACHE_DISABLED
+        self.model_id = config.get("GroqModelName", "llama-3.3-70b-versatile")
+
+    def generate_response(self, system_prompt, user_prompt, schema,
+                          max_retries=2, use_cache=None):
+        """Send prompts to the LLM with automatic retry on malformed JSON.
+
+        Validated outputs are cached by content; ``use_cache=False`` skips
+        the lookup (the fresh response still replaces the cached one).
+        """
+        system_prompt, user_prompt = prompt_text(system_prompt), prompt_text(user_prompt)
+        read_cache = self.use_cache if use_cache is None else use_cache
+        cache_key = response_cache_key(
+            self.model_id, system_prompt, user_prompt, schema, self.temperature
+        )
+        if read_cache:
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                return cached
+
+        validator = registry.validator_for(schema) if schema is not None else None
+
+        def complete():
+            parsed = self._complete(system_prompt, user_prompt, validator, max_retries)
+            if self.use_cache:
+                self._save_cached(cache_key, parsed)
+            return parsed
+
+        # Identical prompts in flight at the same time share one completion
+        result = llm_flight.do(
+            cache_key,
+            complete,
+            db=self.db if self.use_cache else None,
+            wait_for=lambda: self._get_cached(cache_key),
+        )
+        # Every caller gets its own copy, since callers mutate the result
+        return copy.deepcopy(result)
+
+    def stream_response(self, system_prompt, user_prompt, schema, parser,
+                        max_retries=2):
+        """Stream a completion, yielding ``parser`` events as tokens arrive.
+
+        Yields whatever ``parser.feed`` returns for each chunk, then
+        ``("done", result)`` with the fully validated response. A cached
+        response is returned without intermediate events, and a stream that
+        fails or does not validate falls back to ``generate_response``.
+        """
+        system_prompt, user_prompt = prompt_text(system_prompt), prompt_text(user_prompt)
+        cache_key = response_cache_key(
+            self.model_id, system_prompt, user_prompt, schema, self.temperature
+        )
+        if self.use_cache:
+            cached = self._get_cached(cache_key)
+            if cached is not None:
+                yield ("done", cached)
+                return
+
+        # Identical streams in flight share one completion, like generate_response;
+        # followers get the result without intermediate events
+        with llm_flight.hold(
+            cache_key,
+            db=self.db if self.use_cache else None,
+            wait_for=lambda: self._get_cached(cache_key),
+        ) as call:
+            if call.result is None:
+                try:
+                    with metrics.span("llm_stream"):
+                        for chunk in self._stream_groq(system_prompt, user_prompt):
+                            yield from parser.feed(chunk)
+                    call.result = self._repair(
+                        json.loads(parser.document()),
+                        registry.validator_for(schema),
+                        max_retries,
+                    )
+                    if self.use_cache:
+                        self._save_cached(cache_key, call.result)
+                except Exception as exc:
+                    stream_failed(exc)
+
+        if call.result is None:
+            # Outside the hold, since generate_response coalesces on the same key
+            yield ("done", self.generate_response(
+                system_prompt, user_prompt, schema,
+                max_retries=max_retries, use_cache=False,
+            ))
+            return
+        yield ("done", copy.deepcopy(call.result))
+
+    def _complete(self, system_prompt, user_prompt, validator, max_retries):
+        """Call the LLM until it returns JSON that passes ``validator``.
 
+        Only malformed JSON regenerates the whole response; schema errors go
+        through ``_repair``.
+        """
         for attempt in range(max_retries + 1):
             try:
-                content = self._call_groq(system_prompt, user_prompt)
+                with metrics.span("llm_call"):
+                    content = self._call_groq(system_prompt, user_prompt)
                 parsed = json.loads(content)
 
-                if schema is not None:
-                    jsonschema.validate(instance=parsed, schema=schema)
+                if validator is None:
+                    return parsed
+                return self._repair(parsed, validator, max_retries)
 
-                return parsed
+            except RETRYABLE_ERRORS as exc:
+                if not should_retry(exc, attempt, max_retries):
+                    raise
+                system_prompt = retry_prompt(system_prompt, exc)
 
-            except (json.JSONDecodeError, jsonschema.ValidationError) as exc:
-                if attempt < max_retries:
-                    repair_hint = (
-                        f"\n\nPREVIOUS ATTEMPT FAILED: {exc}\n"
-                        "Please fix the JSON structure and ensure it "
-                        "matches the schema exactly."
-                    )
-                    system_prompt = system_prompt + repair_hint
-                    continue
-                raise
+    def _repair(self, parsed, validator, rounds):
+        """Fix schema errors locally, then re-ask for only the failing parts."""
+        repair = SchemaRepair(parsed, validator, rounds)
+        for system_prompt, user_prompt in repair.requests():
+            with metrics.span("llm_repair"):
+                repair.apply(self._call_groq(system_prompt, user_prompt))
+        return repair.result()
+
+    # -- Response cache --
+
+    def _get_cached(self, key):
+        """Return a copy of a cached response from memory, then Mongo."""
+        cached = memory_response(key)
+        if cached is None and self.db is not None:
+            try:
+                doc = self.db.llm_cache.find_one({"_id": key}, {"response": 1})
+            except PyMongoError as exc:
+                logger.warning("LLM cache read failed: %s", exc)
+                doc = None
+            cached = stored_response(key, doc)
+        return cached
+
+    def _save_cached(self, key, response):
+        response_cache.set(key, copy.deepcopy(response))
+        if self.db is None:
+            return
+        try:
+            ensure_llm_cache_indexes(self.db)
+            self.db.llm_cache.update_one(
+                {"_id": key}, cache_update(self.model_id, response), upsert=True
+            )
+            if trim_due():
+                _trim_llm_cache(self.db)
+        except PyMongoError as exc:
+            logger.warning("LLM cache write failed: %s", exc)
 
     def _call_groq(self, system_prompt, user_prompt):
         """Make a single completion request to the Groq API."""
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY not set")
-
-        client = Groq(api_key=api_key)
-        model_id = config.get("GroqModelName", "llama-3.3-70b-versatile")
-
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=[
-                {"role": "system", "content": str(system_prompt)},
-                {"role": "user", "content": str(user_prompt)},
-            ],
-            temperature=0.2,
-            response_format={"type": "json_object"},
-        )
+        client = get_groq_client(groq_api_key())
+
+        # Raises CircuitOpen while Groq is failing, so callers fail fast
+        with resilience.groq.attempt() as timeout:
+            response = client.chat.completions.create(**chat_request(
+                self.model_id, self.temperature, system_prompt, user_prompt, timeout
+            ))
+        return completion_text(self.stage, response, (system_prompt, user_prompt))
+
+    def _stream_groq(self, system_prompt, user_prompt):
+        """Yield the content of a streamed Groq completion as it arrives."""
+        client = get_groq_client(groq_api_key())
+
+        # A stream's duration depends on its length, so it adds no latency sample
+        with resilience.groq.attempt(record_latency=False) as timeout:
+            stream = client.chat.completions.create(**chat_request(
+                self.model_id, self.temperature, system_prompt, user_prompt,
+                timeout, stream=True,
+            ))
+            completion = StreamedCompletion()
+            for chunk in stream:
+                text = completion.feed(chunk)
+                if text:
+                    yield text
+        completion.record(self.stage, (system_prompt, user_prompt))
+
+
+# -- Shared with the async provider (async_pipeline) --
+
+
+def groq_api_key():
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("GROQ_API_KEY not set")
+    return api_key
+
+
+def prompt_text(prompt):
+    """Prompts given as dicts are sent as JSON."""
+    return json.dumps(prompt) if isinstance(prompt, dict) else prompt
+
+
+def chat_request(model_id, temperature, system_prompt, user_prompt, timeout,
+                 stream=False):
+    """Keyword arguments for ``chat.completions.create``.
+
+    JSON mode is left off for streamed requests: the prompt asks for JSON
+    and the caller validates the assembled text.
+    """
+    request = {
+        "model": model_id,
+        "messages": [
+            {"role": "system", "content": str(system_prompt)},
+            {"role": "user", "content": str(user_prompt)},
+        ],
+        "temperature": temperature,
+        "timeout": httpx_timeout(timeout),
+    }
+    if stream:
+        request["stream"] = True
+    else:
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+
+def completion_text(stage, response, prompts):
+    """The text of a completion, after counting its tokens against ``stage``."""
+    content = response.choices[0].message.content
+    token_budget.record_usage(stage, response.usage, prompts, content)
+    return content
+
+
+class StreamedCompletion:
+    """Text and token usage collected from a streamed completion's chunks."""
+
+    def __init__(self):
+        self.pieces = []
+        self.usage = None
+
+    def feed(self, chunk):
+        """The chunk's text, if any."""
+        self.usage = token_budget.chunk_usage(chunk) or self.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            self.pieces.append(chunk.choices[0].delta.content)
+            return self.pieces[-1]
+        return None
+
+    def record(self, stage, prompts):
+        token_budget.record_usage(stage, self.usage, prompts, "".join(self.pieces))
+
+
+def memory_response(key):
+    """A copy of the response cached in this process, or None."""
+    cached = response_cache.get(key)
+    metrics.inc(
+        "cache_requests_total", cache="llm_memory",
+        result="miss" if cached is None else "hit",
+    )
+    # Callers mutate what they get back, so never hand out the cached dict
+    return copy.deepcopy(cached) if cached is not None else None
+
+
+def stored_response(key, doc):
+    """A copy of the response in an llm_cache ``doc`` (None for a miss).
+
+    A hit is also kept in the in-process tier.
+    """
+    metrics.inc(
+        "cache_requests_total", cache="llm_mongo",
+        result="hit" if doc else "miss",
+    )
+    if not doc:
+        return None
+    response_cache.set(key, doc["response"])
+    return copy.deepcopy(doc["response"])
+
+
+def cache_update(model_id, response):
+    """The llm_cache upsert for a validated response."""
+    return {"$set": {
+        "model": model_id,
+        "response": response,
+        "created_at": datetime.datetime.now(datetime.timezone.utc),
+    }}
+
+
+def trim_due():
+    """Count an llm_cache write; True on every 50th, when the cache is trimmed."""
+    global _cache_writes
+    _cache_writes += 1
+    return _cache_writes % 50 == 0
+
+
+def trim_excess(document_count):
+    """How many of the oldest llm_cache documents to evict."""
+    return document_count - LLM_CACHE_MAX_DOCS
+
+
+RETRYABLE_ERRORS = (json.JSONDecodeError, schema_repair.UnrepairableError)
+
+
+def should_retry(exc, attempt, max_retries):
+    """Whether a completion that failed with ``exc`` is generated again."""
+    if attempt >= max_retries:
+        return False
+    metrics.inc("llm_retries_total", reason=type(exc).__name__)
+    return True
+
+
+def stream_failed(exc):
+    logger.warning("Streaming completion failed, retrying without streaming: %s", exc)
+    metrics.inc("llm_stream_fallbacks_total", reason=type(exc).__name__)
+
+
+class SchemaRepair:
+    """Rounds of schema repair for ``parsed``; the caller makes the LLM calls.
+
+    Errors are fixed locally first. Each prompt pair from ``requests()``
+    asks for the parts that still fail; pass the completion to ``apply``
+    before taking the next one. ``result()`` raises the best validation
+    error if rounds run out first.
+    """
+
+    def __init__(self, parsed, validator, rounds):
+        self.parsed = parsed
+        self.validator = validator
+        self.rounds = rounds
+        self.errors = schema_repair.fix_locally(parsed, validator)
+        self._pointers = {}
+
+    def requests(self):
+        for _ in range(self.rounds):
+            if not self.errors:
+                return
+            metrics.inc("llm_retries_total", reason="ValidationError")
+            parts = schema_repair.failing_parts(
+                self.parsed, self.validator.schema, self.errors
+            )
+            system_prompt, user_prompt, self._pointers = repair_request(parts)
+            yield system_prompt, user_prompt
+
+    def apply(self, content):
+        apply_repair(self.parsed, self._pointers, content)
+        self.errors = schema_repair.fix_locally(self.parsed, self.validator)
+
+    def result(self):
+        if self.errors:
+            raise jsonschema.exceptions.best_match(self.errors)
+        return self.parsed
+
+
+def retry_prompt(system_prompt, exc):
+    """The system prompt for a full retry after ``exc``."""
+    return system_prompt + (
+        f"\n\nPREVIOUS ATTEMPT FAILED: {exc}\n"
+        "Please fix the JSON structure and ensure it "
+        "matches the schema exactly."
+    )
+
+
+def repair_request(parts):
+    """Prompts asking for ``failing_parts``; returns (system, user, pointers)."""
+    pointers = {schema_repair.json_pointer(path): path for path in parts}
+    response_schema = {
+        "type": "object",
+        "required": list(pointers),
+        "properties": {
+            pointer: parts[path][1] for pointer, path in pointers.items()
+        },
+    }
+    request = {
+        pointer: {"value": parts[path][0], "errors": parts[path][2]}
+        for pointer, path in pointers.items()
+    }
+    return (
+        REPAIR_PROMPT.format(schema=json.dumps(response_schema)),
+        json.dumps(request),
+        pointers,
+    )
+
 
-        return response.choices[0].message.content
+def apply_repair(parsed, pointers, content):
+    """Write the corrected parts from a repair completion into ``parsed``."""
+    try:
+        fixed = json.loads(content)
+    except json.JSONDecodeError as exc:
+        logger.warning("Schema repair returned invalid JSON: %s", exc)
+        return
+    if not isinstance(fixed, dict):
+        return
+    for pointer, path in pointers.items():
+        if pointer in fixed:
+            schema_repair.set_at(parsed, list(path), fixed[pointer])
+    metrics.inc("schema_repairs_total", len(pointers), mode="llm")
 
 
-def validate_response(response, schema):
-    """Validate a parsed dict against a JSON schema (no-op if schema is None)."""
-    if schema is None:
-        return response
-    jsonschema.validate(instance=response, schema=schema)
-    return response
+@once_per_db
+def ensure_llm_cache_indexes(db):
+    """TTL index on llm_cache.created_at, created once per process."""
+    db.llm_cache.create_index("created_at", expireAfterSeconds=LLM_CACHE_TTL)
 
 
-def convert_schema_to_dict(schema_path):
-    """Read a .json schema file and return it as a dict."""
-    return json.loads(Path(schema_path).read_text(encoding="utf-8"))
\ No newline at end of file
+def _trim_llm_cache(db):
+    """Evict the oldest llm_cache documents beyond LLM_CACHE_MAX_DOCS."""
+    excess = trim_excess(db.llm_cache.estimated_document_count())
+    if excess <= 0:
+        return
+    oldest = db.llm_cache.find({}, {"_id": 1}).sort("created_at", 1).limit(excess)
+    db.llm_cache.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
\ No newline at end of file
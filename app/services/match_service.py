@@ -4,11 +4,42 @@ import difflib
 
 from normalization import normalize_string
 
+# Below this similarity nothing scores, even a direct keyword match
+MIN_SIMILARITY = 0.30
+# Without a direct keyword match, the lowest scoring tier needs more than this
+MIN_FUZZY_SIMILARITY = 0.70
+
+
+def _tier(similarity, direct_match, specs_found):
+    """Map similarity signals to a (confidence, reasons) tier."""
+    if similarity < MIN_SIMILARITY:
+        return 0, []
+    # Direct substring match is a strong signal
+    if direct_match:
+        return 0.85, ["Direct Keyword Match"]
+    if similarity > 0.85 and specs_found > 0:
+        return 0.90, ["High Title Similarity with Specs Found"]
+    if similarity > 0.80 and specs_found >= 1:
+        return 0.75, ["Medium Title Similarity with Specs Found"]
+    if similarity > 0.75:
+        return 0.60, ["Fair Title Similarity"]
+    if similarity > MIN_FUZZY_SIMILARITY:
+        return 0.40, ["Low Title Similarity"]
+    return 0, []
+
+
+def specs_found(kit_item, search_item):
+    """How many of the kit item's specs appear in the search result's title."""
+    title = normalize_string(search_item.get("title") or "")
+    return sum(
+        1 for spec in kit_item.get("specs_to_search", [])
+        if normalize_string(spec) in title
+    )
+
 
 def score_title(kit_item, search_item):
     """Compare kit item name to search result title using fuzzy matching."""
     kit_name = kit_item.get("name")
-    kit_specs = kit_item.get("specs_to_search", [])
     search_name = search_item.get("title")
 
     if not kit_name or not search_name:
@@ -16,31 +47,19 @@ def score_title(kit_item, search_item):
 
     normalized_kit_name = normalize_string(kit_name)
     normalized_search_name = normalize_string(search_name)
-    specs_found = 0
 
     similarity = difflib.SequenceMatcher(
         None, normalized_kit_name, normalized_search_name
     ).ratio()
 
-    if similarity < 0.30:
+    if similarity < MIN_SIMILARITY:
         return 0, []
 
-    for spec in kit_specs:
-        if normalize_string(spec) in normalized_search_name:
-            specs_found += 1
-
-    # Direct substring match is a strong signal
-    if normalized_kit_name in normalized_search_name:
-        return 0.85, ["Direct Keyword Match"]
-    if similarity > 0.85 and specs_found > 0:
-        return 0.90, ["High Title Similarity with Specs Found"]
-    if similarity > 0.80 and specs_found >= 1:
-        return 0.75, ["Medium Title Similarity with Specs Found"]
-    if similarity > 0.75:
-        return 0.60, ["Fair Title Similarity"]
-    if similarity > 0.70:
-        return 0.40, ["Low Title Similarity"]
-    return 0, []
+    return _tier(
+        similarity,
+        normalized_kit_name in normalized_search_name,
+        specs_found(kit_item, search_item),
+    )
 
 
 def calculate_confidence(kit_item, search_item):
@@ -48,20 +67,75 @@ def calculate_confidence(kit_item, search_item):
     return score_title(kit_item, search_item)
 
 
-def rank_candidates(kit_item, search_items):
-    """Return search results sorted by descending confidence."""
-    ranked = []
+def _score_pair(matcher, kit_name, kit_specs, title):
+    """Same result as score_title, skipping ratio() when a bound rules it out.
+
+    ``matcher`` already holds ``title`` as its second sequence, so difflib's
+    per-title analysis is shared by every kit item scored against it.
+    """
+    matcher.set_seq1(kit_name)
+    direct_match = kit_name in title
+    needed = MIN_SIMILARITY if direct_match else MIN_FUZZY_SIMILARITY
+
+    # Cheap upper bounds on ratio(): length-only, then character multisets
+    if direct_match:
+        if matcher.real_quick_ratio() < needed or matcher.quick_ratio() < needed:
+            return 0, []
+    elif matcher.real_quick_ratio() <= needed or matcher.quick_ratio() <= needed:
+        return 0, []
+
+    similarity = matcher.ratio()
+    if similarity < MIN_SIMILARITY:
+        return 0, []
+
+    specs_found = sum(1 for spec in kit_specs if spec in title)
+    return _tier(similarity, direct_match, specs_found)
+
+
+def rank_candidates_batch(kit_items, search_items):
+    """Rank one pool of search results against many kit items in one pass.
+
+    Returns one ranking per kit item, identical to calling
+    ``rank_candidates`` for each item, but every string is normalized once
+    and hopeless pairs are pruned before the exact difflib score.
+    """
+    kits = []
+    for kit_item in kit_items:
+        name = kit_item.get("name")
+        specs = kit_item.get("specs_to_search", [])
+        kits.append((
+            normalize_string(name) if name else None,
+            [normalize_string(spec) for spec in specs],
+        ))
+
+    rankings = [[] for _ in kit_items]
+    matcher = difflib.SequenceMatcher(None)
 
     for search_item in search_items:
-        confidence, reason = calculate_confidence(kit_item, search_item)
-        if confidence > 0:
-            ranked.append({
-                "search_item": search_item,
-                "confidence": confidence,
-                "reason": reason,
-                "source": search_item.get("source", "unknown"),
-                "url": search_item.get("url", ""),
-            })
-
-    ranked.sort(key=lambda x: x["confidence"], reverse=True)
-    return ranked
\ No newline at end of file
+        raw_title = search_item.get("title")
+        if not raw_title:
+            continue
+        title = normalize_string(raw_title)
+        matcher.set_seq2(title)
+
+        for ranked, (kit_name, kit_specs) in zip(rankings, kits):
+            if kit_name is None:
+                continue
+            confidence, reason = _score_pair(matcher, kit_name, kit_specs, title)
+            if confidence > 0:
+                ranked.append({
+                    "search_item": search_item,
+                    "confidence": confidence,
+                    "reason": reason,
+                    "source": search_item.get("source", "unknown"),
+                    "url": search_item.get("url", ""),
+                })
+
+    for ranked in rankings:
+        ranked.sort(key=lambda x: x["confidence"], reverse=True)
+    return rankings
+
+
+def rank_candidates(kit_item, search_items):
+    """Return search results sorted by descending confidence."""
+    return rank_candidates_batch([kit_item], search_items)[0]
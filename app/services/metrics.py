@@ -0,0 +1,187 @@
+"""In-process counters, latency histograms and per-request traces.
+
+Everything is per process: with several gunicorn workers each one exposes
+its own numbers, and a Prometheus scrape sees whichever worker answered.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "kartwise_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Spans recorded during the current request (None outside a request)
+_trace = contextvars.ContextVar("kartwise_trace", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return "{" + body + "}"
+
+
+class Metrics:
+    """Thread-safe registry of counters, histograms and gauge collectors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {
+                    "buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0,
+                }
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def add_collector(self, fn, kind="gauge"):
+        """Register ``fn() -> [(name, labels_dict, value)]`` read at scrape time.
+
+        Use ``kind="counter"`` (and a ``_total`` name) for running totals.
+        """
+        self._collectors.append((fn, kind))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]}
+                for key, h in self._histograms.items()
+            }
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name in seen:
+                return
+            seen.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {PREFIX}{name} {self._help[name]}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), hist in sorted(histograms.items()):
+            header(name, "histogram")
+            for bound, count in zip(BUCKETS, hist["buckets"]):
+                le = _format_labels(labels, [("le", str(bound))])
+                lines.append(f"{PREFIX}{name}_bucket{le} {count}")
+            inf = _format_labels(labels, [("le", "+Inf")])
+            lines.append(f"{PREFIX}{name}_bucket{inf} {hist['count']}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {hist['sum']}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {hist['count']}")
+
+        for collector, kind in self._collectors:
+            try:
+                samples = collector()
+            except Exception as exc:
+                logger.warning("Metrics collector failed: %s", exc)
+                continue
+            # One family per block, as the exposition format requires
+            for name, labels, value in sorted(samples, key=lambda sample: sample[0]):
+                header(name, kind)
+                lines.append(f"{PREFIX}{name}{_format_labels(_label_key(labels))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("stage_duration_seconds", "Time spent in each pipeline stage.")
+metrics.describe("llm_retries_total", "LLM calls retried after invalid output.")
+metrics.describe("cache_requests_total", "Cache lookups by cache tier and result.")
+metrics.describe("serper_responses_total", "Serper responses by HTTP status.")
+metrics.describe("rate_limit_sleep_seconds_total", "Time spent waiting on rate budgets.")
+metrics.describe("gate_decisions_total", "Clarification gate runs by path (skipped, speculative, sequential).")
+metrics.describe("speculation_total", "Speculative kit generations used (hit) or thrown away (discarded).")
+metrics.describe("fingerprint_answers_total", "Kit items resolved by an exact identifier match.")
+metrics.describe("search_revalidations_total", "Stale search cache entries refreshed in the background.")
+metrics.describe("schema_repairs_total", "Schema errors fixed locally or by re-asking for just the failing part.")
+metrics.describe("llm_stream_fallbacks_total", "Streamed completions redone without streaming.")
+metrics.describe("user_loads_total", "Logged-in users resolved per request, by source (session, memory, mongo).")
+metrics.describe("circuit_transitions_total", "Upstream circuit breaker state changes, by new state.")
+metrics.describe("circuit_rejections_total", "Upstream calls refused because the circuit was open.")
+metrics.describe("hedged_requests_total", "Hedged Serper requests sent, and how many answered first (won).")
+metrics.describe("catalog_fallbacks_total", "Kit items matched from the catalog at the lower bar while Serper was down.")
+metrics.describe("llm_tokens_total", "LLM tokens by stage (gate, kit) and kind (prompt, completion).")
+metrics.describe("llm_token_estimates_total", "Completions whose token counts were estimated because Groq reported none.")
+metrics.describe("history_messages_dropped_total", "Conversation messages left out of prompts to fit PROMPT_HISTORY_TOKENS.")
+metrics.describe("kit_stream_prefetch_total", "Searches started from a streaming kit, by whether the final kit used them.")
+
+
+# -- Module-level helpers --
+
+
+def inc(name, amount=1, **labels):
+    metrics.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    metrics.observe(name, value, **labels)
+
+
+@contextmanager
+def span(stage):
+    """Time a block into stage_duration_seconds and the request trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", elapsed, stage=stage)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append({"stage": stage, "ms": round(elapsed * 1000, 2)})
+
+
+def start_trace():
+    """Begin collecting spans for the current request."""
+    _trace.set([])
+
+
+def finish_trace():
+    """Return the spans collected for this request and stop collecting."""
+    trace = _trace.get()
+    _trace.set(None)
+    return trace or []
+
+
+def bind_context(fn):
+    """Wrap ``fn`` to run in a copy of the caller's context (for thread pools)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -1,56 +1,473 @@
 """Main pipeline that ties clarification, kit generation, and product search."""
 
+import copy
+import json
+import os
+import queue
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
 from app.extensions import mongo
-from app.services.kit_service import generate_kit
+from app.services import metrics, resilience, token_budget
+from app.services.catalog_service import CATALOG_FALLBACK_CONFIDENCE
+from app.services.fingerprint_service import fingerprint_keys
+from app.services.kit_service import generate_kit, stream_kit
 from app.services.match_service import rank_candidates
 from app.services.planner_service import gate_clarification
 from app.services.query_service import build_query_for_item
 from app.services.search_service import SearchService
 
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "8"))
+PIPELINE_SPECULATION = os.getenv("PIPELINE_SPECULATION", "1") == "1"
+KIT_STREAMING = os.getenv("KIT_STREAMING", "1") == "1"
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", "10"))
 
-def run_lab_pipeline(user_input, history_list=None):
-    """Execute the end-to-end kit building pipeline."""
 
-    # Build a conversation history string for the LLM
-    history_str = ""
-    if history_list:
-        for message in history_list:
-            role = message.get("role", "user")
-            content = message.get("content", "")
-            history_str += f"{role.upper()}: {content}\n"
+def best_match(item, raw_results):
+    """Return (best result or None, its match confidence)."""
+    with metrics.span("rank_candidates"):
+        matches = rank_candidates(item, raw_results)
+
+    if matches:
+        return matches[0]["search_item"], matches[0]["confidence"]
+    if raw_results:
+        return raw_results[0], 0.0
+    return None, 0.0
+
+
+class ProductMatches:
+    """The answer for each item as the product sources are tried in turn.
+
+    The caller runs the lookups and hands their results to ``take``, then
+    searches ``search_queries()`` and passes each result list to
+    ``ranked``. Items whose search found nothing can be held back for a
+    catalog fallback and finished with ``settle_unmatched``.
+    ``on_resolved(index, best)`` is called once per item, when its answer
+    is final.
+    """
+
+    def __init__(self, items, on_resolved=None):
+        self.items = items
+        self.best = [None] * len(items)
+        self.keys = [
+            fingerprint_keys(build_query_for_item(item)["strict_match_fingerprint"])
+            for item in items
+        ]
+        self.on_resolved = on_resolved
+        # (fingerprint keys, product, confidence) for confident search matches
+        self.confirmed = []
+        self.unmatched = []
+        self._searched = []
+        self._hold_unmatched = False
+
+    def pending(self):
+        return [index for index in range(len(self.items)) if self.best[index] is None]
+
+    def items_at(self, indexes):
+        return [self.items[index] for index in indexes]
+
+    def take(self, indexes, products, counter):
+        """Resolve ``indexes`` with the lookup's non-None ``products``."""
+        for index, product in zip(indexes, products):
+            if product is not None:
+                metrics.inc(counter)
+                self._resolve(index, product)
+
+    def search_queries(self, hold_unmatched=False):
+        """Queries for the items still pending, in the order ``ranked`` expects."""
+        self._searched = self.pending()
+        self._hold_unmatched = hold_unmatched
+        return [
+            build_query_for_item(self.items[index])["clean_query"]
+            for index in self._searched
+        ]
+
+    def ranked(self, position, raw_results):
+        """Rank the search results for the ``position``-th query."""
+        index = self._searched[position]
+        product, confidence = best_match(self.items[index], raw_results)
+        if product is None and self._hold_unmatched:
+            # Held back in case the catalog has to stand in for Serper
+            self.unmatched.append(index)
+            return
+        if self.keys[index] and product is not None:
+            self.confirmed.append((self.keys[index], product, confidence))
+        self._resolve(index, product)
+
+    def settle_unmatched(self, products=None):
+        """Resolve the held-back items with fallback ``products`` (or None)."""
+        products = products or [None] * len(self.unmatched)
+        for index, product in zip(self.unmatched, products):
+            if product is not None:
+                metrics.inc("catalog_fallbacks_total")
+            self._resolve(index, product)
+
+    def _resolve(self, index, product):
+        self.best[index] = product
+        if self.on_resolved is not None:
+            self.on_resolved(index, product)
+
+
+def _find_best_products(searcher, items, on_resolved=None):
+    """Return the best matching result (or None) for each of ``items``.
+
+    Items with a known identifier resolve from the fingerprint index
+    without ranking; then the local product catalog is tried, and the
+    rest are searched together with one ``search_many`` call. Confident
+    search matches are fed back into the fingerprint index. While the
+    Serper circuit is open, items left without results settle for a
+    weaker catalog match. ``on_resolved(index, best)`` is called for each
+    item as soon as its answer is final.
+    """
+    matches = ProductMatches(items, on_resolved)
+    use_local = not searcher.refresh
+
+    if searcher.fingerprints is not None and use_local and any(matches.keys):
+        with metrics.span("fingerprint_lookup"):
+            exact = searcher.fingerprints.lookup_many(matches.keys)
+        matches.take(range(len(items)), exact, "fingerprint_answers_total")
+
+    pending = matches.pending()
+    if searcher.catalog is not None and use_local and pending:
+        local = searcher.catalog.lookup_many(matches.items_at(pending))
+        matches.take(pending, local, "catalog_answers_total")
+
+    if not matches.pending():
+        return matches.best
+
+    queries = matches.search_queries(hold_unmatched=searcher.catalog is not None)
+    searcher.search_many(queries, on_result=matches.ranked)
+    if searcher.fingerprints is not None and matches.confirmed:
+        searcher.fingerprints.record_many(matches.confirmed)
+
+    fallback = None
+    if matches.unmatched and resilience.serper.is_open():
+        fallback = searcher.catalog.lookup_many(
+            matches.items_at(matches.unmatched), CATALOG_FALLBACK_CONFIDENCE
+        )
+    matches.settle_unmatched(fallback)
+    return matches.best
+
+
+def apply_product(item, best):
+    if best is None:
+        return
+    item["buy_url"] = best.get("url")
+    item["price"] = best.get("price", "View")
+    item["img_url"] = best.get("img_url")
+
+
+def kit_items(kit_json):
+    """(section index, item index, item) for every item in the kit."""
+    return [
+        (section_idx, item_idx, item)
+        for section_idx, section in enumerate(kit_json.get("sections", []))
+        for item_idx, item in enumerate(section.get("items", []))
+    ]
+
+
+class SearchBatches(ABC):
+    """Batched product searches, one per distinct item.
+
+    Submitted items are grouped and resolved with one search per batch; a
+    batch goes out every SEARCH_BATCH_SIZE items, and each item's future
+    resolves as soon as its own answer is known. Items can be submitted
+    early (``prefetch=True``) while the kit is still streaming; the final
+    kit picks up any search for an identical item instead of starting it
+    again. Subclasses make the futures and run the batches.
+    """
+
+    def __init__(self, searcher):
+        self.searcher = searcher
+        self._futures = {}
+        self._pending = []
+        self._prefetched = set()
+
+    @abstractmethod
+    def _future(self):
+        """A new, unresolved future for one item."""
+
+    @abstractmethod
+    def _start(self, batch):
+        """Run ``batch`` (``[(item, future)]``) and resolve its futures."""
+
+    def submit(self, item, prefetch=False):
+        key = json.dumps(item, sort_keys=True)
+        future = self._futures.get(key)
+        if future is None:
+            future = self._futures[key] = self._future()
+            self._pending.append((copy.deepcopy(item), future))
+            if prefetch:
+                self._prefetched.add(key)
+            if len(self._pending) >= SEARCH_BATCH_SIZE:
+                self.flush()
+        return future
+
+    def flush(self):
+        """Send everything submitted so far as one batch."""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._start(batch)
+
+    @staticmethod
+    def _resolver(batch):
+        """``on_resolved`` for a batch: sets each item's future."""
+        def resolved(index, best):
+            future = batch[index][1]
+            if not future.done():
+                future.set_result(best)
+        return resolved
+
+    @staticmethod
+    def _fail(batch, exc):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
 
+    def settle_prefetched(self, kit_json):
+        """Count prefetched searches the final kit did and didn't use."""
+        if not self._prefetched:
+            return
+        final = {json.dumps(item, sort_keys=True) for _, _, item in kit_items(kit_json)}
+        used = len(self._prefetched & final)
+        metrics.inc("kit_stream_prefetch_total", used, outcome="used")
+        metrics.inc(
+            "kit_stream_prefetch_total", len(self._prefetched) - used, outcome="unused"
+        )
+        self._prefetched.clear()
+
+
+class ProductSearches(SearchBatches):
+    """``SearchBatches`` run on a thread pool."""
+
+    def __init__(self, searcher, max_workers=None):
+        super().__init__(searcher)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, max_workers or SEARCH_WORKERS))
+
+    def _future(self):
+        return Future()
+
+    def _start(self, batch):
+        # The batch runs in a copy of this context so spans reach the trace
+        self.pool.submit(metrics.bind_context(self._run_batch), batch)
+
+    def _run_batch(self, batch):
+        try:
+            _find_best_products(
+                self.searcher, [item for item, _ in batch], self._resolver(batch)
+            )
+        except Exception as exc:
+            self._fail(batch, exc)
+
+    def close(self):
+        # Stop queued batches if the consumer goes away (e.g. client disconnect)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_resolved_products(kit_json, searcher, max_workers=None, searches=None):
+    """Search all kit items in batches, yielding each one as it resolves.
+
+    Every product is written back to its own item, so the final kit is the
+    same whatever order the searches finish in. Pass ``searches`` to reuse
+    searches already started for this kit.
+    """
+    entries = kit_items(kit_json)
+    if not entries:
+        return
+
+    owned = searches is None
+    if owned:
+        searches = ProductSearches(searcher, max_workers)
+    try:
+        futures = {}
+        for entry in entries:
+            futures.setdefault(searches.submit(entry[2]), []).append(entry)
+        searches.flush()
+        for future in as_completed(futures):
+            best = future.result()
+            for section_idx, item_idx, item in futures[future]:
+                apply_product(item, best)
+                yield section_idx, item_idx, item
+    finally:
+        if owned:
+            searches.close()
+
+
+def refresh_products(kit_json):
+    """Re-run only the search stage for a stored kit, skipping cached results.
+
+    An item keeps its current product unless the search finds a new one,
+    so a failing upstream never wipes stored links. Returns the kit and
+    the number of items that got a fresh product.
+    """
+    entries = kit_items(kit_json)
+    searches = ProductSearches(SearchService(mongo_db=mongo.db, refresh=True))
+    try:
+        futures = [searches.submit(item) for _, _, item in entries]
+        searches.flush()
+        refreshed = 0
+        for (_, _, item), future in zip(entries, futures):
+            best = future.result()
+            if best is not None:
+                apply_product(item, best)
+                refreshed += 1
+    finally:
+        searches.close()
+    return kit_json, refreshed
+
+
+def format_history(history_list):
+    """Build a conversation history string for the LLM, within PROMPT_HISTORY_TOKENS."""
+    return token_budget.compact_history(history_list)
+
+
+def gate_decided(user_input, history_list):
+    """True when clarification would be skipped whatever the gate says."""
     has_budget = "$" in user_input or any(ch.isdigit() for ch in user_input)
-    gate = gate_clarification(user_input, conversation_history=history_str)
+    return bool(history_list) or has_budget
 
-    # Skip clarification if we already have context or a budget
-    if history_list or has_budget:
-        gate["need_clarification"] = False
 
+def _kit_events(task, history_str):
+    """Kit generation as ``stream_kit`` events: early items, then "done"."""
+    with metrics.span("generate_kit"):
+        if KIT_STREAMING:
+            yield from stream_kit(task, clarifications=history_str)
+        else:
+            yield ("done", generate_kit(task, clarifications=history_str))
+
+
+def _gate(user_input, history_str):
+    with metrics.span("gate_clarification"):
+        return gate_clarification(user_input, conversation_history=history_str)
+
+
+def _pump(events, out, stop):
+    """Forward kit events from a worker thread until done or told to stop."""
+    try:
+        for event in events:
+            if stop.is_set():
+                break
+            out.put(event)
+    except Exception as exc:
+        out.put(("error", exc))
+    finally:
+        events.close()
+
+
+def _drain(out):
+    while True:
+        event = out.get()
+        if event[0] == "error":
+            raise event[1]
+        yield event
+        if event[0] == "done":
+            return
+
+
+def _gate_with_speculative_kit(user_input, history_str):
+    """Run the gate while a kit is generated from the raw input alongside it.
+
+    Returns (gate, kit_events). kit_events is None when the gate asks for
+    clarification; the speculative generation is then abandoned.
+    """
+    out = queue.Queue()
+    stop = threading.Event()
+    threading.Thread(
+        target=metrics.bind_context(_pump),
+        args=(_kit_events(user_input, history_str), out, stop),
+        daemon=True,
+    ).start()
+    try:
+        gate = _gate(user_input, history_str)
+    except BaseException:
+        stop.set()
+        raise
     if gate.get("need_clarification"):
-        return {"type": "questions", "data": gate["questions"]}
+        stop.set()
+        metrics.inc("speculation_total", outcome="discarded")
+        return gate, None
+    metrics.inc("speculation_total", outcome="hit")
+    return gate, _drain(out)
 
-    task = gate.get("task_interpretation", user_input)
-    kit_json = generate_kit(task, clarifications=history_str)
 
-    # Search for real products matching each kit item
-    searcher = SearchService(mongo_db=mongo.db)
+def iter_lab_pipeline(user_input, history_list=None):
+    """Run the pipeline as a stream of events for incremental delivery.
+
+    Yields dicts with a ``type`` of ``status``, ``questions``,
+    ``kit_outline``, ``item`` or ``final_kit`` and a ``data`` payload.
+    With KIT_STREAMING, searches start for each item as the LLM finishes
+    writing it, so they overlap the rest of kit generation. The final kit
+    carries the LLM tokens each stage used as ``token_usage``.
+    """
+    usage = token_budget.start_usage()
+    history_str = format_history(history_list)
+
+    if gate_decided(user_input, history_list):
+        # Context or a budget means we never ask, so don't wait on the gate
+        metrics.inc("gate_decisions_total", path="skipped")
+        yield {"type": "status", "data": {"stage": "building_kit"}}
+        kit_events = _kit_events(user_input, history_str)
+    else:
+        yield {"type": "status", "data": {"stage": "clarifying"}}
+        if PIPELINE_SPECULATION:
+            metrics.inc("gate_decisions_total", path="speculative")
+            gate, kit_events = _gate_with_speculative_kit(user_input, history_str)
+        else:
+            metrics.inc("gate_decisions_total", path="sequential")
+            gate, kit_events = _gate(user_input, history_str), None
 
-    for section in kit_json.get("sections", []):
-        for item in section.get("items", []):
-            queries = build_query_for_item(item)
-            raw_results = searcher.search(queries["clean_query"])
-            matches = rank_candidates(item, raw_results)
+        if gate.get("need_clarification"):
+            yield {"type": "questions", "data": gate["questions"]}
+            return
 
-            if matches:
-                best = matches[0]["search_item"]
-            elif raw_results:
-                best = raw_results[0]
-            else:
-                continue
+        yield {"type": "status", "data": {"stage": "building_kit"}}
+        if kit_events is None:
+            task = gate.get("task_interpretation", user_input)
+            kit_events = _kit_events(task, history_str)
+
+    searcher = SearchService(mongo_db=mongo.db)
+    searches = ProductSearches(searcher)
+    try:
+        kit_json = None
+        for event in kit_events:
+            if event[0] == "item":
+                searches.submit(event[3], prefetch=True)
+            elif event[0] == "done":
+                kit_json = event[1]
+        searches.settle_prefetched(kit_json)
+        yield {"type": "kit_outline", "data": copy.deepcopy(kit_json)}
 
-            item["buy_url"] = best.get("url")
-            item["price"] = best.get("price", "View")
-            item["img_url"] = best.get("img_url")
+        # Search for real products matching each kit item
+        yield {"type": "status", "data": {"stage": "searching"}}
+        for section_idx, item_idx, item in iter_resolved_products(
+            kit_json, searcher, searches=searches
+        ):
+            yield {
+                "type": "item",
+                "data": {
+                    "section": section_idx,
+                    "index": item_idx,
+                    "item_key": item.get("item_key"),
+                    "buy_url": item.get("buy_url"),
+                    "price": item.get("price"),
+                    "img_url": item.get("img_url"),
+                },
+            }
+    finally:
+        searches.close()
 
     kit_json["type"] = "final_kit"
-    return kit_json
\ No newline at end of file
+    kit_json["token_usage"] = usage
+    yield {"type": "final_kit", "data": kit_json}
+
+
+def run_lab_pipeline(user_input, history_list=None):
+    """Execute the end-to-end kit building pipeline."""
+    for event in iter_lab_pipeline(user_input, history_list):
+        if event["type"] == "questions":
+            return {"type": "questions", "data": event["data"]}
+        if event["type"] == "final_kit":
+            return event["data"]
+    return {"type": "error", "error": "Pipeline produced no result"}
@@ -1,20 +1,12 @@
 """Clarification gate — decides if the LLM needs to ask follow-up questions."""
 
-from pathlib import Path
+from app.services.llm_service import LocalLLMProvider
+from app.services.registry import registry
 
-from app.services.llm_service import (
-    LocalLLMProvider,
-    convert_schema_to_dict,
-    validate_response,
-)
 
-
-def gate_clarification(user_prompt, conversation_history=None, user_preferences=None):
-    """Run the clarification gate and return validated LLM output."""
-    clarify_gate_str = Path(
-        "app/services/prompts/clarify_gate.md"
-    ).read_text(encoding="utf-8")
-    llm = LocalLLMProvider()
+def gate_prompts(user_prompt, conversation_history=None, user_preferences=None):
+    """The clarification gate's (system, user) prompts."""
+    clarify_gate_str = registry.prompt("clarify_gate")
 
     if conversation_history and isinstance(conversation_history, list):
         history_str = "\n".join(
@@ -29,13 +21,19 @@ def gate_clarification(user_prompt, conversation_history=None, user_preferences=
         conversation_history=history_str,
         user_preferences=user_preferences or "",
     )
+    return formatted_prompt, user_prompt
 
-    schema = convert_schema_to_dict("app/schemas/llm_clarify_gate.schema.json")
 
-    response = llm.generate_response(
-        system_prompt=formatted_prompt,
-        user_prompt=user_prompt,
-        schema=schema,
+def gate_clarification(user_prompt, conversation_history=None, user_preferences=None):
+    """Run the clarification gate and return validated LLM output."""
+    system_prompt, user_prompt = gate_prompts(
+        user_prompt, conversation_history, user_preferences
     )
+    llm = LocalLLMProvider(stage="gate")
 
-    return validate_response(response, schema)
+    # generate_response already validated against the schema
+    return llm.generate_response(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        schema=registry.schema("clarify_gate"),
+    )
@@ -1,5 +1,90 @@
 """Build structured search queries from kit item metadata."""
 
+import re
+
+from normalization import normalize_string
+
+# Spellings that should share a cache entry ("2 meters" == "2m")
+UNIT_ALIASES = {
+    "m": "m", "meter": "m", "meters": "m", "metre": "m", "metres": "m",
+    "cm": "cm", "mm": "mm", "km": "km",
+    "ft": "ft", "foot": "ft", "feet": "ft",
+    "in": "in", "inch": "in", "inches": "in",
+    "yd": "yd", "yard": "yd", "yards": "yd",
+    "g": "g", "gram": "g", "grams": "g", "kg": "kg",
+    "oz": "oz", "ounce": "oz", "ounces": "oz",
+    "lb": "lb", "lbs": "lb", "pound": "lb", "pounds": "lb",
+    "l": "l", "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "ml": "ml", "gal": "gal", "gallon": "gal", "gallons": "gal",
+    "w": "w", "watt": "w", "watts": "w",
+    "v": "v", "volt": "v", "volts": "v",
+    "a": "a", "amp": "a", "amps": "a", "mah": "mah",
+    "gb": "gb", "tb": "tb", "mb": "mb", "hz": "hz", "ghz": "ghz",
+    "pc": "pc", "pcs": "pc", "piece": "pc", "pieces": "pc",
+    "pk": "pk", "pack": "pk", "packs": "pk",
+    "ct": "ct", "count": "ct",
+}
+
+_NUMBER_RE = re.compile(r"^\d+(?:p\d+)?$")
+_NUMBER_UNIT_RE = re.compile(r"^(\d+(?:p\d+)?)([a-z]+)$")
+
+
+def canonical_query_key(query):
+    """Return a normalized, token-sorted, unit-aware key for cache lookups."""
+    # Keep decimals distinct from integers once punctuation is stripped
+    query = re.sub(r"(\d)\.(\d)", r"\1p\2", query or "")
+    tokens = normalize_string(query).replace("-", " ").split()
+
+    merged = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        match = _NUMBER_UNIT_RE.match(token)
+        if match and match.group(2) in UNIT_ALIASES:
+            token = match.group(1) + UNIT_ALIASES[match.group(2)]
+        elif (
+            _NUMBER_RE.match(token)
+            and i + 1 < len(tokens)
+            and tokens[i + 1] in UNIT_ALIASES
+        ):
+            token += UNIT_ALIASES[tokens[i + 1]]
+            i += 1
+        merged.append(token)
+        i += 1
+
+    return " ".join(sorted(set(merged)))
+
+
+def replay_hit_rate(queries, key_fn=canonical_query_key):
+    """Replay a query log against an unbounded cache keyed by ``key_fn``."""
+    seen = set()
+    hits = 0
+    for query in queries:
+        key = key_fn(query)
+        if key in seen:
+            hits += 1
+        else:
+            seen.add(key)
+    total = len(queries)
+    return {
+        "queries": total,
+        "unique_keys": len(seen),
+        "hits": hits,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+    }
+
+
+def compare_cache_keys(queries):
+    """Hit rates for exact-string keys versus canonical keys on one log."""
+    queries = list(queries)
+    raw = replay_hit_rate(queries, key_fn=lambda q: q)
+    canonical = replay_hit_rate(queries)
+    return {
+        "raw": raw,
+        "canonical": canonical,
+        "saved_calls": raw["unique_keys"] - canonical["unique_keys"],
+    }
+
 
 def build_query_for_item(item):
     """Create clean, expanded, and fingerprint queries for a single kit item."""
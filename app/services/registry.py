@@ -0,0 +1,109 @@
+"""Prompt and schema registry, loaded once when the app is created."""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+import jsonschema
+
+APP_DIR = Path(__file__).resolve().parent.parent
+
+PROMPT_FILES = {
+    "clarify_gate": "services/prompts/clarify_gate.md",
+    "kit_builder": "services/prompts/kit_builder.md",
+}
+
+SCHEMA_FILES = {
+    "clarify_gate": "schemas/llm_clarify_gate.schema.json",
+    "kit": "schemas/kit.schema.json",
+}
+
+
+def compile_validator(schema):
+    """Check a schema once and build a reusable validator for it."""
+    validator_cls = jsonschema.validators.validator_for(schema)
+    validator_cls.check_schema(schema)
+    return validator_cls(schema)
+
+
+class PromptRegistry:
+    """Holds parsed prompts, schemas and precompiled validators."""
+
+    def __init__(self, base_dir=APP_DIR, hot_reload=False):
+        self.base_dir = Path(base_dir)
+        self.hot_reload = hot_reload
+        self._prompts = {}
+        self._schemas = {}
+        self._validators = {}
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def init_app(self, app):
+        """Load everything up front; reload on file change in debug mode."""
+        self.hot_reload = app.debug or os.getenv("PROMPT_HOT_RELOAD", "0") == "1"
+        self.load()
+        app.extensions["prompt_registry"] = self
+
+    def load(self):
+        with self._lock:
+            for name, rel_path in PROMPT_FILES.items():
+                self._load_prompt(name, rel_path)
+            for name, rel_path in SCHEMA_FILES.items():
+                self._load_schema(name, rel_path)
+            self._loaded = True
+
+    def _load_prompt(self, name, rel_path):
+        path = self.base_dir / rel_path
+        self._prompts[name] = path.read_text(encoding="utf-8")
+        self._mtimes[path] = path.stat().st_mtime
+
+    def _load_schema(self, name, rel_path):
+        path = self.base_dir / rel_path
+        schema = json.loads(path.read_text(encoding="utf-8"))
+        self._schemas[name] = schema
+        self._validators[id(schema)] = (schema, compile_validator(schema))
+        self._mtimes[path] = path.stat().st_mtime
+
+    def _refresh(self):
+        """Load on first use; in hot-reload mode pick up edited files."""
+        if not self._loaded:
+            self.load()
+            return
+        if not self.hot_reload:
+            return
+        with self._lock:
+            for name, rel_path in PROMPT_FILES.items():
+                if self._changed(self.base_dir / rel_path):
+                    self._load_prompt(name, rel_path)
+            for name, rel_path in SCHEMA_FILES.items():
+                if self._changed(self.base_dir / rel_path):
+                    self._load_schema(name, rel_path)
+
+    def _changed(self, path):
+        return path.stat().st_mtime != self._mtimes.get(path)
+
+    # -- Lookups --
+
+    def prompt(self, name):
+        self._refresh()
+        return self._prompts[name]
+
+    def schema(self, name):
+        self._refresh()
+        return self._schemas[name]
+
+    def validator_for(self, schema):
+        """Return the precompiled validator for a schema dict."""
+        entry = self._validators.get(id(schema))
+        if entry is not None and entry[0] is schema:
+            return entry[1]
+        # Schemas that did not come from the registry are compiled once here
+        validator = compile_validator(schema)
+        with self._lock:
+            self._validators[id(schema)] = (schema, validator)
+        return validator
+
+
+registry = PromptRegistry()
@@ -0,0 +1,222 @@
+"""Adaptive timeouts, hedged requests and circuit breakers for upstreams.
+
+Each upstream (Groq, Serper) keeps a window of recent call latencies. Its
+timeout follows a high percentile of that window, between a floor and
+the configured ceiling, so a slow upstream is given up on early instead of
+holding a worker for the full ceiling. Serper calls slower than their
+usual p95 get a second, hedged request, and the first answer wins. After
+repeated failures the circuit opens and calls fail fast with CircuitOpen
+until a cooldown passes; one trial call then decides whether it closes.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import contextmanager
+
+from app.services import metrics
+from app.services.http_clients import GROQ_TIMEOUT, SERPER_TIMEOUT, per_process_executor
+
+LATENCY_WINDOW = int(os.getenv("UPSTREAM_LATENCY_WINDOW", "200"))
+MIN_SAMPLES = int(os.getenv("UPSTREAM_MIN_SAMPLES", "20"))
+TIMEOUT_PERCENTILE = float(os.getenv("UPSTREAM_TIMEOUT_PERCENTILE", "0.99"))
+TIMEOUT_MULTIPLIER = float(os.getenv("UPSTREAM_TIMEOUT_MULTIPLIER", "3"))
+SERPER_TIMEOUT_MIN = float(os.getenv("SERPER_TIMEOUT_MIN", "1"))
+GROQ_TIMEOUT_MIN = float(os.getenv("GROQ_TIMEOUT_MIN", "10"))
+SERPER_HEDGE = os.getenv("SERPER_HEDGE", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "32"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+
+class CircuitOpen(Exception):
+    """The upstream is failing; the call was not attempted."""
+
+
+class UpstreamError(Exception):
+    """The upstream answered, but not with a usable response."""
+
+
+class Upstream:
+    """Latency window, adaptive timeout and circuit breaker for one upstream."""
+
+    def __init__(self, name, floor, ceiling):
+        self.name = name
+        self.floor = floor
+        self.ceiling = ceiling
+        self.state = CLOSED
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.counts = {
+            "calls": 0, "failures": 0, "rejected": 0, "opened": 0,
+            "hedges": 0, "hedge_wins": 0,
+        }
+
+    # -- Latency --
+
+    def percentile(self, fraction):
+        with self._lock:
+            ordered = sorted(self._latencies)
+        if len(ordered) < MIN_SAMPLES:
+            return None
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def timeout(self):
+        """Read timeout for the next call: a multiple of the recent p99."""
+        observed = self.percentile(TIMEOUT_PERCENTILE)
+        if observed is None:
+            return self.ceiling
+        return max(self.floor, min(self.ceiling, observed * TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self):
+        """How long to wait before hedging (None until there is enough data)."""
+        return self.percentile(HEDGE_PERCENTILE)
+
+    # -- Circuit breaker --
+
+    def guard(self):
+        """Raise CircuitOpen unless a call may go out now."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= BREAKER_COOLDOWN:
+                self._move(HALF_OPEN)
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._trial_running):
+                self._trial_running = self.state == HALF_OPEN
+                self.counts["calls"] += 1
+                return
+            self.counts["rejected"] += 1
+        metrics.inc("circuit_rejections_total", upstream=self.name)
+        raise CircuitOpen(f"{self.name} circuit is open")
+
+    def is_open(self):
+        """True while calls are being refused (open and still cooling down)."""
+        with self._lock:
+            return (
+                self.state == OPEN
+                and time.monotonic() - self._opened_at < BREAKER_COOLDOWN
+            )
+
+    def record_success(self, latency=None):
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self._failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                self._move(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.counts["failures"] += 1
+            self._failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self._failures >= BREAKER_FAILURES:
+                if self.state != OPEN:
+                    self.counts["opened"] += 1
+                self._move(OPEN)
+                self._opened_at = time.monotonic()
+
+    def _release(self):
+        with self._lock:
+            self._trial_running = False
+
+    def _move(self, state):
+        # Called with the lock held
+        if state != self.state:
+            self.state = state
+            metrics.inc("circuit_transitions_total", upstream=self.name, state=state)
+
+    # -- Calls --
+
+    @contextmanager
+    def attempt(self, record_latency=True):
+        """Guard, time and record one call; yields the timeout to use.
+
+        The block must raise for anything that counts as a failure, e.g.
+        UpstreamError for an error status.
+        """
+        self.guard()
+        start = time.perf_counter()
+        try:
+            yield self.timeout()
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # Cancelled or abandoned mid-call: neither a success nor a failure
+            self._release()
+            raise
+        self.record_success(time.perf_counter() - start if record_latency else None)
+
+    def call(self, fn, hedge=False, may_hedge=None):
+        """Return ``fn(timeout)`` under the breaker, optionally hedged.
+
+        With ``hedge``, ``fn`` runs on the hedge pool; if it has not
+        answered within the recent p95, a second copy starts (when
+        ``may_hedge()`` allows it) and the first success wins.
+        """
+        with self.attempt() as timeout:
+            delay = self.hedge_delay() if hedge else None
+            if delay is None:
+                return fn(timeout)
+            return self._hedged(fn, timeout, delay, may_hedge)
+
+    def _hedged(self, fn, timeout, delay, may_hedge):
+        pool = per_process_executor("upstream-hedge", HEDGE_WORKERS)
+        first = pool.submit(metrics.bind_context(fn), timeout)
+        done, _ = wait([first], timeout=delay)
+        if done or (may_hedge is not None and not may_hedge()):
+            return first.result()
+
+        with self._lock:
+            self.counts["hedges"] += 1
+        metrics.inc("hedged_requests_total", upstream=self.name, outcome="sent")
+        second = pool.submit(metrics.bind_context(fn), timeout)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    error = exc
+                    continue
+                if future is second:
+                    with self._lock:
+                        self.counts["hedge_wins"] += 1
+                    metrics.inc("hedged_requests_total", upstream=self.name, outcome="won")
+                return result
+        raise error
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+            state = self.state
+            samples = len(self._latencies)
+        return {
+            "state": state,
+            "timeout": round(self.timeout(), 3),
+            "samples": samples,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            **counts,
+        }
+
+
+serper = Upstream("serper", SERPER_TIMEOUT_MIN, SERPER_TIMEOUT)
+groq = Upstream("groq", GROQ_TIMEOUT_MIN, GROQ_TIMEOUT)
+UPSTREAMS = (serper, groq)
+
+
+def stats():
+    """Breaker state, current timeout, latency percentiles and counters."""
+    return {upstream.name: upstream.stats() for upstream in UPSTREAMS}
@@ -0,0 +1,227 @@
+"""Targeted repair of LLM output that fails its JSON schema.
+
+Every validation error is collected with its JSON path. Trivial ones
+(missing empty arrays, enum case, a string where a list belongs, extra
+keys) are fixed in place. The rest are narrowed to the smallest item,
+section or property that contains them, so only those values need to go
+back to the LLM.
+"""
+
+import jsonschema
+
+from app.services import metrics
+
+_MISSING = object()
+
+
+class UnrepairableError(jsonschema.ValidationError):
+    """The document is broken at its root, so there is no part to repair."""
+
+
+def collect_errors(doc, validator):
+    """All validation errors, shallowest path first."""
+    return sorted(validator.iter_errors(doc), key=lambda error: len(error.absolute_path))
+
+
+def json_pointer(path):
+    return "/" + "/".join(str(step) for step in path)
+
+
+def get_at(doc, path):
+    for step in path:
+        try:
+            doc = doc[step]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return doc
+
+
+def set_at(doc, path, value):
+    get_at(doc, path[:-1])[path[-1]] = value
+
+
+def subschema_at(schema, path):
+    """Walk ``properties``/``items`` down to the schema for ``path``."""
+    for step in path:
+        if isinstance(step, int):
+            schema = schema.get("items", {})
+        else:
+            schema = schema.get("properties", {}).get(step, {})
+    return schema
+
+
+def _types(schema):
+    types = schema.get("type", [])
+    return types if isinstance(types, list) else [types]
+
+
+def _placeholder(schema):
+    """A safe value for a missing property, or _MISSING if there is none."""
+    types = _types(schema)
+    if "array" in types and not schema.get("minItems"):
+        return []
+    if "null" in types:
+        return None
+    if "object" in types and not schema.get("required"):
+        return {}
+    return _MISSING
+
+
+def _missing_key(error):
+    """The property a ``required`` error is about.
+
+    jsonschema raises one ``required`` error per missing property, naming
+    it in the message; ``validator_value`` is the whole required list.
+    """
+    if not isinstance(error.instance, dict):
+        return None
+    missing = [key for key in error.validator_value if key not in error.instance]
+    for key in missing:
+        if error.message.startswith(repr(key)):
+            return key
+    return missing[0] if missing else None
+
+
+def _fix(doc, schema, error):
+    """Fix one error in place; return True if it was trivial enough to."""
+    path = list(error.absolute_path)
+    value = error.instance
+    kind = error.validator
+
+    if kind == "required":
+        key = _missing_key(error)
+        if key is None:
+            return False
+        placeholder = _placeholder(subschema_at(schema, path + [key]))
+        if placeholder is _MISSING:
+            return False
+        value[key] = placeholder
+        return True
+
+    if kind == "additionalProperties" and error.validator_value is False:
+        allowed = error.schema.get("properties", {})
+        for key in [key for key in value if key not in allowed]:
+            del value[key]
+        return True
+
+    if not path:
+        return False
+
+    if kind == "enum" and isinstance(value, str):
+        wanted = value.strip().lower()
+        for option in error.validator_value:
+            if isinstance(option, str) and option.lower() == wanted:
+                set_at(doc, path, option)
+                return True
+        return False
+
+    if kind == "type":
+        expected = error.validator_value
+        expected = expected if isinstance(expected, list) else [expected]
+        if "array" in expected and isinstance(value, str):
+            set_at(doc, path, [value] if value.strip() else [])
+            return True
+        if "array" in expected and value is None:
+            set_at(doc, path, [])
+            return True
+        if "string" in expected and isinstance(value, (int, float)) and not isinstance(value, bool):
+            set_at(doc, path, str(value))
+            return True
+        if "null" in expected and value == "":
+            set_at(doc, path, None)
+            return True
+    return False
+
+
+def _is_blank_entry(error):
+    """An empty string inside a list of strings, e.g. ``"safety_notes": [""]``."""
+    path = error.absolute_path
+    return (
+        error.validator == "minLength"
+        and error.instance == ""
+        and bool(path)
+        and isinstance(path[-1], int)
+    )
+
+
+def _path_order(path):
+    return [(isinstance(step, str), step) for step in path]
+
+
+def fix_locally(doc, validator, passes=3):
+    """Apply the trivial fixes in place; return the errors that remain."""
+    schema = validator.schema
+    errors = collect_errors(doc, validator)
+    for _ in range(passes):
+        if not errors:
+            break
+        fixed = 0
+        blanks = []
+        for error in errors:
+            if _is_blank_entry(error):
+                blanks.append(list(error.absolute_path))
+            elif _fix(doc, schema, error):
+                fixed += 1
+        # Delete from the end so earlier indexes stay valid
+        for path in sorted(blanks, key=_path_order, reverse=True):
+            del get_at(doc, path[:-1])[path[-1]]
+        fixed += len(blanks)
+        if not fixed:
+            break
+        metrics.inc("schema_repairs_total", fixed, mode="local")
+        errors = collect_errors(doc, validator)
+    return errors
+
+
+def _holds_objects(schema):
+    """True for containers such as a kit section (it holds a list of items)."""
+    return any(
+        "array" in _types(prop) and "object" in _types(prop.get("items", {}))
+        for prop in schema.get("properties", {}).values()
+    )
+
+
+def repair_unit(schema, path):
+    """The smallest self-contained value around ``path`` worth re-asking for.
+
+    That is the innermost list element (a kit item), unless the element is
+    itself a container (a section), in which case only the offending
+    property of it; outside any list it is the top-level property.
+    """
+    for i in range(len(path) - 1, -1, -1):
+        if isinstance(path[i], int):
+            unit = tuple(path[:i + 1])
+            if _holds_objects(subschema_at(schema, unit)) and len(path) > i + 1:
+                return tuple(path[:i + 2])
+            return unit
+    return tuple(path[:1])
+
+
+def failing_parts(doc, schema, errors):
+    """Group errors by repair unit: ``{path: (value, subschema, messages)}``.
+
+    Raises UnrepairableError when an error can only be fixed by replacing
+    the whole document.
+    """
+    parts = {}
+    for error in errors:
+        target = list(error.absolute_path)
+        if error.validator == "required":
+            key = _missing_key(error)
+            if key is not None:
+                target.append(key)
+        unit = repair_unit(schema, target)
+        if not unit:
+            raise UnrepairableError(error.message)
+        value, subschema, messages = parts.setdefault(
+            unit, (get_at(doc, unit), subschema_at(schema, unit), [])
+        )
+        relative = json_pointer(target[len(unit):]) if len(target) > len(unit) else "/"
+        message = f"{relative}: {error.message}"
+        if message not in messages:
+            messages.append(message)
+    # A unit nested inside another unit is covered by its parent
+    return {
+        unit: part for unit, part in parts.items()
+        if not any(other != unit and unit[:len(other)] == other for other in parts)
+    }
@@ -1,120 +1,485 @@
 """Product search service with caching and rate limiting."""
 
+import asyncio
 import datetime
 import json
+import logging
 import os
+import threading
 import time
 
-import requests
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.extensions import once_per_db
+from app.services import metrics, resilience
+from app.services.cache import TTLCache
+from app.services.catalog_service import CATALOG_ENABLED, ProductCatalog
+from app.services.fingerprint_service import FINGERPRINT_ENABLED, FingerprintIndex
+from app.services.http_clients import get_serper_session, per_process_executor, serper_timeout
+from app.services.query_service import canonical_query_key
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SERPER_MAX_RPS = float(os.getenv("SERPER_MAX_RPS", "5"))
+# Entries are served as-is until the soft TTL, served and refreshed in the
+# background until the hard TTL, and deleted by Mongo after that
+SEARCH_CACHE_SOFT_TTL = int(os.getenv("SEARCH_CACHE_SOFT_TTL", "86400"))
+SEARCH_CACHE_HARD_TTL = int(os.getenv("SEARCH_CACHE_HARD_TTL", "604800"))
+SEARCH_REVALIDATE_WORKERS = int(os.getenv("SEARCH_REVALIDATE_WORKERS", "2"))
+SEARCH_MEMORY_TTL = int(os.getenv("SEARCH_MEMORY_TTL", "3600"))
+SEARCH_MEMORY_SIZE = int(os.getenv("SEARCH_MEMORY_SIZE", "2048"))
+SERPER_BATCH_SIZE = int(os.getenv("SERPER_BATCH_SIZE", "100"))
+# Overridable so load tests can point the app at a local stand-in
+SERPER_SHOPPING_URL = os.getenv("SERPER_URL", "https://google.serper.dev/shopping")
+
+
+class RateBudget:
+    """Token bucket shared by every thread and SearchService in the process."""
+
+    def __init__(self, rate_per_sec, burst=None):
+        self.rate = max(rate_per_sec, 0.01)
+        self.capacity = burst or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        """Take a token if one is free; else return seconds until one is."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until one request may be sent; returns seconds waited."""
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def try_acquire(self):
+        """Take a token only if one is free right now."""
+        return not self._take()
+
+    async def acquire_async(self):
+        """Like ``acquire``, but sleeps without blocking the event loop."""
+        waited = 0.0
+        while True:
+            delay = self._take()
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+
+serper_budget = RateBudget(SERPER_MAX_RPS)
+
+# First tier of the search cache; Mongo's search_cache is the second
+memory_cache = TTLCache(maxsize=SEARCH_MEMORY_SIZE, ttl=SEARCH_MEMORY_TTL)
+search_flight = SingleFlight("serper", lease_seconds=15)
+
+# Keys being refreshed in the background, so each is refreshed once
+_revalidating = set()
+_revalidate_lock = threading.Lock()
+
+
+def cache_entry_age(created_at):
+    """Age of a cache entry; Mongo hands back naive UTC datetimes."""
+    if created_at is None:
+        return float("inf")
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (now - created_at).total_seconds()
+
+
+@once_per_db
+def ensure_cache_indexes(db):
+    """Create the search_cache indexes once per process and database."""
+    try:
+        db.search_cache.create_index(
+            "created_at", expireAfterSeconds=SEARCH_CACHE_HARD_TTL
+        )
+    except OperationFailure:
+        # The index was built with another TTL; change it in place
+        db.command(
+            "collMod", "search_cache",
+            index={
+                "keyPattern": {"created_at": 1},
+                "expireAfterSeconds": SEARCH_CACHE_HARD_TTL,
+            },
+        )
+    try:
+        db.search_cache.create_index(
+            [("query", 1), ("source", 1)], unique=True
+        )
+    except OperationFailure as exc:
+        # Older collections may already hold duplicates from racing inserts
+        logger.warning("search_cache unique index unavailable: %s", exc)
+        db.search_cache.create_index([("query", 1), ("source", 1)])
+
+
+def read_memory_cache(keys, source):
+    """``{key: results}`` for the keys held in the in-process tier."""
+    found = {}
+    for key in keys:
+        results = memory_cache.get((key, source))
+        metrics.inc(
+            "cache_requests_total", cache="search_memory",
+            result="hit" if results else "miss",
+        )
+        if results:
+            found[key] = results
+    return found
+
+
+def read_cache_doc(key, source, doc):
+    """(results, "hit" | "stale" | "miss") for a search_cache document.
+
+    Fresh results are promoted to the memory tier, but never for longer
+    than they have left before going stale.
+    """
+    results = doc.get("results")
+    age = cache_entry_age(doc.get("created_at"))
+    if not results or age >= SEARCH_CACHE_HARD_TTL:
+        return None, "miss"
+    if age < SEARCH_CACHE_SOFT_TTL:
+        ttl = min(SEARCH_MEMORY_TTL, SEARCH_CACHE_SOFT_TTL - age)
+        memory_cache.set((key, source), results, ttl=ttl)
+        return results, "hit"
+    return results, "stale"
+
+
+def cache_write_ops(entries, source):
+    """Store ``{key: (results, search_text)}`` in memory; return Mongo upserts."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ops = []
+    for key, (results, search_text) in entries.items():
+        memory_cache.set((key, source), results)
+        ops.append(UpdateOne(
+            {"query": key, "source": source},
+            {"$set": {
+                "results": results,
+                "search_text": search_text,
+                "created_at": now,
+            }},
+            upsert=True,
+        ))
+    return ops
+
+
+def dedupe_titles(results):
+    """Drop results whose title was already seen, keeping the first."""
+    unique_results = []
+    seen_titles = set()
+    for result in results:
+        if result["title"] not in seen_titles:
+            seen_titles.add(result["title"])
+            unique_results.append(result)
+    return unique_results
+
+
+# -- Shared with the async searcher (async_pipeline) --
+
+# search_cache fields read back for a batch of keys
+CACHE_DOC_FIELDS = {"query": 1, "results": 1, "search_text": 1, "created_at": 1, "_id": 0}
+
+
+def query_keys(queries):
+    """Cache key for each query, and ``{key: query text}`` for the distinct keys."""
+    keys = [canonical_query_key(query) for query in queries]
+    texts = {}
+    for key, query in zip(keys, queries):
+        texts.setdefault(key, query)
+    return keys, texts
+
+
+def read_cache_docs(misses, source, docs):
+    """(found, stale) from the search_cache ``docs`` fetched for ``misses``.
+
+    ``found`` maps keys to their results, stale ones included; ``stale``
+    maps the keys due for a background refresh to their query text.
+    """
+    found = {}
+    stale = {}
+    states = {"hit": 0, "stale": 0}
+    for doc in docs:
+        results, state = read_cache_doc(doc["query"], source, doc)
+        if results:
+            found[doc["query"]] = results
+            states[state] += 1
+        if state == "stale":
+            stale[doc["query"]] = doc.get("search_text") or doc["query"]
+    for state, count in states.items():
+        metrics.inc("cache_requests_total", count, cache="search_mongo", result=state)
+    metrics.inc(
+        "cache_requests_total", len(misses) - sum(states.values()),
+        cache="search_mongo", result="miss",
+    )
+    return found, stale
+
+
+def claim_revalidation(texts):
+    """The ``{key: query text}`` entries no one in this process is refreshing yet.
+
+    They count as being refreshed until ``release_revalidation``.
+    """
+    with _revalidate_lock:
+        texts = {key: text for key, text in texts.items() if key not in _revalidating}
+        _revalidating.update(texts)
+    if texts:
+        metrics.inc("search_revalidations_total", len(texts))
+    return texts
+
+
+def release_revalidation(texts):
+    with _revalidate_lock:
+        _revalidating.difference_update(texts)
+
+
+def serper_batches(keys):
+    """``keys`` split into Serper requests of at most SERPER_BATCH_SIZE queries."""
+    return [
+        keys[start:start + SERPER_BATCH_SIZE]
+        for start in range(0, len(keys), SERPER_BATCH_SIZE)
+    ]
+
+
+def serper_payload(queries):
+    return json.dumps([{"q": query} for query in queries])
+
+
+def serper_headers():
+    return {
+        "X-API-KEY": os.getenv("SERPER_API_KEY"),
+        "Content-Type": "application/json",
+    }
+
+
+def check_serper_response(response):
+    """Count a Serper response's status; raise UpstreamError unless it is 200."""
+    metrics.inc("serper_responses_total", status=response.status_code)
+    if response.status_code != 200:
+        raise resilience.UpstreamError(f"Serper API Error {response.status_code}")
+
+
+def parse_shopping(data):
+    """Keep the fields we use from the first 8 shopping results."""
+    return [
+        {
+            "title": item.get("title"),
+            "price": item.get("price"),
+            "img_url": item.get("imageUrl"),
+            "url": item.get("link"),
+            "source": item.get("source", "google_shopping"),
+        }
+        for item in data.get("shopping", [])[:8]
+    ]
+
+
+def parse_shopping_batch(queries, data):
+    """``{query: results}`` from the response to a multi-query request."""
+    if not isinstance(data, list):
+        data = [data]
+    return {query: parse_shopping(entry) for query, entry in zip(queries, data)}
+
+
+def batch_results(texts, batches, responses):
+    """``{key: (results, query text)}`` for the keys their batch returned."""
+    fetched = {}
+    for batch, by_query in zip(batches, responses):
+        for key in batch:
+            if texts[key] in by_query:
+                fetched[key] = (by_query[texts[key]], texts[key])
+    return fetched
+
+
+def report_results(keys, found, on_result):
+    """Call ``on_result(index, results)`` for each query whose key is in ``found``."""
+    if on_result is None:
+        return
+    for index, key in enumerate(keys):
+        if key in found:
+            on_result(index, dedupe_titles(found[key]))
+
+
+def results_for(keys, found):
+    return [dedupe_titles(found.get(key, [])) for key in keys]
 
 
 class SearchService:
     """Searches external shopping APIs and caches results in MongoDB."""
 
-    def __init__(self, mongo_db=None):
+    def __init__(self, mongo_db=None, refresh=False):
         self.db = mongo_db
-        self.last_request_time = 0
+        # refresh=True skips cached reads (results are still written back)
+        self.refresh = refresh
+        self.catalog = None
+        self.fingerprints = None
         if self.db is not None:
-            self.db.search_cache.create_index(
-                "created_at", expireAfterSeconds=86400
-            )
+            ensure_cache_indexes(self.db)
+            if CATALOG_ENABLED:
+                self.catalog = ProductCatalog(self.db)
+            if FINGERPRINT_ENABLED:
+                self.fingerprints = FingerprintIndex(self.db)
 
     # -- Rate limiting & caching helpers --
 
     def _rate_limit(self):
-        """Ensure at least 0.5 s between consecutive API calls."""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < 0.5:
-            time.sleep(0.5 - elapsed)
-        self.last_request_time = time.time()
+        """Wait for a slot in the process-wide Serper rate budget."""
+        waited = serper_budget.acquire()
+        if waited:
+            metrics.inc("rate_limit_sleep_seconds_total", waited, upstream="serper")
+        return waited
 
-    def _get_from_cache(self, query, source):
-        if self.db is not None:
-            result = self.db.search_cache.find_one(
-                {"query": query, "source": source}
-            )
-            if result:
-                return result.get("results")
-        return None
+    def _get_many_from_cache(self, keys, source):
+        """Look up many keys: memory first, then one ``$in`` query to Mongo."""
+        found = read_memory_cache(keys, source)
+        misses = [key for key in keys if key not in found]
+        if misses and self.db is not None:
+            with metrics.span("mongo.search_cache.find"):
+                docs = list(self.db.search_cache.find(
+                    {"query": {"$in": misses}, "source": source}, CACHE_DOC_FIELDS
+                ))
+            stored, stale = read_cache_docs(misses, source, docs)
+            found.update(stored)
+            if stale:
+                self._revalidate(stale)
+        return found
 
-    def _save_to_cache(self, query, source, results):
-        if self.db is None:
+    def _save_many_to_cache(self, entries, source):
+        """Cache ``{key: (results, search_text)}`` with one bulk write."""
+        ops = cache_write_ops(entries, source)
+        if self.db is None or not ops:
             return
-        now = datetime.datetime.now(datetime.timezone.utc)
-        if self.db.search_cache.find_one({"query": query, "source": source}):
-            self.db.search_cache.update_one(
-                {"query": query, "source": source},
-                {"$set": {"results": results, "created_at": now}},
-            )
-        else:
-            self.db.search_cache.insert_one({
-                "query": query,
-                "source": source,
-                "results": results,
-                "created_at": now,
-            })
+        try:
+            with metrics.span("mongo.search_cache.bulk_write"):
+                self.db.search_cache.bulk_write(ops, ordered=False)
+        except PyMongoError as exc:
+            logger.warning("search_cache bulk write failed: %s", exc)
 
     # -- External API calls --
 
-    def _search_google_shopping(self, query):
-        """Fetch shopping results from Google via the Serper API."""
-        self._rate_limit()
-        cached = self._get_from_cache(query, "google_shopping")
-        if cached:
-            return cached
-
-        url = "https://google.serper.dev/shopping"
-        api_key = os.getenv("SERPER_API_KEY")
-
-        payload = json.dumps({"q": query})
-        headers = {
-            "X-API-KEY": api_key,
-            "Content-Type": "application/json",
-        }
+    def _fetch_google_shopping_batch(self, queries):
+        """One Serper request for several queries; returns ``{query: results}``.
 
+        Queries whose batch fails are left out, so they are not cached.
+        """
+        if resilience.serper.is_open():
+            # Fail fast without spending rate budget; callers keep cached results
+            return {}
+        self._rate_limit()
         try:
-            response = requests.post(
-                url, headers=headers, data=payload, timeout=10
-            )
-            if response.status_code != 200:
-                print(f"Serper API Error {response.status_code}")
-                return []
-
-            data = response.json()
-            results = []
-            for item in data.get("shopping", [])[:8]:
-                results.append({
-                    "title": item.get("title"),
-                    "price": item.get("price"),
-                    "img_url": item.get("imageUrl"),
-                    "url": item.get("link"),
-                    "source": item.get("source", "google_shopping"),
-                })
-
-            self._save_to_cache(query, "google_shopping", results)
-            return results
+            with metrics.span("serper_batch"):
+                data = self._post_serper(serper_payload(queries))
+            return parse_shopping_batch(queries, data)
+        except resilience.CircuitOpen:
+            pass
         except Exception as exc:
-            print(f"Serper request failed: {exc}")
+            logger.warning("Serper batch request failed: %s", exc)
+        return {}
+
+    def _post_serper(self, payload):
+        """POST to Serper under the circuit breaker with an adaptive, hedged timeout.
 
-        return []
+        Raises CircuitOpen while Serper is failing and UpstreamError for an
+        error status; a hedge is only sent if the rate budget has a token.
+        """
+        def post(read_timeout):
+            try:
+                response = get_serper_session().post(
+                    SERPER_SHOPPING_URL, headers=serper_headers(),
+                    data=payload, timeout=serper_timeout(read_timeout),
+                )
+            except Exception:
+                metrics.inc("serper_responses_total", status="error")
+                raise
+            check_serper_response(response)
+            return response.json()
+
+        return resilience.serper.call(
+            post, hedge=resilience.SERPER_HEDGE, may_hedge=serper_budget.try_acquire
+        )
 
     # -- Public interface --
 
-    def _search_all_sources(self, query):
-        """Aggregate and deduplicate results across all sources."""
-        unique_results = []
+    def search_many(self, queries, on_result=None):
+        """Search several queries at once; returns one result list per query.
+
+        Cached keys are read with a single ``$in`` query, the misses go to
+        Serper in batches of SERPER_BATCH_SIZE, and new entries are written
+        back in one bulk write, so the round trips do not grow with the
+        number of queries. Misses are coalesced per key with concurrent
+        searches here and in other workers. ``on_result(index, results)``
+        is called for each query as soon as its results are known, cache
+        hits first.
+        """
+        source = "google_shopping"
+        with metrics.span("search_many"):
+            keys, texts = query_keys(queries)
+
+            # While Serper is failing, even a refresh serves what is cached
+            use_cache = not self.refresh or resilience.serper.is_open()
+            found = self._get_many_from_cache(list(texts), source) if use_cache else {}
+            report_results(keys, found, on_result)
+
+            missing = {key: text for key, text in texts.items() if key not in found}
+            if missing:
+                # A refresh must not settle for the cached copy it is replacing
+                fetched = search_flight.do_many(
+                    list(missing),
+                    lambda batch: self.fetch_and_store({key: missing[key] for key in batch}),
+                    db=self.db,
+                    wait_for=None if self.refresh else (
+                        lambda batch: self._get_many_from_cache(batch, source)
+                    ),
+                )
+                found.update(fetched)
+                report_results(keys, {key: found.get(key, []) for key in missing}, on_result)
+            return results_for(keys, found)
+
+    def fetch_and_store(self, texts):
+        """Fetch ``{cache key: query text}`` from Serper and cache the results.
+
+        Returns ``{cache key: results}`` for the queries that succeeded.
+        """
+        source = "google_shopping"
+        batches = serper_batches(list(texts))
+        responses = [
+            self._fetch_google_shopping_batch([texts[key] for key in batch])
+            for batch in batches
+        ]
+        fetched = batch_results(texts, batches, responses)
+
+        self._save_many_to_cache(fetched, source)
+        if self.catalog is not None and fetched:
+            self.catalog.ingest([
+                result for results, _ in fetched.values() for result in results
+            ])
+        return {key: results for key, (results, _) in fetched.items()}
+
+    def _revalidate(self, texts):
+        """Refresh stale ``{cache key: query text}`` entries in the background."""
+        texts = claim_revalidation(texts)
+        if texts:
+            pool = per_process_executor("search-revalidate", SEARCH_REVALIDATE_WORKERS)
+            pool.submit(self._run_revalidation, texts)
+
+    def _run_revalidation(self, texts):
         try:
-            result_list = self._search_google_shopping(query)
-            seen_titles = set()
-            for result in result_list:
-                if result["title"] not in seen_titles:
-                    seen_titles.add(result["title"])
-                    unique_results.append(result)
-            return unique_results
+            self.fetch_and_store(texts)
         except Exception as exc:
-            print(f"Error in _search_all_sources: {exc}")
-            return []
-
-    def search(self, query):
-        """Entry point — returns deduplicated product results."""
-        return self._search_all_sources(query)
\ No newline at end of file
+            logger.warning("Search cache refresh failed: %s", exc)
+        finally:
+            release_revalidation(texts)
\ No newline at end of file
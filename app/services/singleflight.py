@@ -0,0 +1,435 @@
+"""Coalesce identical in-flight upstream calls within and across workers.
+
+Inside a process, concurrent callers for one key wait on a single call.
+Across gunicorn workers, the caller that inserts a lease document into
+``inflight_leases`` makes the call; the others poll the shared cache until
+the result lands, the lease disappears or it expires.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from app.extensions import once_per_db
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_REMOTE = os.getenv("SINGLEFLIGHT_REMOTE", "1") == "1"
+LEASE_POLL_SECONDS = 0.2
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+@once_per_db
+def _ensure_lease_index(db):
+    db.inflight_leases.create_index("expires_at", expireAfterSeconds=0)
+
+
+class _Call:
+    def __init__(self, held=False):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Led through ``hold``, where no result means the caller gave up
+        self.held = held
+
+
+class Held:
+    """What ``hold`` yields: make the call when ``result`` is None."""
+
+    def __init__(self, result=None):
+        self.result = result
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its result."""
+
+    def __init__(self, name, lease_seconds=30):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "saved_local": 0, "saved_remote": 0}
+
+    def do(self, key, fn, db=None, wait_for=None):
+        """Return ``fn()``, sharing one execution among concurrent callers.
+
+        With ``db`` and ``wait_for`` (a cache read returning None on miss),
+        other workers holding the lease are waited on instead of duplicated.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.held and call.result is None:
+                return self.do(key, fn, db, wait_for)
+            self._count("saved_local")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._lead(key, fn, db, wait_for)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def do_many(self, keys, fn, db=None, wait_for=None):
+        """Batch ``do``: ``fn(keys)`` returns ``{key: result}`` for what it fetched.
+
+        Each key is coalesced on its own, so overlapping batches share the
+        keys they have in common: keys already in flight here are waited on,
+        keys leased by another worker are read from ``wait_for(keys)`` (the
+        shared cache, returning ``{key: result}``) once it lands, and only
+        the rest go to ``fn``. Keys that could not be fetched are left out.
+        """
+        led, followed = {}, {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    led[key] = self._calls[key] = _Call()
+                else:
+                    followed[key] = call
+
+        results = {}
+        try:
+            if led:
+                results.update(self._lead_many(list(led), fn, db, wait_for))
+        except BaseException as exc:
+            for call in led.values():
+                call.error = exc
+            raise
+        finally:
+            with self._lock:
+                for key, call in led.items():
+                    call.result = results.get(key)
+                    del self._calls[key]
+            for call in led.values():
+                call.done.set()
+
+        for key, call in followed.items():
+            call.done.wait()
+            self._count("saved_local")
+            if call.result is not None:
+                results[key] = call.result
+        return results
+
+    def _count(self, field):
+        with self._lock:
+            self.stats[field] += 1
+        if field != "calls":
+            metrics.inc("singleflight_saved_total", flight=self.name, scope=field[6:])
+
+    @contextlib.contextmanager
+    def hold(self, key, db=None, wait_for=None):
+        """``do`` for a call the caller makes itself, such as a stream.
+
+        Yields a ``Held``. Its ``result`` is set when a concurrent caller
+        here or in another worker already made the call; otherwise this
+        caller makes it inside the block and sets ``result`` so the
+        callers waiting on it get a copy. Callers whose leader gave up
+        (``result`` left None) make the call themselves.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(held=True)
+
+        if not leader:
+            call.done.wait()
+            if call.result is not None:
+                self._count("saved_local")
+            yield Held(call.result)
+            return
+
+        held = Held()
+        try:
+            with self._lease(key, db, wait_for) as result:
+                held.result = result
+                if result is None:
+                    self._count("calls")
+                yield held
+            call.result = held.result
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _lead(self, key, fn, db, wait_for):
+        with self._lease(key, db, wait_for) as result:
+            if result is not None:
+                return result
+            self._count("calls")
+            return fn()
+
+    @contextlib.contextmanager
+    def _lease(self, key, db, wait_for):
+        """Yield another worker's result for ``key``, or None while we hold its lease."""
+        if db is None or wait_for is None or not SINGLEFLIGHT_REMOTE:
+            yield None
+            return
+
+        lease_id = f"{self.name}:{key}"
+        try:
+            _ensure_lease_index(db)
+            acquired = self._acquire(db, lease_id)
+        except PyMongoError as exc:
+            logger.warning("Singleflight lease unavailable: %s", exc)
+            acquired = None
+
+        if acquired is False:
+            result = self._wait_remote(db, lease_id, wait_for)
+            if result is not None:
+                self._count("saved_remote")
+                yield result
+                return
+
+        try:
+            yield None
+        finally:
+            if acquired:
+                try:
+                    db.inflight_leases.delete_one(
+                        {"_id": lease_id, "owner": self.owner}
+                    )
+                except PyMongoError:
+                    pass
+
+    def _lead_many(self, keys, fn, db, wait_for):
+        if db is None or wait_for is None or not SINGLEFLIGHT_REMOTE:
+            self._count("calls")
+            return fn(keys)
+
+        lease_ids = {key: f"{self.name}:{key}" for key in keys}
+        try:
+            _ensure_lease_index(db)
+            held = self._acquire_many(db, list(lease_ids.values()))
+        except PyMongoError as exc:
+            logger.warning("Singleflight lease unavailable: %s", exc)
+            held = set(lease_ids.values())
+            leased = False
+        else:
+            leased = True
+
+        mine = [key for key in keys if lease_ids[key] in held]
+        others = [key for key in keys if lease_ids[key] not in held]
+        results = {}
+        try:
+            if mine:
+                self._count("calls")
+                results.update(fn(mine))
+            if others:
+                waited = self._wait_remote_many(db, others, lease_ids, wait_for)
+                for _ in waited:
+                    self._count("saved_remote")
+                results.update(waited)
+                rest = [key for key in others if key not in waited]
+                if rest:
+                    self._count("calls")
+                    results.update(fn(rest))
+            return results
+        finally:
+            if leased and held:
+                try:
+                    db.inflight_leases.delete_many(
+                        {"_id": {"$in": list(held)}, "owner": self.owner}
+                    )
+                except PyMongoError:
+                    pass
+
+    def _acquire_many(self, db, lease_ids):
+        """The subset of ``lease_ids`` we now hold; one insert for all of them."""
+        taken = self._insert_leases(db, lease_ids)
+        if taken:
+            # The TTL monitor is lazy, so clear expired leases ourselves
+            cleared = db.inflight_leases.delete_many(
+                {"_id": {"$in": sorted(taken)}, "expires_at": {"$lt": _now()}}
+            )
+            if cleared.deleted_count:
+                taken = self._insert_leases(db, sorted(taken))
+        return set(lease_ids) - taken
+
+    def _insert_leases(self, db, lease_ids):
+        """Insert leases; return the ids another worker already holds."""
+        expires_at = _now() + datetime.timedelta(seconds=self.lease_seconds)
+        try:
+            db.inflight_leases.insert_many(
+                [{"_id": lease_id, "owner": self.owner, "expires_at": expires_at}
+                 for lease_id in lease_ids],
+                ordered=False,
+            )
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            return {lease_ids[error["index"]] for error in errors}
+        return set()
+
+    def _wait_remote_many(self, db, keys, lease_ids, wait_for):
+        """Poll the shared cache for ``keys`` while other workers hold them."""
+        found = {}
+        pending = list(keys)
+        deadline = time.monotonic() + self.lease_seconds
+        while pending and time.monotonic() < deadline:
+            time.sleep(LEASE_POLL_SECONDS)
+            found.update(wait_for(pending))
+            pending = [key for key in pending if key not in found]
+            if not pending:
+                break
+            live = {
+                doc["_id"] for doc in db.inflight_leases.find(
+                    {"_id": {"$in": [lease_ids[key] for key in pending]}}, {"_id": 1}
+                )
+            }
+            gone = [key for key in pending if lease_ids[key] not in live]
+            if gone:
+                # The holder finished; a miss now means it cached nothing
+                found.update(wait_for(gone))
+                pending = [key for key in pending if lease_ids[key] in live]
+        return found
+
+    def _acquire(self, db, lease_id):
+        """True if we now hold the lease, False if another worker does."""
+        lease = {
+            "_id": lease_id,
+            "owner": self.owner,
+            "expires_at": _now() + datetime.timedelta(seconds=self.lease_seconds),
+        }
+        try:
+            db.inflight_leases.insert_one(lease)
+            return True
+        except DuplicateKeyError:
+            # The TTL monitor is lazy, so clear an expired lease ourselves
+            cleared = db.inflight_leases.delete_one(
+                {"_id": lease_id, "expires_at": {"$lt": _now()}}
+            )
+            if not cleared.deleted_count:
+                return False
+        try:
+            db.inflight_leases.insert_one(lease)
+            return True
+        except DuplicateKeyError:
+            return False
+
+    def _wait_remote(self, db, lease_id, wait_for):
+        """Poll the shared cache while another worker holds the lease."""
+        deadline = time.monotonic() + self.lease_seconds
+        while time.monotonic() < deadline:
+            time.sleep(LEASE_POLL_SECONDS)
+            result = wait_for()
+            if result is not None:
+                return result
+            if db.inflight_leases.find_one({"_id": lease_id}, {"_id": 1}) is None:
+                # The holder finished without caching (e.g. upstream error)
+                return wait_for()
+        return None
+
+
+# What an async hold resolves to when its leader made no call
+_GAVE_UP = object()
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop (in-process only).
+
+    Async callers coalesce among themselves; across workers they rely on
+    the shared caches the sync path writes to.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}
+        self.stats = {"calls": 0, "saved_local": 0}
+
+    async def do(self, key, fn):
+        """Await ``fn()``, sharing one run among concurrent callers."""
+        task = self._tasks.get(key)
+        if task is None:
+            self.stats["calls"] += 1
+            task = self._tasks[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.stats["saved_local"] += 1
+            metrics.inc("singleflight_saved_total", flight=self.name, scope="local")
+        # A cancelled caller must not cancel the call others are waiting on
+        result = await asyncio.shield(task)
+        if result is _GAVE_UP:
+            return await self.do(key, fn)
+        return result
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        """Async ``SingleFlight.hold``."""
+        task = self._tasks.get(key)
+        if task is not None:
+            try:
+                result = await asyncio.shield(task)
+            except Exception:
+                result = None
+            if result is _GAVE_UP:
+                result = None
+            if result is not None:
+                self.stats["saved_local"] += 1
+                metrics.inc("singleflight_saved_total", flight=self.name, scope="local")
+            yield Held(result)
+            return
+
+        self.stats["calls"] += 1
+        future = self._tasks[key] = asyncio.get_running_loop().create_future()
+        held = Held()
+        try:
+            yield held
+        finally:
+            if self._tasks.get(key) is future:
+                del self._tasks[key]
+            future.set_result(_GAVE_UP if held.result is None else held.result)
+
+    async def do_many(self, keys, fn):
+        """Batch ``do``: ``await fn(keys)`` returns ``{key: result}``.
+
+        Keys already in flight are awaited and only the rest go to ``fn``,
+        so overlapping batches share the keys they have in common. Keys
+        that could not be fetched are left out.
+        """
+        keys = list(dict.fromkeys(keys))
+        tasks = {key: self._tasks[key] for key in keys if key in self._tasks}
+        if tasks:
+            self.stats["saved_local"] += len(tasks)
+            metrics.inc("singleflight_saved_total", len(tasks), flight=self.name, scope="local")
+        led = [key for key in keys if key not in tasks]
+        if led:
+            self.stats["calls"] += 1
+            batch = asyncio.ensure_future(fn(led))
+            for key in led:
+                task = tasks[key] = self._tasks[key] = asyncio.ensure_future(
+                    self._pick(batch, key)
+                )
+                task.add_done_callback(lambda _, key=key: self._tasks.pop(key, None))
+        results = await asyncio.shield(asyncio.gather(*tasks.values()))
+        return {key: result for key, result in zip(tasks, results) if result is not None}
+
+    @staticmethod
+    async def _pick(batch, key):
+        return (await batch).get(key)
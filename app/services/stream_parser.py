@@ -0,0 +1,163 @@
+"""Incremental JSON scanning for streamed LLM completions.
+
+The scanner tracks where it is in the document (object keys and array
+indexes) as characters arrive, so complete objects at a chosen path can
+be parsed and handed on before the rest of the document exists.
+"""
+
+import json
+
+
+class _Frame:
+    """One open object or array, and where it started in the buffer."""
+
+    __slots__ = ("kind", "start", "key", "index", "expect_key")
+
+    def __init__(self, kind, start):
+        self.kind = kind
+        self.start = start
+        self.key = None
+        self.index = 0
+        self.expect_key = kind == "{"
+
+
+class StreamingJSONScanner:
+    """Feed text chunks; get back the objects completed at ``path``.
+
+    ``path`` is a tuple of keys and ``"*"`` (any array index), e.g.
+    ``("sections", "*", "items", "*")``. Each completed match is returned
+    as ``(indexes, value)``, where ``indexes`` are the array positions that
+    ``"*"`` matched. Text before the first ``{`` is ignored, so a model
+    that prefixes its JSON with prose still streams; a braced span in that
+    prose which does not parse is skipped and the next ``{`` is tried.
+    """
+
+    def __init__(self, path):
+        self.path = tuple(path)
+        self._text = ""
+        self._stack = []
+        self._root_start = None
+        self._root_end = None
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+
+    def feed(self, chunk):
+        """Scan ``chunk`` and return the list of newly completed matches."""
+        offset = len(self._text)
+        self._text += chunk
+        completed = []
+
+        for pos, ch in enumerate(chunk, offset):
+            if self._root_end is not None:
+                break
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    frame = self._stack[-1] if self._stack else None
+                    if frame is not None and frame.kind == "{" and frame.expect_key:
+                        frame.key = json.loads(self._text[self._string_start:pos + 1])
+                continue
+
+            if not self._stack and self._root_start is None and ch != "{":
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in "{[":
+                if self._root_start is None:
+                    self._root_start = pos
+                self._stack.append(_Frame(ch, pos))
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                frame = self._stack.pop()
+                if not self._stack:
+                    if self._parses(self._root_start, pos + 1):
+                        self._root_end = pos + 1
+                    else:
+                        # Braces in leading prose, not the document
+                        self._root_start = None
+                elif ch == "}" and self._matches():
+                    try:
+                        value = json.loads(self._text[frame.start:pos + 1])
+                    except ValueError:
+                        # Malformed fragment; the final parse will report it
+                        continue
+                    completed.append((self._indexes(), value))
+            elif ch == ":":
+                if self._stack and self._stack[-1].kind == "{":
+                    self._stack[-1].expect_key = False
+            elif ch == ",":
+                frame = self._stack[-1] if self._stack else None
+                if frame is None:
+                    continue
+                if frame.kind == "{":
+                    frame.expect_key = True
+                else:
+                    frame.index += 1
+        return completed
+
+    def _parses(self, start, end):
+        try:
+            json.loads(self._text[start:end])
+        except ValueError:
+            return False
+        return True
+
+    def _steps(self):
+        """The path to the value currently being closed, one step per frame."""
+        return [
+            frame.key if frame.kind == "{" else frame.index
+            for frame in self._stack
+        ]
+
+    def _matches(self):
+        steps = self._steps()
+        if len(steps) != len(self.path):
+            return False
+        return all(
+            isinstance(step, int) if want == "*" else step == want
+            for step, want in zip(steps, self.path)
+        )
+
+    def _indexes(self):
+        return tuple(
+            step for step, want in zip(self._steps(), self.path) if want == "*"
+        )
+
+    def document(self):
+        """The JSON text received so far, trimmed to the root value."""
+        if self._root_start is None:
+            return self._text
+        return self._text[self._root_start:self._root_end]
+
+
+class KitItemParser:
+    """Emits each ``sections[].items[]`` object of a streamed kit.
+
+    Items that fail ``validator`` (the kit schema's item sub-schema) are
+    held back; they still arrive with the final, fully validated kit.
+    """
+
+    PATH = ("sections", "*", "items", "*")
+
+    def __init__(self, validator=None):
+        self.scanner = StreamingJSONScanner(self.PATH)
+        self.validator = validator
+
+    def feed(self, chunk):
+        """Return ``("item", section_idx, item_idx, item)`` events."""
+        events = []
+        for (section_idx, item_idx), item in self.scanner.feed(chunk):
+            if self.validator is not None and not self.validator.is_valid(item):
+                continue
+            events.append(("item", section_idx, item_idx, item))
+        return events
+
+    def document(self):
+        return self.scanner.document()
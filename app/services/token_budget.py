@@ -0,0 +1,123 @@
+"""Prompt token estimates, history compaction and per-stage token counts.
+
+Tokens are estimated locally at about four characters each, which is
+close enough to budget English prompts without the model's tokenizer.
+Conversation history is fitted to PROMPT_HISTORY_TOKENS newest first:
+recent messages are kept (long ones clipped) and older ones collapse into
+a one-line note. The prompt and completion counts Groq reports for each
+call are added to ``llm_tokens_total`` and to the running kit's usage.
+"""
+
+import contextvars
+import math
+import os
+import threading
+
+from app.services import metrics
+
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "800"))
+HISTORY_MESSAGE_TOKENS = int(os.getenv("HISTORY_MESSAGE_TOKENS", "250"))
+CHARS_PER_TOKEN = 4
+
+# Per-stage token counts for the kit being built (None outside a pipeline run)
+_usage = contextvars.ContextVar("kartwise_token_usage", default=None)
+_usage_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+    """Rough token count for ``text``."""
+    if not text:
+        return 0
+    return math.ceil(len(str(text)) / CHARS_PER_TOKEN)
+
+
+def clip(text, max_tokens):
+    """``text`` cut to about ``max_tokens`` at a word boundary."""
+    limit = max(max_tokens, 1) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + " ..."
+
+
+# -- History --
+
+
+def _history_line(message, max_tokens):
+    role = message.get("role", "user")
+    content = str(message.get("content", ""))
+    return f"{role.upper()}: {clip(content, max_tokens)}\n"
+
+
+def compact_history(history_list, budget=None):
+    """``ROLE: content`` lines for the conversation, within ``budget`` tokens.
+
+    The newest message is always kept; earlier ones are kept while they
+    fit, and the rest are replaced by a note saying how many were left out.
+    """
+    budget = PROMPT_HISTORY_TOKENS if budget is None else budget
+    messages = list(history_list or [])
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        line = _history_line(message, HISTORY_MESSAGE_TOKENS)
+        cost = estimate_tokens(line)
+        if used + cost > budget:
+            if not kept:
+                kept.append(_history_line(message, budget))
+            break
+        kept.append(line)
+        used += cost
+
+    dropped = len(messages) - len(kept)
+    if dropped:
+        metrics.inc("history_messages_dropped_total", dropped)
+        kept.append(f"[{dropped} earlier messages omitted]\n")
+    return "".join(reversed(kept))
+
+
+# -- Usage --
+
+
+def start_usage():
+    """Begin counting tokens for the current kit; returns the running counts.
+
+    Threads started with ``metrics.bind_context`` and asyncio tasks share
+    the same counts.
+    """
+    usage = {}
+    _usage.set(usage)
+    return usage
+
+
+def record(stage, prompt_tokens, completion_tokens):
+    """Count one completion's tokens against ``stage``."""
+    stage = stage or "other"
+    metrics.inc("llm_tokens_total", prompt_tokens, stage=stage, kind="prompt")
+    metrics.inc("llm_tokens_total", completion_tokens, stage=stage, kind="completion")
+    usage = _usage.get()
+    if usage is None:
+        return
+    with _usage_lock:
+        counts = usage.setdefault(
+            stage, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+        counts["calls"] += 1
+        counts["prompt_tokens"] += prompt_tokens
+        counts["completion_tokens"] += completion_tokens
+
+
+def record_usage(stage, usage, prompts, completion):
+    """Record Groq's reported ``usage``, or an estimate when it has none."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens is None or completion_tokens is None:
+        metrics.inc("llm_token_estimates_total", stage=stage or "other")
+        prompt_tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+        completion_tokens = estimate_tokens(completion)
+    record(stage, prompt_tokens, completion_tokens)
+
+
+def chunk_usage(chunk):
+    """Usage carried by a streamed chunk (Groq sends it on the last one)."""
+    x_groq = getattr(chunk, "x_groq", None)
+    return getattr(chunk, "usage", None) or getattr(x_groq, "usage", None)
@@ -29,42 +29,19 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             try {
-                const res = await fetch('/api/kit/generate', {
+                const res = await fetch('/api/kit/generate/stream', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({ style: query, history: chatHistory })
                 });
 
-                const payload = await res.json();
-                console.log("DEBUG Payload:", payload);
-
-                // 3. Hide Loading
-                if (loadingBubble) loadingBubble.classList.add('d-none');
-
-                if (!res.ok) throw new Error(payload.error || 'API failed');
-
-                // --- ROBUST LOGIC FOR SES ENVIRONMENTS ---
-                
-                // Case A: Questions (Clarification)
-                if (payload.type === 'questions') {
-                    // Safety check for data
-                    const qData = payload.data || payload.questions || [];
-                    handleClarification(qData);
-                    
-                    // Save to history (JSON stringify is safe)
-                    chatHistory.push({ role: 'ai', content: JSON.stringify(qData) });
-                } 
-                // Case B: Final Kit
-                else if (payload.type === 'final_kit' || payload.sections) {
-                    addMessage('ai', payload.summary || "Here is your kit:");
-                    renderFullKit(payload);
-                    chatHistory = []; 
-                }
-                // Case C: Fallback
-                else {
-                    addMessage('ai', payload.response || "I received data but I'm not sure how to display it.");
+                if (!res.ok || !res.body) {
+                    const errPayload = await res.json().catch(() => ({}));
+                    throw new Error(errPayload.error || 'API failed');
                 }
 
+                await readEventStream(res.body, handleStreamEvent);
+
             } catch (err) {
                 console.error("Pipeline Error:", err);
                 if (loadingBubble) loadingBubble.classList.add('d-none');
@@ -73,6 +50,93 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // --- Streaming ---
+
+    let kitCounter = 0;
+    let activeKitId = null;
+
+    // Events after which the server sends nothing more
+    const FINAL_EVENTS = ['questions', 'final_kit', 'error'];
+
+    async function readEventStream(body, onEvent) {
+        const reader = body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finished = false;
+
+        while (true) {
+            const chunk = await reader.read();
+            if (chunk.done) break;
+            buffer += decoder.decode(chunk.value, { stream: true });
+
+            // SSE frames are separated by a blank line
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                const parsed = parseFrame(frame);
+                if (parsed) {
+                    if (FINAL_EVENTS.indexOf(parsed.event) !== -1) finished = true;
+                    onEvent(parsed.event, parsed.data);
+                }
+                boundary = buffer.indexOf('\n\n');
+            }
+        }
+
+        // The stream closed early (worker restart, proxy timeout)
+        if (!finished) {
+            onEvent('error', { error: "The connection closed before the kit was ready. Please try again." });
+        }
+    }
+
+    function parseFrame(frame) {
+        let event = 'message';
+        let data = '';
+        const lines = frame.split('\n');
+        for (let i = 0; i < lines.length; i++) {
+            if (lines[i].indexOf('event: ') === 0) event = lines[i].slice(7);
+            else if (lines[i].indexOf('data: ') === 0) data += lines[i].slice(6);
+        }
+        if (!data) return null;
+        return { event: event, data: JSON.parse(data) };
+    }
+
+    function handleStreamEvent(event, data) {
+        if (event === 'questions') {
+            if (loadingBubble) loadingBubble.classList.add('d-none');
+            handleClarification(data);
+            chatHistory.push({ role: 'ai', content: JSON.stringify(data) });
+        }
+        else if (event === 'kit_outline') {
+            kitCounter += 1;
+            activeKitId = 'kit' + kitCounter;
+            addMessage('ai', data.summary || "Here is your kit:");
+            renderFullKit(data, activeKitId);
+        }
+        else if (event === 'item') {
+            updateKitItem(activeKitId, data);
+        }
+        else if (event === 'final_kit') {
+            if (loadingBubble) loadingBubble.classList.add('d-none');
+            chatHistory = [];
+        }
+        else if (event === 'error') {
+            if (loadingBubble) loadingBubble.classList.add('d-none');
+            addMessage('ai', "⚠️ " + (data.error || "Something went wrong."));
+        }
+    }
+
+    function updateKitItem(kitId, data) {
+        const card = document.querySelector(
+            '[data-kit-card="' + kitId + '-' + data.section + '-' + data.index + '"]'
+        );
+        if (!card) return;
+
+        if (data.img_url) card.querySelector('.kit-img').src = data.img_url;
+        if (data.price) card.querySelector('.kit-price').textContent = data.price;
+        if (data.buy_url) card.querySelector('.kit-link').href = data.buy_url;
+    }
+
     // --- Helper Functions ---
 
     function scrollToBottom() {
@@ -122,7 +186,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    function renderFullKit(data) {
+    function renderFullKit(data, kitId) {
         if (!data.sections) return;
         
         let fullHtml = "";
@@ -139,17 +203,19 @@ document.addEventListener('DOMContentLoaded', () => {
                 const price = item.price || 'Check Price';
                 const link = item.buy_url || item.link || '#';
                 
+                const cardKey = kitId ? `${kitId}-${s}-${i}` : '';
+                
                 gridItems += `
-                <div class="col-6 col-md-4">
+                <div class="col-6 col-md-4" data-kit-card="${cardKey}">
                     <div class="card h-100 border shadow-sm">
                         <div class="card-img-top p-3 d-flex align-items-center justify-content-center" style="height: 120px;">
-                            <img src="${img}" class="img-fluid" style="max-height: 100%; object-fit: contain;">
+                            <img src="${img}" class="img-fluid kit-img" style="max-height: 100%; object-fit: contain;">
                         </div>
                         <div class="card-body p-2">
                             <h6 class="card-title text-truncate fw-bold small">${item.name}</h6>
                             <div class="d-flex justify-content-between align-items-center mt-1">
-                                <span class="text-primary small fw-bold">${price}</span>
-                                <a href="${link}" target="_blank" class="btn btn-sm btn-outline-dark rounded-circle"><i class="bi bi-arrow-up-right"></i></a>
+                                <span class="text-primary small fw-bold kit-price">${price}</span>
+                                <a href="${link}" target="_blank" class="btn btn-sm btn-outline-dark rounded-circle kit-link"><i class="bi bi-arrow-up-right"></i></a>
                             </div>
                         </div>
                     </div>
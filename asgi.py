@@ -0,0 +1,64 @@
+"""ASGI entry point: the async kit route, with the Flask app behind it.
+
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker --workers 2
+
+``POST /api/kit/generate`` runs the asyncio pipeline on the worker's event
+loop (see app/routes/kit_async.py); every other request goes to the
+unchanged Flask app through asgiref's WSGI adapter. ``wsgi:app`` keeps
+serving the whole app from sync workers.
+"""
+
+import asyncio
+import contextvars
+import logging
+
+from asgiref.wsgi import WsgiToAsgi
+from pymongo.errors import PyMongoError
+
+from app import create_app
+from app.extensions import mongo
+from app.routes import kit_async
+from app.services.async_pipeline import close_async_db, ensure_indexes
+from app.services.http_clients import close_async_clients
+
+logger = logging.getLogger(__name__)
+
+flask_app = create_app()
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # The async code never creates indexes, so make them once here
+            try:
+                with flask_app.app_context():
+                    ensure_indexes(mongo.db)
+            except PyMongoError as exc:
+                logger.warning("Index creation failed: %s", exc)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_clients()
+            await close_async_db()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _dispatch(scope, receive, send):
+    if kit_async.handles(scope):
+        await kit_async.generate(flask_app, scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    # Each request runs in an empty context. uvicorn starts a pipelined
+    # keep-alive request from inside the previous response's send(), which
+    # WsgiToAsgi calls with asgiref's per-thread executor still set; a copy
+    # of that context makes the next WSGI request fail with
+    # "CurrentThreadExecutor already quit or is broken".
+    await contextvars.Context().run(asyncio.ensure_future, _dispatch(scope, receive, send))
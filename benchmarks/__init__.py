@@ -0,0 +1 @@
+"""Offline measurement tools; run modules with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,117 @@
+"""Concurrent kit load: sync workers versus the asyncio pipeline.
+
+Usage:
+    python -m benchmarks.async_load --kits 200 --llm-latency 1.5 --serper-latency 0.4
+
+The sync side models gunicorn sync workers: ``--sync-workers`` kits run
+at a time, each through ``run_lab_pipeline``, and the rest queue. The
+async side starts every kit at once with ``run_lab_pipeline_async`` on
+one event loop, as a single ASGI worker would. Groq, Serper and Mongo are
+the offline fakes from benchmarks.fakes, with the latencies given.
+Latency is measured from when all kits were submitted, queueing included.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import AsyncInMemoryDB, FakeGroq, FakeSerperSession, InMemoryDB
+
+from app.extensions import mongo
+from app.services import async_pipeline, llm_service, orchestrator, search_service
+
+USER_INPUT = "$300 home office setup, request"
+
+
+def summarize(mode, latencies, wall):
+    ordered = sorted(latencies)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "mode": mode,
+        "kits": len(ordered),
+        "wall_s": round(wall, 2),
+        "kits_per_sec": round(len(ordered) / wall, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(ordered[p95_index] * 1000, 1),
+    }
+
+
+def reset_state():
+    mongo.db = InMemoryDB()
+    search_service.memory_cache.clear()
+    search_service.ensure_cache_indexes.done.clear()
+    llm_service.response_cache.clear()
+
+
+def run_sync(args):
+    reset_state()
+    started = time.perf_counter()
+
+    def one(index):
+        orchestrator.run_lab_pipeline(f"{USER_INPUT} {index}")
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=args.sync_workers) as pool:
+        latencies = list(pool.map(one, range(args.kits)))
+    return summarize(f"sync x{args.sync_workers}", latencies, time.perf_counter() - started)
+
+
+def run_async(args):
+    reset_state()
+    db = AsyncInMemoryDB(mongo.db)
+    async_pipeline.ensure_indexes(mongo.db)
+
+    async def main():
+        started = time.perf_counter()
+
+        async def one(index):
+            await async_pipeline.run_lab_pipeline_async(f"{USER_INPUT} {index}", db=db)
+            return time.perf_counter() - started
+
+        latencies = await asyncio.gather(*(one(index) for index in range(args.kits)))
+        return summarize("async", latencies, time.perf_counter() - started)
+
+    return asyncio.run(main())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kits", type=int, default=100,
+                        help="kits in flight at once")
+    parser.add_argument("--items", type=int, default=15, help="items per kit")
+    parser.add_argument("--sync-workers", type=int, default=2,
+                        help="concurrent kits on the sync side (gunicorn --workers)")
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--serper-latency", type=float, default=0.3)
+    parser.add_argument("--serper-rps", type=float, default=0.0,
+                        help="Serper rate budget (0 = unlimited)")
+    args = parser.parse_args(argv)
+
+    # Every kit should pay for its own completions
+    llm_service.LLM_CACHE_DISABLED = True
+    async_pipeline.LLM_CACHE_DISABLED = True
+    search_service.serper_budget = search_service.RateBudget(
+        args.serper_rps or 1e9, burst=None if args.serper_rps else 1e9
+    )
+    async_pipeline.serper_budget = search_service.serper_budget
+
+    groq = FakeGroq(item_count=args.items, latency=args.llm_latency)
+    groq.install(llm_service)
+    groq.install_async(async_pipeline)
+    serper = FakeSerperSession(latency=args.serper_latency)
+    serper.install(search_service)
+    serper.install_async(async_pipeline)
+
+    print(f"{'mode':<12}{'kits':>6}{'wall s':>9}{'kits/s':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    for run in (run_sync, run_async):
+        stats = run(args)
+        print(
+            f"{stats['mode']:<12}{stats['kits']:>6}{stats['wall_s']:>9}"
+            f"{stats['kits_per_sec']:>9}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,698 @@
+"""Offline stand-ins for Mongo, Groq and Serper used by the benchmark tools.
+
+``InMemoryDB`` implements only the slice of the pymongo API this app uses
+(queries with the common operators, upserts, bulk writes, unique indexes
+and a few aggregation stages). It is a measurement aid, not a database.
+"""
+
+import asyncio
+import copy
+import datetime
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+# -- Mongo --
+
+
+def _bson(value):
+    """Store datetimes the way pymongo returns them: naive UTC."""
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if isinstance(value, dict):
+        return {key: _bson(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_bson(item) for item in value]
+    return value
+
+
+_MISSING = object()
+
+
+def _get_path(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part, {})
+    doc.pop(parts[-1], None)
+
+
+def _compare(op, value, arg):
+    if op == "$in":
+        if isinstance(value, list):
+            return any(item in arg for item in value)
+        return value in arg
+    if op == "$nin":
+        return not _compare("$in", value, arg)
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$ne":
+        return value != arg
+    if op == "$eq":
+        return value == arg
+    if value is _MISSING or value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > arg
+        if op == "$gte":
+            return value >= arg
+        if op == "$lt":
+            return value < arg
+        if op == "$lte":
+            return value <= arg
+    except TypeError:
+        return False
+    raise NotImplementedError(f"query operator {op}")
+
+
+def matches(doc, query):
+    """True when ``doc`` satisfies a (subset of) MongoDB query."""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        value = _get_path(doc, key)
+        if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+            for op, arg in condition.items():
+                if not _compare(op, value, _bson(arg)):
+                    return False
+        elif isinstance(value, list) and not isinstance(condition, list):
+            if _bson(condition) not in value:
+                return False
+        elif value is _MISSING:
+            if condition is not None:
+                return False
+        elif value != _bson(condition):
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {k: doc[k] for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+def _sort_docs(docs, spec):
+    # Apply keys right-to-left so each direction is honoured (stable sort)
+    for field, direction in reversed(spec):
+        present = [d for d in docs if _get_path(d, field) not in (_MISSING, None)]
+        absent = [d for d in docs if _get_path(d, field) in (_MISSING, None)]
+        present.sort(key=lambda d: _get_path(d, field), reverse=direction < 0)
+        docs = absent + present if direction > 0 else present + absent
+    return docs
+
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list)
+
+
+class FakeCursor:
+    def __init__(self, docs, projection):
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._docs = _sort_docs(self._docs, _normalize_sort(key_or_list, direction))
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        for doc in docs:
+            yield _project(copy.deepcopy(doc), self._projection)
+
+
+def _eval_expr(doc, expr):
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get_path(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, dict):
+        (op, arg), = expr.items()
+        if op == "$size":
+            return len(_eval_expr(doc, arg) or [])
+        if op == "$setIntersection":
+            first, second = (_eval_expr(doc, a) or [] for a in arg)
+            return [item for item in dict.fromkeys(first) if item in second]
+        raise NotImplementedError(f"expression {op}")
+    if isinstance(expr, list):
+        return [_eval_expr(doc, item) for item in expr]
+    return expr
+
+
+class FakeCollection:
+    def __init__(self, name):
+        self.name = name
+        self._docs = {}
+        self._unique = []
+        self._lock = threading.RLock()
+
+    # -- Indexes --
+
+    def create_index(self, keys, unique=False, sparse=False, **kwargs):
+        fields = tuple(field for field, _ in _normalize_sort(keys))
+        if unique:
+            with self._lock:
+                if (fields, sparse) not in self._unique:
+                    self._unique.append((fields, sparse))
+        return "_".join(fields)
+
+    def _check_unique(self, doc):
+        for fields, sparse in self._unique:
+            values = tuple(_get_path(doc, f) for f in fields)
+            if sparse and all(v is _MISSING for v in values):
+                continue
+            for other in self._docs.values():
+                if other["_id"] == doc["_id"]:
+                    continue
+                if tuple(_get_path(other, f) for f in fields) == values:
+                    raise DuplicateKeyError(f"E11000 duplicate key {fields}")
+
+    # -- Reads --
+
+    def _select(self, query):
+        return [doc for doc in self._docs.values() if matches(doc, query or {})]
+
+    def find_one(self, query=None, projection=None, sort=None):
+        with self._lock:
+            docs = self._select(query)
+            if sort:
+                docs = _sort_docs(docs, _normalize_sort(sort))
+            if not docs:
+                return None
+            return _project(copy.deepcopy(docs[0]), projection)
+
+    def find(self, query=None, projection=None):
+        with self._lock:
+            return FakeCursor(self._select(query), projection)
+
+    def count_documents(self, query):
+        with self._lock:
+            return len(self._select(query))
+
+    def estimated_document_count(self):
+        return len(self._docs)
+
+    def aggregate(self, pipeline):
+        with self._lock:
+            docs = [copy.deepcopy(doc) for doc in self._docs.values()]
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                docs = [doc for doc in docs if matches(doc, arg)]
+            elif op in ("$addFields", "$set"):
+                for doc in docs:
+                    for field, expr in arg.items():
+                        doc[field] = _eval_expr(doc, expr)
+            elif op == "$sort":
+                docs = _sort_docs(docs, list(arg.items()))
+            elif op == "$limit":
+                docs = docs[:arg]
+            elif op == "$skip":
+                docs = docs[arg:]
+            elif op == "$project":
+                docs = [_project(doc, arg) for doc in docs]
+            else:
+                raise NotImplementedError(f"aggregation stage {op}")
+        return iter(docs)
+
+    # -- Writes --
+
+    def insert_one(self, doc):
+        with self._lock:
+            doc.setdefault("_id", ObjectId())
+            stored = _bson(copy.deepcopy(doc))
+            if stored["_id"] in self._docs:
+                raise DuplicateKeyError("E11000 duplicate key _id")
+            self._check_unique(stored)
+            self._docs[stored["_id"]] = stored
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    def insert_many(self, docs, ordered=True):
+        inserted, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                inserted.append(self.insert_one(doc).inserted_id)
+            except DuplicateKeyError as exc:
+                errors.append({"index": index, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def _apply_update(self, doc, update, inserting):
+        for op, fields in update.items():
+            for path, value in fields.items():
+                value = _bson(copy.deepcopy(value))
+                if op == "$set" or (op == "$setOnInsert" and inserting):
+                    _set_path(doc, path, value)
+                elif op == "$unset":
+                    _unset_path(doc, path)
+                elif op == "$inc":
+                    current = _get_path(doc, path)
+                    _set_path(doc, path, (0 if current is _MISSING else current) + value)
+                elif op == "$max":
+                    current = _get_path(doc, path)
+                    if current is _MISSING or value > current:
+                        _set_path(doc, path, value)
+                elif op == "$push":
+                    current = _get_path(doc, path)
+                    _set_path(doc, path, ([] if current is _MISSING else current) + [value])
+                elif op != "$setOnInsert":
+                    raise NotImplementedError(f"update operator {op}")
+
+    def _update(self, query, update, upsert, many=False):
+        with self._lock:
+            targets = self._select(query)
+            if not many:
+                targets = targets[:1]
+            for doc in targets:
+                updated = copy.deepcopy(doc)
+                self._apply_update(updated, update, inserting=False)
+                self._check_unique(updated)
+                self._docs[doc["_id"]] = updated
+            if targets or not upsert:
+                return SimpleNamespace(
+                    matched_count=len(targets), modified_count=len(targets),
+                    upserted_id=None,
+                ), (targets[0]["_id"] if targets else None)
+            doc = {
+                key: _bson(value) for key, value in query.items()
+                if not key.startswith("$") and not isinstance(value, dict)
+            }
+            doc.setdefault("_id", ObjectId())
+            self._apply_update(doc, update, inserting=True)
+            self._check_unique(doc)
+            self._docs[doc["_id"]] = doc
+            return SimpleNamespace(
+                matched_count=0, modified_count=0, upserted_id=doc["_id"]
+            ), doc["_id"]
+
+    def update_one(self, query, update, upsert=False):
+        return self._update(query, update, upsert)[0]
+
+    def update_many(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=True)[0]
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        with self._lock:
+            before = self.find_one(query)
+            _result, doc_id = self._update(query, update, upsert)
+            if return_document == ReturnDocument.AFTER and doc_id is not None:
+                return _project(copy.deepcopy(self._docs[doc_id]), projection)
+            return _project(before, projection) if before else None
+
+    def delete_one(self, query):
+        with self._lock:
+            docs = self._select(query)[:1]
+            for doc in docs:
+                del self._docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(docs))
+
+    def delete_many(self, query):
+        with self._lock:
+            docs = self._select(query)
+            for doc in docs:
+                del self._docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(docs))
+
+    def bulk_write(self, requests, ordered=True):
+        upserted = 0
+        for request in requests:
+            if isinstance(request, UpdateOne):
+                result = self.update_one(
+                    request._filter, request._doc, upsert=request._upsert
+                )
+                upserted += result.upserted_id is not None
+            elif isinstance(request, InsertOne):
+                self.insert_one(request._doc)
+            else:
+                raise NotImplementedError(type(request).__name__)
+        return SimpleNamespace(upserted_count=upserted)
+
+    def drop(self):
+        with self._lock:
+            self._docs.clear()
+
+
+class InMemoryDB:
+    """Dict of FakeCollections reachable as attributes, like a pymongo Database."""
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name)
+            return self._collections[name]
+
+    def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+
+class AsyncFakeCursor:
+    """pymongo AsyncCursor over a FakeCursor (or any iterable of docs)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, key_or_list, direction=None):
+        self._cursor.sort(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._cursor.skip(count)
+        return self
+
+    def limit(self, count):
+        self._cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        docs = list(self._cursor)
+        return docs[:length] if length else docs
+
+
+class AsyncFakeCollection:
+    """Awaitable view of a FakeCollection, shaped like pymongo's AsyncCollection."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, query=None, projection=None):
+        return AsyncFakeCursor(self._collection.find(query, projection))
+
+    async def aggregate(self, pipeline):
+        return AsyncFakeCursor(self._collection.aggregate(pipeline))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncInMemoryDB:
+    """AsyncDatabase-shaped view of an InMemoryDB; both see the same data."""
+
+    def __init__(self, db=None):
+        self.sync = db if db is not None else InMemoryDB()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return AsyncFakeCollection(self.sync[name])
+
+    def __getitem__(self, name):
+        return AsyncFakeCollection(self.sync[name])
+
+
+# -- Groq --
+
+ITEM_NOUNS = [
+    "Safety Goggles", "Nitrile Gloves", "USB-C Cable", "Extension Cord",
+    "LED Desk Lamp", "Laptop Stand", "Ergonomic Chair", "Surge Protector",
+    "First Aid Kit", "Fire Extinguisher", "Cable Ties", "Label Maker",
+    "Webcam", "Wireless Mouse", "Mechanical Keyboard", "Monitor Arm",
+    "Power Strip", "Headset", "Desk Mat", "Storage Bin",
+]
+SPEC_WORDS = ["2m", "100 pack", "Size L", "6 ft", "1080p", "black", "USB 3.0", "10 W"]
+SECTIONS = [
+    "Essential Items", "Safety / PPE", "Optional Upgrades",
+    "Budget-Friendly Alternatives", "Frequently Forgotten Items",
+]
+
+
+def make_task_interpretation(user_input):
+    return {
+        "domain": user_input[:40] or "general",
+        "goals": ["Assemble a working kit"],
+        "assumptions": ["Standard home environment"],
+        "constraints": [],
+        "safety_considerations": [],
+        "regulatory_or_best_practice_notes": [],
+    }
+
+
+def make_kit(item_count, seed=0):
+    """A schema-valid kit with ``item_count`` items spread over five sections."""
+    rng = random.Random(seed)
+    sections = [{"name": name, "items": []} for name in SECTIONS]
+    for i in range(item_count):
+        noun = ITEM_NOUNS[i % len(ITEM_NOUNS)]
+        sections[i % len(SECTIONS)]["items"].append({
+            "item_key": f"{noun.lower().replace(' ', '-')}-{i}",
+            "name": noun if i < len(ITEM_NOUNS) else f"{noun} {i}",
+            "description": f"A {noun.lower()} for the kit.",
+            "sku_type": noun.lower(),
+            "specs_to_search": rng.sample(SPEC_WORDS, 2),
+            "quantity_suggestion": "1",
+            "priority": "essential",
+            "safety_notes": [],
+            "compatibility_notes": [],
+            "query_terms": [noun.lower()],
+            "identifier_hints": {"brand": None, "mpn": None, "model": None, "upc": None},
+        })
+    return {
+        "kit_title": f"Benchmark Kit ({item_count} items)",
+        "summary": "Synthetic kit used for offline benchmarks.",
+        "sections": [section for section in sections if section["items"]],
+    }
+
+
+class FakeGroq:
+    """Recorded-style responder for LocalLLMProvider._call_groq.
+
+    Returns a gate response or a kit depending on which prompt it is given,
+    after ``latency`` seconds. ``responses`` can hold recorded completions
+    keyed by "gate"/"kit" to replay real outputs instead.
+    """
+
+    def __init__(self, item_count=25, latency=0.0, need_clarification=False,
+                 responses=None, chunk_size=64):
+        self.item_count = item_count
+        self.latency = latency
+        self.need_clarification = need_clarification
+        self.responses = responses or {}
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, system_prompt, user_prompt):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(system_prompt, user_prompt)
+
+    def stream(self, system_prompt, user_prompt):
+        """Yield the same completion in chunks, spreading the latency over them."""
+        with self._lock:
+            self.calls += 1
+        text = self._respond(system_prompt, user_prompt)
+        chunks = [
+            text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)
+        ]
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield chunk
+
+    async def complete_async(self, system_prompt, user_prompt):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(system_prompt, user_prompt)
+
+    async def stream_async(self, system_prompt, user_prompt):
+        with self._lock:
+            self.calls += 1
+        text = self._respond(system_prompt, user_prompt)
+        chunks = [
+            text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)
+        ]
+        for chunk in chunks:
+            if self.latency:
+                await asyncio.sleep(self.latency / len(chunks))
+            yield chunk
+
+    def _respond(self, system_prompt, user_prompt):
+        if "purchase kit" in system_prompt:
+            recorded = self.responses.get("kit")
+            return recorded or json.dumps(make_kit(self.item_count))
+        recorded = self.responses.get("gate")
+        if recorded:
+            return recorded
+        if self.need_clarification:
+            return json.dumps({
+                "need_clarification": True,
+                "questions": ["What is your budget?"],
+            })
+        return json.dumps({
+            "need_clarification": False,
+            "task_interpretation": make_task_interpretation(user_prompt),
+        })
+
+    def install(self, llm_service):
+        """Route LocalLLMProvider._call_groq and _stream_groq to this fake."""
+        fake = self
+        llm_service.LocalLLMProvider._call_groq = (
+            lambda self, system_prompt, user_prompt, **kwargs:
+            fake.complete(system_prompt, user_prompt)
+        )
+        llm_service.LocalLLMProvider._stream_groq = (
+            lambda self, system_prompt, user_prompt, **kwargs:
+            fake.stream(system_prompt, user_prompt)
+        )
+
+    def install_async(self, async_pipeline):
+        """Route AsyncLLMProvider._call_groq and _stream_groq to this fake."""
+        fake = self
+
+        async def call_groq(self, system_prompt, user_prompt, **kwargs):
+            return await fake.complete_async(system_prompt, user_prompt)
+
+        async_pipeline.AsyncLLMProvider._call_groq = call_groq
+        async_pipeline.AsyncLLMProvider._stream_groq = (
+            lambda self, system_prompt, user_prompt, **kwargs:
+            fake.stream_async(system_prompt, user_prompt)
+        )
+
+
+# -- Serper --
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+def shopping_results(query, count=8):
+    """Deterministic Serper-shaped shopping results for a query."""
+    rng = random.Random(query)
+    results = []
+    for i in range(count):
+        words = query.split()
+        rng.shuffle(words)
+        title = " ".join(["Brand" + str(rng.randint(1, 9))] + words[:4])
+        results.append({
+            "title": title,
+            "price": f"${rng.randint(5, 300)}.99",
+            "imageUrl": f"https://img.example.com/{abs(hash(title)) % 10 ** 8}.jpg",
+            "link": f"https://shop.example.com/{abs(hash((query, i))) % 10 ** 10}",
+            "source": rng.choice(["Shop A", "Shop B", "Shop C"]),
+        })
+    return results
+
+
+class FakeSerperSession:
+    """Stands in for the pooled requests.Session used by SearchService."""
+
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def post(self, url, headers=None, data=None, timeout=None, **kwargs):
+        failed = self._count()
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(data, failed)
+
+    async def post_async(self, url, headers=None, content=None, **kwargs):
+        failed = self._count()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(content, failed)
+
+    def _count(self):
+        """Count a call; True if it should fail."""
+        with self._lock:
+            self.calls += 1
+            return self._rng.random() < self.error_rate
+
+    def _respond(self, data, failed):
+        if failed:
+            return FakeResponse(500, {"message": "fake upstream error"})
+        payload = json.loads(data)
+        if isinstance(payload, list):
+            return FakeResponse(200, [
+                {"shopping": shopping_results(entry["q"])} for entry in payload
+            ])
+        return FakeResponse(200, {"shopping": shopping_results(payload["q"])})
+
+    def install(self, search_service):
+        """Make SearchService send its requests to this fake."""
+        search_service.get_serper_session = lambda: self
+
+    def install_async(self, async_pipeline):
+        """Make AsyncSearchService send its requests to this fake."""
+        client = SimpleNamespace(post=self.post_async)
+        async_pipeline.get_async_serper_client = lambda: client
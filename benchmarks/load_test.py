@@ -0,0 +1,397 @@
+"""End-to-end load test of the real app against local upstream stand-ins.
+
+Usage:
+    python -m benchmarks.load_test --workers 2 --rps 10 --duration 30
+    python -m benchmarks.load_test --workers 4 --groq-latency 1.5 \\
+        --serper-error-rate 0.05 --mix login=1,generate=2,history=7 --out load.json
+
+Fake Groq and Serper HTTP servers start on localhost, then ``wsgi:app``
+runs under gunicorn (``--workers`` sync workers) in a child process, with
+an in-memory Mongo and Firebase token check, pointed at the fakes through
+GROQ_BASE_URL and SERPER_URL. Other settings (SERPER_MAX_RPS,
+LLM_CACHE_DISABLED, ...) are passed through from the environment.
+
+Requests to /auth/session-login, /api/kit/generate and /api/kit/history
+are sent open-loop at ``--rps`` in the ``--mix`` proportions. Latency is
+counted from each request's scheduled start, so a server that falls
+behind shows up as queueing instead of as a lower request rate.
+
+Each gunicorn worker holds its own copy of the in-memory database, so a
+user's history only lists kits built by the worker that answers.
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from benchmarks.fakes import FakeGroq, InMemoryDB, shopping_results
+
+PROMPTS = [
+    f"{place} {kind}{budget}"
+    for place in ("home office", "camping trip", "baby nursery", "garage workshop",
+                  "dorm room", "home gym")
+    for kind in (" setup", " starter kit", " essentials")
+    for budget in ("", " under $200")
+]
+
+
+# -- Upstream stand-ins --
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    """Local HTTP server with a fixed latency and a random error rate."""
+
+    daemon_threads = True
+
+    def __init__(self, handler, latency=0.0, error_rate=0.0, seed=0):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def should_fail(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.server.should_fail():
+            time.sleep(self.server.latency)
+            self._send(500, {"error": {"message": "fake upstream error"}})
+            return
+        self.respond(body)
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class GroqHandler(_Handler):
+    """OpenAI-style chat completions, streamed as SSE when asked to."""
+
+    fake = FakeGroq(item_count=15)
+
+    def respond(self, body):
+        prompts = {message["role"]: message["content"] for message in body["messages"]}
+        text = self.fake._respond(prompts.get("system", ""), prompts.get("user", ""))
+        usage = {
+            "prompt_tokens": sum(len(p) for p in prompts.values()) // 4,
+            "completion_tokens": len(text) // 4,
+            "total_tokens": (sum(len(p) for p in prompts.values()) + len(text)) // 4,
+        }
+        if not body.get("stream"):
+            time.sleep(self.server.latency)
+            self._send(200, {
+                "id": "chatcmpl-load", "object": "chat.completion",
+                "created": int(time.time()), "model": body.get("model"),
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": text},
+                }],
+                "usage": usage,
+            })
+            return
+
+        pieces = [text[i:i + 64] for i in range(0, len(text), 64)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for piece in pieces:
+            time.sleep(self.server.latency / len(pieces))
+            self._chunk({
+                "id": "chatcmpl-load", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+        # Groq reports usage on the last chunk of a stream
+        self._chunk({
+            "id": "chatcmpl-load", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": body.get("model"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": "req-load", "usage": usage},
+        })
+        self._chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        frame = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+
+
+class SerperHandler(_Handler):
+    """Serper shopping search, single or multi-query."""
+
+    def respond(self, body):
+        time.sleep(self.server.latency)
+        if isinstance(body, list):
+            self._send(200, [{"shopping": shopping_results(entry["q"])} for entry in body])
+        else:
+            self._send(200, {"shopping": shopping_results(body.get("q", ""))})
+
+
+# -- App under test (child process) --
+
+
+def serve(args):
+    """Run wsgi:app under gunicorn with Mongo and Firebase stubbed out."""
+    from firebase_admin import auth as firebase_auth
+    from gunicorn.app.base import BaseApplication
+
+    firebase_auth.verify_id_token = lambda token, *a, **kw: {
+        "uid": token, "email": f"{token}@load.test", "name": token,
+    }
+    from wsgi import app
+    from app.extensions import mongo
+    mongo.db = InMemoryDB()
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"127.0.0.1:{args.port}")
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("timeout", 120)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_app(args, groq, serper):
+    port = _free_port()
+    env = dict(
+        os.environ,
+        GROQ_BASE_URL=groq.url,
+        SERPER_URL=f"{serper.url}/shopping",
+        GROQ_API_KEY=os.getenv("GROQ_API_KEY", "load-test"),
+        SERPER_API_KEY=os.getenv("SERPER_API_KEY", "load-test"),
+        MONGO_URI=os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017/loadtest"),
+    )
+    output = None if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_test", "--serve",
+         "--port", str(port), "--workers", str(args.workers)],
+        env=env, stdout=output, stderr=output,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("app exited during startup (rerun with --server-log)")
+        try:
+            requests.get(f"{base_url}/auth/login", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("app did not start within 60 s")
+
+
+# -- Traffic --
+
+
+def login(base_url, user, timeout):
+    response = requests.post(
+        f"{base_url}/auth/session-login", json={"idToken": user}, timeout=timeout
+    )
+    return response, response.cookies.get_dict()
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(records, wall):
+    rows = {}
+    for kind in sorted({kind for kind, _, _ in records}) + ["all"]:
+        picked = [r for r in records if kind == "all" or r[0] == kind]
+        latencies = sorted(latency for _, latency, _ in picked)
+        errors = sum(1 for _, _, ok in picked if not ok)
+        rows[kind] = {
+            "requests": len(picked),
+            "errors": errors,
+            "per_sec": round((len(picked) - errors) / wall, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        }
+    return rows
+
+
+def drive(base_url, args):
+    """Send the mixed workload; return (kind, latency, ok) per request and wall time."""
+    rng = random.Random(args.seed)
+    users = [f"load-user-{index}" for index in range(args.users)]
+    cookies = {user: login(base_url, user, args.timeout)[1] for user in users}
+
+    mix = dict(
+        (name, float(weight))
+        for name, weight in (part.split("=") for part in args.mix.split(","))
+    )
+    total = int(args.rps * args.duration)
+    plan = [
+        (
+            rng.choices(list(mix), weights=list(mix.values()))[0],
+            rng.choice(users),
+            rng.choice(PROMPTS),
+        )
+        for _ in range(total)
+    ]
+    records = []
+    lock = threading.Lock()
+
+    def one(scheduled, kind, user, prompt):
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            if kind == "login":
+                response, fresh = login(base_url, user, args.timeout)
+                cookies[user] = fresh or cookies[user]
+            elif kind == "generate":
+                response = requests.post(
+                    f"{base_url}/api/kit/generate", json={"style": prompt},
+                    cookies=cookies[user], timeout=args.timeout,
+                )
+            else:
+                response = requests.get(
+                    f"{base_url}/api/kit/history",
+                    cookies=cookies[user], timeout=args.timeout,
+                )
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        with lock:
+            records.append((kind, time.perf_counter() - scheduled, ok))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for index, (kind, user, prompt) in enumerate(plan):
+            pool.submit(one, started + index / args.rps, kind, user, prompt)
+    return records, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn sync workers")
+    parser.add_argument("--rps", type=float, default=10.0, help="target request rate")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic")
+    parser.add_argument("--mix", default="login=1,generate=2,history=7",
+                        help="relative weights of login, generate and history")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=256,
+                        help="client threads (requests in flight at most)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--groq-latency", type=float, default=1.0)
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--serper-latency", type=float, default=0.3)
+    parser.add_argument("--serper-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the report JSON here")
+    parser.add_argument("--server-log", action="store_true",
+                        help="show the app's output")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args)
+        return
+
+    groq = FakeUpstream(
+        GroqHandler, args.groq_latency, args.groq_error_rate, args.seed
+    ).start()
+    serper = FakeUpstream(
+        SerperHandler, args.serper_latency, args.serper_error_rate, args.seed
+    ).start()
+    process, base_url = start_app(args, groq, serper)
+    try:
+        records, wall = drive(base_url, args)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        groq.shutdown()
+        serper.shutdown()
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("workers", "rps", "duration", "mix", "users",
+                        "groq_latency", "groq_error_rate",
+                        "serper_latency", "serper_error_rate")
+        },
+        "wall_s": round(wall, 2),
+        "endpoints": summarize(records, wall),
+        "upstream": {
+            "groq": {"calls": groq.calls, "errors": groq.errors},
+            "serper": {"calls": serper.calls, "errors": serper.errors},
+        },
+    }
+
+    print(f"{'endpoint':<10}{'reqs':>7}{'errors':>8}{'ok/s':>8}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, row in report["endpoints"].items():
+        print(
+            f"{kind:<10}{row['requests']:>7}{row['errors']:>8}{row['per_sec']:>8}"
+            f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        )
+    upstream = report["upstream"]
+    print(
+        f"wall {report['wall_s']} s; groq {upstream['groq']['calls']} calls "
+        f"({upstream['groq']['errors']} failed), serper {upstream['serper']['calls']} "
+        f"calls ({upstream['serper']['errors']} failed)"
+    )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark the batch matcher against per-pair difflib scoring.
+
+Usage:
+    python -m benchmarks.match_bench --items 25 --candidates 8 --rounds 20
+
+Each kit item is ranked against its own candidate list (as in the
+pipeline) and against one shared pool. Results are checked to be
+identical to the reference implementation before timings are printed.
+"""
+
+import argparse
+import json
+import random
+import time
+
+from app.services.match_service import (
+    calculate_confidence,
+    rank_candidates,
+    rank_candidates_batch,
+)
+
+NOUNS = [
+    "Safety Goggles", "Nitrile Gloves", "USB-C Cable", "Extension Cord",
+    "LED Desk Lamp", "Laptop Stand", "Ergonomic Chair", "Surge Protector",
+    "First Aid Kit", "Fire Extinguisher", "Cable Ties", "Label Maker",
+    "Webcam", "Wireless Mouse", "Mechanical Keyboard", "Monitor Arm",
+]
+SPECS = ["2m", "100 pack", "Size L", "ANSI Z87.1", "6 ft", "1080p", "black", "USB 3.0"]
+NOISE = ["Pro", "2024", "Heavy Duty", "Amazon Basics", "Premium", "Value Pack"]
+
+
+def reference_rank(kit_item, search_items):
+    """The original per-pair implementation of rank_candidates."""
+    ranked = []
+    for search_item in search_items:
+        confidence, reason = calculate_confidence(kit_item, search_item)
+        if confidence > 0:
+            ranked.append({
+                "search_item": search_item,
+                "confidence": confidence,
+                "reason": reason,
+                "source": search_item.get("source", "unknown"),
+                "url": search_item.get("url", ""),
+            })
+    ranked.sort(key=lambda x: x["confidence"], reverse=True)
+    return ranked
+
+
+def make_item(rng):
+    return {
+        "name": rng.choice(NOUNS),
+        "specs_to_search": rng.sample(SPECS, 2),
+    }
+
+
+def make_candidates(rng, item, count):
+    results = []
+    for i in range(count):
+        base = item["name"] if rng.random() < 0.6 else rng.choice(NOUNS)
+        words = [rng.choice(NOISE), base] + rng.sample(SPECS, rng.randint(0, 2))
+        results.append({
+            "title": " ".join(words),
+            "price": f"${rng.randint(5, 200)}.99",
+            "url": f"https://example.com/{i}",
+            "source": "bench",
+        })
+    return results
+
+
+def timed(fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=25)
+    parser.add_argument("--candidates", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    items = [make_item(rng) for _ in range(args.items)]
+    per_item = [make_candidates(rng, item, args.candidates) for item in items]
+    pool = [result for results in per_item for result in results]
+
+    # Same tiers, reasons and order as the reference, or the numbers are moot
+    for item, results in zip(items, per_item):
+        assert rank_candidates(item, results) == reference_rank(item, results)
+    assert rank_candidates_batch(items, pool) == [
+        reference_rank(item, pool) for item in items
+    ]
+
+    report = {
+        "items": args.items,
+        "candidates_per_item": args.candidates,
+        "per_item_ms": {
+            "reference": timed(
+                lambda: [reference_rank(i, r) for i, r in zip(items, per_item)],
+                args.rounds,
+            ) * 1000,
+            "batch": timed(
+                lambda: [rank_candidates(i, r) for i, r in zip(items, per_item)],
+                args.rounds,
+            ) * 1000,
+        },
+        "shared_pool_ms": {
+            "reference": timed(
+                lambda: [reference_rank(i, pool) for i in items], args.rounds
+            ) * 1000,
+            "batch": timed(
+                lambda: rank_candidates_batch(items, pool), args.rounds
+            ) * 1000,
+        },
+    }
+    for section in ("per_item_ms", "shared_pool_ms"):
+        timings = report[section]
+        timings["speedup"] = timings["reference"] / timings["batch"]
+        for key in ("reference", "batch", "speedup"):
+            timings[key] = round(timings[key], 3)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""Offline, stage-level benchmark of the kit pipeline.
+
+Usage:
+    python -m benchmarks.pipeline_bench --out bench.json
+    python -m benchmarks.pipeline_bench --sizes 5,25 --compare bench.json
+
+Groq, Serper and Mongo are replaced by the stand-ins in benchmarks.fakes,
+so no network or API keys are needed. Upstream latency is zero by
+default and the Serper rate budget is lifted, which isolates our own CPU
+cost; pass --llm-latency, --serper-latency (seconds) and --serper-rps to
+model real wall-clock behaviour.
+
+Results are JSON keyed by "<stage>@<items>". --compare reports the change
+against a previous run and exits non-zero if any stage regressed by more
+than --threshold.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from benchmarks.fakes import FakeGroq, FakeSerperSession, InMemoryDB
+
+from app.extensions import mongo
+from app.services import llm_service, orchestrator, search_service
+from app.services.kit_service import generate_kit
+from app.services.match_service import rank_candidates
+from app.services.planner_service import gate_clarification
+from app.services.query_service import build_query_for_item
+from normalization import normalize_string
+
+USER_INPUT = "$300 home office setup for two people"
+
+
+def summarize(durations, units):
+    """Latency percentiles (ms) and throughput (units per second)."""
+    ordered = sorted(durations)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    mean = statistics.fmean(ordered)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[p95_index] * 1000, 3),
+        "mean_ms": round(mean * 1000, 3),
+        "units": units,
+        "units_per_sec": round(units / mean, 1) if mean else None,
+    }
+
+
+def measure(fn, rounds, setup=None):
+    durations = []
+    for _ in range(rounds):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def reset_state():
+    """Fresh caches and database so every round starts cold."""
+    mongo.db = InMemoryDB()
+    search_service.memory_cache.clear()
+    search_service.ensure_cache_indexes.done.clear()
+    llm_service.response_cache.clear()
+
+
+def bench_size(size, rounds, args):
+    groq = FakeGroq(item_count=size, latency=args.llm_latency)
+    groq.install(llm_service)
+    serper = FakeSerperSession(latency=args.serper_latency)
+    serper.install(search_service)
+    reset_state()
+
+    kit = generate_kit(USER_INPUT)
+    items = [item for section in kit["sections"] for item in section["items"]]
+    queries = [build_query_for_item(item)["clean_query"] for item in items]
+    results = {}
+
+    results["gate"] = summarize(
+        measure(lambda: gate_clarification(USER_INPUT), rounds), 1
+    )
+    results["kit_generation"] = summarize(
+        measure(lambda: generate_kit(USER_INPUT), rounds), 1
+    )
+    results["query_building"] = summarize(
+        measure(lambda: [build_query_for_item(item) for item in items], rounds),
+        len(items),
+    )
+
+    def search_all():
+        searcher = search_service.SearchService(mongo_db=mongo.db)
+        return searcher.search_many(queries)
+
+    results["search_cold"] = summarize(
+        measure(search_all, rounds, setup=reset_state), len(items)
+    )
+    reset_state()
+    candidates = search_all()
+    results["search_warm"] = summarize(measure(search_all, rounds), len(items))
+
+    results["matching"] = summarize(
+        measure(
+            lambda: [rank_candidates(i, c) for i, c in zip(items, candidates)],
+            rounds,
+        ),
+        len(items),
+    )
+    titles = [result["title"] for batch in candidates for result in batch]
+    results["normalization"] = summarize(
+        measure(lambda: [normalize_string(title) for title in titles], rounds),
+        len(titles),
+    )
+    results["pipeline"] = summarize(
+        measure(
+            lambda: orchestrator.run_lab_pipeline(USER_INPUT), rounds,
+            setup=reset_state,
+        ),
+        len(items),
+    )
+    return {f"{stage}@{size}": stats for stage, stats in results.items()}
+
+
+def compare(current, baseline, threshold):
+    """Print per-stage p50 changes; return the stages that regressed."""
+    regressions = []
+    print(f"\n{'stage':<28}{'base p50':>12}{'now p50':>12}{'change':>10}")
+    for key, stats in current["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base or not base["p50_ms"]:
+            print(f"{key:<28}{'-':>12}{stats['p50_ms']:>12}{'new':>10}")
+            continue
+        change = stats["p50_ms"] / base["p50_ms"] - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(
+            f"{key:<28}{base['p50_ms']:>12}{stats['p50_ms']:>12}"
+            f"{change:>+10.1%}{flag}"
+        )
+        if flag:
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="5,15,25,40",
+                        help="comma-separated kit sizes (items per kit)")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    parser.add_argument("--serper-latency", type=float, default=0.0)
+    parser.add_argument("--serper-rps", type=float, default=0.0,
+                        help="Serper rate budget (0 = unlimited)")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="p50 slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+
+    # Measure the pipeline itself, not the LLM response cache
+    llm_service.LLM_CACHE_DISABLED = True
+    search_service.serper_budget = search_service.RateBudget(
+        args.serper_rps or 1e9, burst=None if args.serper_rps else 1e9
+    )
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "rounds": args.rounds,
+            "llm_latency": args.llm_latency,
+            "serper_latency": args.serper_latency,
+            "serper_rps": args.serper_rps,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        report["results"].update(bench_size(size, args.rounds, args))
+
+    print(f"{'stage':<28}{'p50 ms':>10}{'p95 ms':>10}{'units/s':>12}")
+    for key, stats in report["results"].items():
+        print(
+            f"{key:<28}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+            f"{stats['units_per_sec']:>12}"
+        )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        if compare(report, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Replay a search query log and compare exact-string vs canonical cache keys.
+
+Usage:
+    python -m benchmarks.replay_query_log queries.txt
+    python -m benchmarks.replay_query_log queries.jsonl --show-groups
+
+Input is one query per line, or JSON lines with a "query" or
+"search_text" field. Reads stdin when no file is given.
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+from app.services.query_service import canonical_query_key, compare_cache_keys
+
+
+def read_queries(stream):
+    """Yield queries from plain-text or JSON-lines input."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            record = json.loads(line)
+            line = record.get("search_text") or record.get("query") or ""
+        if line:
+            yield line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", nargs="?", help="query log (default: stdin)")
+    parser.add_argument(
+        "--show-groups", action="store_true",
+        help="print raw queries that collapse onto the same canonical key",
+    )
+    args = parser.parse_args(argv)
+
+    if args.log:
+        with open(args.log, encoding="utf-8") as handle:
+            queries = list(read_queries(handle))
+    else:
+        queries = list(read_queries(sys.stdin))
+
+    report = compare_cache_keys(queries)
+    print(json.dumps(report, indent=2))
+
+    if args.show_groups:
+        groups = defaultdict(set)
+        for query in queries:
+            groups[canonical_query_key(query)].add(query)
+        for key, members in sorted(groups.items()):
+            if len(members) > 1:
+                print(f"\n{key}")
+                for member in sorted(members):
+                    print(f"  {member}")
+
+
+if __name__ == "__main__":
+    main()
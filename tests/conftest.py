@@ -0,0 +1,37 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/kartwise_test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+
+@pytest.fixture()
+def kit_app(monkeypatch):
+    """A logged-in Flask test client on in-memory Mongo, Groq and Serper."""
+    from app import create_app
+    from app.extensions import mongo
+    from app.routes import auth
+    from app.services import llm_service, resilience, search_service
+    from benchmarks.fakes import FakeGroq, FakeSerperSession, InMemoryDB
+
+    app = create_app()
+    db = InMemoryDB()
+    monkeypatch.setattr(mongo, "db", db)
+    monkeypatch.setattr(
+        auth.firebase_auth, "verify_id_token",
+        lambda token: {"uid": f"uid-{token}", "email": f"{token}@example.com", "name": token},
+    )
+    # A fresh breaker, so one test's failures never open it for the next
+    monkeypatch.setattr(resilience, "serper", resilience.Upstream(
+        "serper", resilience.SERPER_TIMEOUT_MIN, resilience.SERPER_TIMEOUT
+    ))
+    groq = FakeGroq(item_count=4)
+    groq.install(llm_service)
+    serper = FakeSerperSession()
+    serper.install(search_service)
+
+    client = app.test_client()
+    assert client.post("/auth/session-login", json={"idToken": "alice"}).status_code == 200
+    return SimpleNamespace(app=app, client=client, db=db, groq=groq, serper=serper)
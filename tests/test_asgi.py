@@ -0,0 +1,73 @@
+"""Smoke test: asgi.py under uvicorn, with Mongo, Groq and Serper faked."""
+
+import os
+import threading
+import time
+
+import pytest
+
+uvicorn = pytest.importorskip("uvicorn")
+httpx = pytest.importorskip("httpx")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/kartwise_test")
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+import asgi  # noqa: E402
+from app.extensions import mongo  # noqa: E402
+from app.routes import auth, kit_async  # noqa: E402
+from app.services import async_pipeline  # noqa: E402
+from benchmarks.fakes import (  # noqa: E402
+    AsyncInMemoryDB,
+    FakeGroq,
+    FakeSerperSession,
+    InMemoryDB,
+)
+
+
+@pytest.fixture()
+def server(monkeypatch):
+    db = InMemoryDB()
+    monkeypatch.setattr(mongo, "db", db)
+    monkeypatch.setattr(kit_async, "get_async_db", lambda: AsyncInMemoryDB(db))
+    monkeypatch.setattr(
+        auth.firebase_auth, "verify_id_token",
+        lambda token: {"uid": f"uid-{token}", "email": f"{token}@example.com", "name": token},
+    )
+    FakeGroq(item_count=5).install_async(async_pipeline)
+    FakeSerperSession().install_async(async_pipeline)
+
+    config = uvicorn.Config(asgi.app, host="127.0.0.1", port=0, lifespan="on", log_level="warning")
+    uv = uvicorn.Server(config)
+    thread = threading.Thread(target=uv.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not uv.started and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert uv.started
+    port = uv.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}", db
+    uv.should_exit = True
+    thread.join(timeout=10)
+
+
+def test_async_kit_route_and_forwarded_flask_routes(server):
+    base_url, db = server
+    with httpx.Client(base_url=base_url, timeout=30) as client:
+        # Forwarded to Flask through WsgiToAsgi
+        assert client.get("/auth/login").status_code == 200
+        assert client.post("/api/kit/generate", json={"style": "desk"}).status_code == 401
+
+        login = client.post("/auth/session-login", json={"idToken": "alice"})
+        assert login.status_code == 200
+
+        assert client.get("/api/kit/history").status_code == 200
+        response = client.post("/api/kit/generate", json={"style": "$200 desk setup"})
+        assert response.status_code == 200
+        kit = response.json()
+        assert kit["type"] == "final_kit"
+        assert kit["kit_id"]
+        assert any(item.get("buy_url") for section in kit["sections"] for item in section["items"])
+
+        # Keep-alive requests after the async route still reach Flask
+        for _ in range(10):
+            assert client.get("/api/kit/history").status_code == 200
+        assert db.kits.count_documents({}) == 1
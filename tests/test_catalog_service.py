@@ -0,0 +1,17 @@
+from app.services.catalog_service import CATALOG_FALLBACK_CONFIDENCE, ProductCatalog
+
+ITEM = {"name": "USB-C Cable", "specs_to_search": ["6ft", "100W"]}
+SHORT = {"title": "Anker USB-C Cable 1ft", "url": "https://shop.example.com/short"}
+LONG = {"title": "Anker USB-C Cable 6ft Braided", "url": "https://shop.example.com/long"}
+
+
+def test_keyword_match_without_a_spec_is_not_picked():
+    assert ProductCatalog.pick(ITEM, [SHORT]) is None
+
+
+def test_keyword_match_showing_a_spec_is_picked():
+    assert ProductCatalog.pick(ITEM, [SHORT, LONG]) == LONG
+
+
+def test_fallback_bar_takes_the_best_match():
+    assert ProductCatalog.pick(ITEM, [SHORT], CATALOG_FALLBACK_CONFIDENCE) == SHORT
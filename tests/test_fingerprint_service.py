@@ -0,0 +1,43 @@
+from app.services.fingerprint_service import FingerprintIndex, fingerprint_keys, valid_upc
+
+PRODUCT = {
+    "title": "Anker PowerLine III USB-C Cable A8852 6ft",
+    "price": "$12.99",
+    "url": "https://shop.example.com/p/036000291452",
+    "img_url": None,
+    "source": "Shop A",
+}
+
+
+def test_real_identifiers_become_keys():
+    keys = fingerprint_keys({
+        "upc": "036000291452", "mpn": "A8852", "brand": "Anker", "model": "PowerLine III",
+    })
+    assert keys == ["upc:036000291452", "mpn:a8852", "model:anker|powerlineiii"]
+
+
+def test_placeholders_are_not_keys():
+    assert fingerprint_keys({"upc": "000000000000", "mpn": "none", "model": "generic"}) == []
+    assert fingerprint_keys({"upc": "036000291453", "mpn": "N/A", "model": "XXXX"}) == []
+
+
+def test_model_needs_a_brand():
+    assert fingerprint_keys({"model": "PowerLine III"}) == []
+    assert fingerprint_keys({"brand": "HP", "model": "LaserJet M110w"}) == ["model:hp|laserjetm110w"]
+
+
+def test_upc_check_digit():
+    assert valid_upc("036000291452")
+    assert valid_upc("4006381333931")
+    assert not valid_upc("036000291453")
+    assert not valid_upc("11111111")
+
+
+def test_only_identifiers_shown_by_the_product_are_recorded():
+    keys = fingerprint_keys({
+        "upc": "036000291452", "mpn": "B0001", "brand": "Anker", "model": "PowerLine III",
+    })
+    ops = FingerprintIndex.record_ops([(keys, PRODUCT, 0.95)])
+    assert sorted(op._filter["_id"] for op in ops) == [
+        "model:anker|powerlineiii", "upc:036000291452",
+    ]
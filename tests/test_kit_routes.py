@@ -0,0 +1,82 @@
+from bson import ObjectId
+
+
+def _items(kit):
+    return [item for section in kit["sections"] for item in section["items"]]
+
+
+def test_refresh_keeps_products_when_search_fails(kit_app):
+    client, db = kit_app.client, kit_app.db
+    kit = client.post("/api/kit/generate", json={"style": "$80 desk setup"}).get_json()
+    before = [item.get("buy_url") for item in _items(kit)]
+    assert any(before)
+
+    kit_app.serper.error_rate = 1.0
+    response = client.post(f"/api/kit/{kit['kit_id']}/refresh")
+    assert response.status_code == 503
+
+    stored = db.kits.find_one({"_id": ObjectId(kit["kit_id"])})
+    assert [item.get("buy_url") for item in _items(stored["kit"])] == before
+    assert stored.get("prices_refreshed_at") is None
+
+
+def test_refresh_updates_products(kit_app):
+    client = kit_app.client
+    kit = client.post("/api/kit/generate", json={"style": "$80 desk setup"}).get_json()
+    calls = kit_app.serper.calls
+
+    response = client.post(f"/api/kit/{kit['kit_id']}/refresh")
+    assert response.status_code == 200
+    assert response.get_json()["prices_refreshed_at"]
+    assert kit_app.serper.calls > calls
+
+
+def test_generate_clips_history_to_prompt_budget(kit_app, monkeypatch):
+    from app.services import kit_service, token_budget
+
+    prompts = []
+    kit_prompts = kit_service.kit_prompts
+
+    def record(task, clarifications, user_preferences):
+        prompts.append(clarifications)
+        return kit_prompts(task, clarifications, user_preferences)
+
+    monkeypatch.setattr(kit_service, "kit_prompts", record)
+    history = [
+        {"role": "user" if index % 2 else "assistant", "content": f"message {index} " + "word " * 300}
+        for index in range(20)
+    ]
+    history[-1]["content"] = "newest: under $100"
+
+    response = kit_app.client.post(
+        "/api/kit/generate", json={"style": "desk setup", "history": history}
+    )
+    assert response.status_code == 200
+
+    clarifications = prompts[0]
+    assert "newest: under $100" in clarifications
+    assert "message 0 " not in clarifications
+    assert "earlier messages omitted" in clarifications
+    assert token_budget.estimate_tokens(clarifications) <= token_budget.PROMPT_HISTORY_TOKENS + 10
+
+
+def test_stream_trace_covers_the_generator(kit_app, monkeypatch):
+    from app.services import metrics
+
+    traces = []
+    finish_trace = metrics.finish_trace
+
+    def record():
+        spans = finish_trace()
+        traces.append(spans)
+        return spans
+
+    monkeypatch.setattr(metrics, "finish_trace", record)
+    response = kit_app.client.post("/api/kit/generate/stream", json={"style": "$80 desk setup"})
+    assert traces == []
+
+    body = response.get_data(as_text=True)
+    assert "event: final_kit" in body
+    assert len(traces) == 1
+    stages = {span["stage"] for span in traces[0]}
+    assert {"generate_kit", "mongo.kits.insert_one"} <= stages
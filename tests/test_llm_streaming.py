@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import uuid
+
+from app.services import async_pipeline, llm_service
+from app.services.kit_service import item_schema, kit_prompts, stream_kit
+from app.services.registry import registry
+from app.services.stream_parser import KitItemParser
+from benchmarks.fakes import FakeGroq
+
+
+def _kit(events):
+    return [event for event in events if event[0] == "done"][0][1]
+
+
+def test_identical_kit_streams_share_one_completion():
+    groq = FakeGroq(item_count=3, latency=0.3)
+    groq.install(llm_service)
+    task = f"desk setup {uuid.uuid4()}"
+    kits = []
+
+    def run():
+        kits.append(_kit(list(stream_kit(task))))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert groq.calls == 1
+    assert len(kits) == 3 and kits[0] == kits[1] == kits[2]
+    assert kits[0] is not kits[1]
+
+
+def test_identical_async_kit_streams_share_one_completion():
+    groq = FakeGroq(item_count=3, latency=0.3)
+    groq.install_async(async_pipeline)
+    llm = async_pipeline.AsyncLLMProvider(stage="kit")
+    system_prompt, user_prompt = kit_prompts(f"desk setup {uuid.uuid4()}", None, None)
+    kit_schema = registry.schema("kit")
+
+    async def run():
+        parser = KitItemParser(registry.validator_for(item_schema(kit_schema)))
+        events = [
+            event async for event in
+            llm.stream_response(system_prompt, user_prompt, kit_schema, parser)
+        ]
+        return _kit(events)
+
+    async def main():
+        return await asyncio.gather(*(run() for _ in range(3)))
+
+    kits = asyncio.run(main())
+    assert groq.calls == 1
+    assert kits[0] == kits[1] == kits[2]
@@ -0,0 +1,43 @@
+import copy
+
+from benchmarks.fakes import make_kit
+
+from app.services import schema_repair
+from app.services.registry import registry
+
+UNIT = ("sections", 0, "items", 1)
+MISSING = ["name", "description", "sku_type", "quantity_suggestion"]
+
+
+def broken_kit():
+    kit = make_kit(6)
+    for key in MISSING:
+        del kit["sections"][0]["items"][1][key]
+    return kit
+
+
+def test_several_missing_keys_give_one_message_each():
+    validator = registry.validator_for(registry.schema("kit"))
+    kit = broken_kit()
+    errors = schema_repair.fix_locally(kit, validator)
+    parts = schema_repair.failing_parts(kit, validator.schema, errors)
+
+    assert list(parts) == [UNIT]
+    messages = parts[UNIT][2]
+    assert len(messages) == len(MISSING)
+    for key in MISSING:
+        assert f"/{key}: '{key}' is a required property" in messages
+
+
+def test_placeholder_fix_counts_each_key_once():
+    validator = registry.validator_for(registry.schema("kit"))
+    kit = make_kit(6)
+    item = kit["sections"][0]["items"][0]
+    for key in ("safety_notes", "compatibility_notes", "query_terms"):
+        del item[key]
+    expected = copy.deepcopy(item)
+    for key in ("safety_notes", "compatibility_notes", "query_terms"):
+        expected[key] = []
+
+    assert schema_repair.fix_locally(kit, validator) == []
+    assert kit["sections"][0]["items"][0] == expected
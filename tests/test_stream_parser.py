@@ -0,0 +1,41 @@
+import json
+
+from app.services.stream_parser import KitItemParser, StreamingJSONScanner
+
+KIT = {
+    "kit_title": "Desk",
+    "sections": [
+        {"name": "Essential Items", "items": [{"item_key": "lamp"}, {"item_key": "chair"}]},
+        {"name": "Safety / PPE", "items": [{"item_key": "strip"}]},
+    ],
+}
+
+
+def feed_in_chunks(parser, text, size=7):
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return events
+
+
+def test_items_stream_as_they_close():
+    parser = KitItemParser()
+    events = feed_in_chunks(parser, json.dumps(KIT))
+    assert [(e[1], e[2], e[3]["item_key"]) for e in events] == [
+        (0, 0, "lamp"), (0, 1, "chair"), (1, 0, "strip"),
+    ]
+    assert json.loads(parser.document()) == KIT
+
+
+def test_prose_with_braces_before_the_document():
+    text = "Sure! Fill in {not json} and {the [fields]} below:\n" + json.dumps(KIT) + "\nDone."
+    parser = KitItemParser()
+    events = feed_in_chunks(parser, text)
+    assert len(events) == 3
+    assert json.loads(parser.document()) == KIT
+
+
+def test_unfinished_document_is_returned_as_is():
+    scanner = StreamingJSONScanner(("items", "*"))
+    scanner.feed('note {x} then {"items": [{"a": 1}')
+    assert scanner.document() == '{"items": [{"a": 1}'